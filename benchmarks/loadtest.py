@@ -0,0 +1,238 @@
+# benchmarks/loadtest.py
+"""
+Load test for the upstream-bound endpoints. Drives a running server at set
+concurrency levels and reports latency percentiles, throughput, upstream
+calls and cache hit rate per scenario. Results are saved as JSON under
+benchmarks/results/, and each run is compared with the previous one (or
+with --compare FILE).
+
+Run the API against the stub upstream (see stub_upstream.py) so that no
+quota is spent, with this project's settings so the counters are shared:
+
+    python benchmarks/stub_upstream.py serve --latency 150 --jitter 50 &
+    STORMGLASS_BASE_URL=http://127.0.0.1:8900/v2 STORMGLASS_DAILY_QUOTA=0 python manage.py runserver --noreload &
+    python benchmarks/loadtest.py --concurrency 1 8 32 --duration 15
+
+Each scenario starts from an empty shared cache unless --warm is given.
+The hit rate comes from the shared cache counters (weather.metrics), which
+workers flush at most once per metrics.FLUSH_INTERVAL, so the last second
+of a run may be missing from it.
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS = os.path.join(ROOT, 'benchmarks', 'results')
+sys.path.insert(0, ROOT)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'weather_api.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.cache import cache  # noqa: E402
+
+from weather import metrics  # noqa: E402
+from weather.countries import SELECTED_COUNTRIES  # noqa: E402
+from weather.nigerian_states import NIGERIA_STATES  # noqa: E402
+
+COUNTERS = ('weather_cache_hit', 'weather_cache_stale', 'weather_cache_miss')
+
+
+def _with_crops_paths():
+    return [f"/api/weather/with-crops/{quote(continent)}/{quote(name)}/"
+            for continent, names in SELECTED_COUNTRIES.items() for name in names]
+
+
+def _state_paths():
+    return [f"/api/locations/nigeria/{quote(name)}/" for name in NIGERIA_STATES]
+
+
+SCENARIOS = {
+    'all': lambda: ['/api/weather/all/'],
+    'with-crops': _with_crops_paths,
+    'state': _state_paths,
+}
+
+
+def percentile(ordered, p):
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))]
+
+
+class Upstream:
+    """Call counts from the stub upstream, if it is reachable."""
+
+    def __init__(self, url):
+        self.url = url.rstrip('/') + '/__stub__/stats' if url else None
+
+    def calls(self):
+        if not self.url:
+            return None
+        try:
+            return requests.get(self.url, timeout=2).json()['total']
+        except (requests.RequestException, ValueError, KeyError):
+            return None
+
+
+def run_level(base_url, paths, concurrency, duration):
+    """Hammer `paths` (picked at random) from `concurrency` threads for `duration` seconds."""
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        session = requests.Session()
+        mine, codes = [], {}
+        while time.monotonic() < deadline:
+            path = random.choice(paths)
+            started = time.perf_counter()
+            try:
+                code = session.get(base_url + path, timeout=60).status_code
+            except requests.RequestException:
+                code = 'error'
+            mine.append((time.perf_counter() - started) * 1000)
+            codes[code] = codes.get(code, 0) + 1
+        with lock:
+            latencies.extend(mine)
+            for code, n in codes.items():
+                statuses[str(code)] = statuses.get(str(code), 0) + n
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.monotonic() - started
+
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+        'p99_ms': round(percentile(latencies, 99), 1) if latencies else None,
+        'statuses': statuses,
+    }
+
+
+def run(args):
+    upstream = Upstream(args.upstream)
+    results = []
+    for name in args.scenarios:
+        paths = SCENARIOS[name]()
+        for concurrency in args.concurrency:
+            if not args.warm:
+                cache.clear()
+            before_calls = upstream.calls()
+            before = metrics.get_many(COUNTERS)
+
+            result = run_level(args.base_url, paths, concurrency, args.duration)
+
+            time.sleep(metrics.FLUSH_INTERVAL)
+            after = metrics.get_many(COUNTERS)
+            after_calls = upstream.calls()
+            hits = after['weather_cache_hit'] - before['weather_cache_hit']
+            stale = after['weather_cache_stale'] - before['weather_cache_stale']
+            lookups = hits + stale + after['weather_cache_miss'] - before['weather_cache_miss']
+            result.update(
+                scenario=name,
+                upstream_calls=None if before_calls is None or after_calls is None else after_calls - before_calls,
+                cache_hit_rate=round((hits + stale) / lookups, 3) if lookups else None,
+            )
+            results.append(result)
+            print(format_row(result))
+    return results
+
+
+HEADER = (f"{'scenario':<11}{'conc':>5}{'reqs':>7}{'rps':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'upstream':>9}{'hit rate':>9}  statuses")
+
+
+def _fmt(value, spec, width=9):
+    return format(value, spec) if value is not None else '-'.rjust(width)
+
+
+def format_row(r):
+    return (f"{r['scenario']:<11}{r['concurrency']:>5}{r['requests']:>7}{r['throughput_rps']:>8.1f}"
+            f"{_fmt(r['p50_ms'], '>9.1f')}{_fmt(r['p95_ms'], '>9.1f')}{_fmt(r['p99_ms'], '>9.1f')}"
+            f"{_fmt(r['upstream_calls'], '>9')}{_fmt(r['cache_hit_rate'], '>9.1%')}  {r['statuses']}")
+
+
+def compare(results, previous, threshold):
+    """Per scenario and level: change in p95 and throughput against an earlier run."""
+    earlier = {(r['scenario'], r['concurrency']): r for r in previous['results']}
+    print(f"\nCompared with {previous['started_at']} ({previous.get('label') or 'unlabelled'}):")
+    matched = False
+    for r in results:
+        old = earlier.get((r['scenario'], r['concurrency']))
+        if not old or not old['p95_ms'] or not old['throughput_rps'] or r['p95_ms'] is None:
+            continue
+        matched = True
+        p95 = (r['p95_ms'] - old['p95_ms']) / old['p95_ms']
+        rps = (r['throughput_rps'] - old['throughput_rps']) / old['throughput_rps']
+        flag = '  <- regression' if p95 > threshold or rps < -threshold else ''
+        print(f"  {r['scenario']:<11}x{r['concurrency']:<4} p95 {p95:+.0%}  throughput {rps:+.0%}{flag}")
+    if not matched:
+        print("  no scenario/concurrency pairs in common")
+
+
+def latest_result():
+    files = sorted(glob.glob(os.path.join(RESULTS, '*.json')))
+    return files[-1] if files else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--upstream', default='http://127.0.0.1:8900', help="stub upstream ('' to skip call counts)")
+    parser.add_argument('--scenarios', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 8, 32])
+    parser.add_argument('--duration', type=float, default=10, help='seconds per scenario and level')
+    parser.add_argument('--warm', action='store_true', help="don't clear the weather cache between runs")
+    parser.add_argument('--label', default='', help='stored with the results, e.g. a branch or commit')
+    parser.add_argument('--compare', help='results file to compare with (default: the latest one)')
+    parser.add_argument('--threshold', type=float, default=0.1, help='relative change flagged as a regression')
+    args = parser.parse_args()
+
+    previous = args.compare or latest_result()
+    started_at = datetime.now(timezone.utc)
+    print(HEADER)
+    results = run(args)
+
+    os.makedirs(RESULTS, exist_ok=True)
+    path = os.path.join(RESULTS, started_at.strftime('%Y%m%dT%H%M%SZ') + '.json')
+    record = {
+        'started_at': started_at.isoformat(),
+        'label': args.label,
+        'base_url': args.base_url,
+        'duration': args.duration,
+        'warm': args.warm,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(record, f, indent=2)
+    print(f"\nSaved {path}")
+
+    if previous:
+        with open(previous) as f:
+            compare(results, json.load(f), args.threshold)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+# benchmarks/render.py
+"""
+Serialization cost of the hot endpoints: DRF serializers + JSONRenderer
+against weather.fastjson (compiled serializers + orjson, and a cached body).
+Uses a synthetic cache entry, so no upstream calls are made.
+
+    python benchmarks/render.py [iterations]
+"""
+import json
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'weather_api.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from weather import fastjson, forecast  # noqa: E402
+from weather.countries import SELECTED_COUNTRIES  # noqa: E402
+from weather.crop_engine import score_all  # noqa: E402
+from weather.crop_rules import generate_alerts  # noqa: E402
+from weather.serializers import WeatherSerializer, WeatherWithCropsSerializer  # noqa: E402
+from weather.services import conditions_from_entry, entry_outlook, make_entry  # noqa: E402
+from weather.views import render_weather, render_weather_with_crops  # noqa: E402
+
+
+def synthetic_series(hours=170):
+    start = int(time.time()) // 3600 * 3600
+    return {
+        'time': [start + 3600 * i for i in range(hours)],
+        'airTemperature': [22.0 + i % 10 for i in range(hours)],
+        'humidity': [60.0 + i % 20 for i in range(hours)],
+        'precipitation': [0.1 * (i % 5) for i in range(hours)],
+        'windSpeed': [3.0] * hours,
+        'soilMoisture': [0.3] * hours,
+        'soilTemperature': [25.0] * hours,
+        'uvIndex': [5.0] * hours,
+    }
+
+
+def payloads():
+    entry = make_entry(synthetic_series())
+    weather = conditions_from_entry(entry, False, 0)
+    outlook = entry_outlook(entry)
+    crops = sorted(score_all(weather, outlook=outlook), key=lambda x: x['score'], reverse=True)[:5]
+    location = {"continent": "Africa", "country": "Nigeria Lagos", "lat": 6.5244, "lon": 3.3792}
+    with_crops = {"location": location, "weather": weather, "outlook": outlook,
+                  "recommended_crops": crops, "alerts": generate_alerts(weather)}
+    everywhere = {continent: {name: weather for name in names} for continent, names in SELECTED_COUNTRIES.items()}
+    return weather, with_crops, everywhere
+
+
+def main(number):
+    weather, with_crops, everywhere = payloads()
+    renderer = JSONRenderer()
+    # DRF rendering, and the document a fastjson view builds (then dumps)
+    cases = {
+        'weather': (lambda: renderer.render(WeatherSerializer(weather).data),
+                    lambda: render_weather(weather)),
+        'with-crops': (lambda: renderer.render(WeatherWithCropsSerializer(with_crops).data),
+                       lambda: render_weather_with_crops(with_crops)),
+        'all': (lambda: renderer.render({c: {n: WeatherSerializer(w).data for n, w in ws.items()}
+                                         for c, ws in everywhere.items()}),
+                lambda: {c: {n: render_weather(w) for n, w in ws.items()} for c, ws in everywhere.items()}),
+    }
+    bodies = fastjson.RenderCache(16)
+    print(f"encoder: {'orjson' if fastjson.orjson else 'json'}, {number} iterations")
+    print(f"{'endpoint':<12}{'drf µs':>10}{'fast µs':>10}{'cached µs':>11}{'speedup':>9}")
+    for name, (drf, build) in cases.items():
+        def fast():
+            return fastjson.dumps(build())
+        # Same document either way
+        assert json.loads(drf()) == json.loads(fast()), name
+        drf_us = timeit.timeit(drf, number=number) / number * 1e6
+        fast_us = timeit.timeit(fast, number=number) / number * 1e6
+        # Rendered once, as on a view's first request; then only the lookup
+        # a repeat request with the same ETag does
+        bodies.render(name, build)
+        assert bodies.get(name) == fast(), name
+        cached_us = timeit.timeit(lambda: bodies.render(name, build), number=number) / number * 1e6
+        print(f"{name:<12}{drf_us:>10.1f}{fast_us:>10.1f}{cached_us:>11.2f}{drf_us / fast_us:>8.1f}x")
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
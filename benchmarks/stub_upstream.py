@@ -0,0 +1,219 @@
+# benchmarks/stub_upstream.py
+"""
+A local stand-in for the Stormglass API, for load tests. It replays
+recorded weather and agriculture payloads with their hours shifted to the
+requested window. Latency, jitter and the error rate are configurable.
+
+Record payloads once (uses STORMGLASS_API_KEY, two upstream calls):
+
+    python benchmarks/stub_upstream.py record --lat 6.5244 --lon 3.3792
+
+Serve them (synthetic payloads of the same shape are used when nothing
+has been recorded):
+
+    python benchmarks/stub_upstream.py serve --port 8900 --latency 150 --jitter 50 --error-rate 0.02
+
+and start the API against it:
+
+    STORMGLASS_BASE_URL=http://127.0.0.1:8900/v2 python manage.py runserver
+
+GET /__stub__/stats returns the calls served so far, per endpoint.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ENDPOINTS = ('weather', 'agriculture')
+STORMGLASS = 'https://api.stormglass.io/v2'
+
+WEATHER_PARAMS = 'airTemperature,humidity,precipitation,windSpeed,gust,pressure,cloudCover'
+AGRI_PARAMS = 'soilMoisture,soilTemperature,uvIndex'
+
+
+def fixture_path(endpoint):
+    return os.path.join(FIXTURES, f'stormglass_{endpoint}.json')
+
+
+def _parse_time(value):
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def _format_time(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S+00:00')
+
+
+def synthetic_payload(endpoint, hours=8 * 24):
+    """A plausible tropical week, hourly, in Stormglass's response shape."""
+    start = datetime(2000, 1, 1, tzinfo=timezone.utc)
+    rows = []
+    for i in range(hours):
+        daylight = max(math.sin(math.pi * ((i % 24) - 6) / 12), 0)
+        if endpoint == 'weather':
+            values = {
+                'airTemperature': 24 + 7 * daylight,
+                'humidity': 85 - 25 * daylight,
+                'precipitation': 2.0 if i % 24 in (15, 16) and (i // 24) % 3 == 0 else 0.0,
+                'windSpeed': 2.5 + 2 * daylight,
+                'gust': 4.0 + 3 * daylight,
+                'pressure': 1011.0,
+                'cloudCover': 40.0,
+            }
+        else:
+            values = {'soilMoisture': 0.28, 'soilTemperature': 26 + 4 * daylight, 'uvIndex': 9 * daylight}
+        rows.append({'time': _format_time(start + timedelta(hours=i)),
+                     **{k: {'sg': round(v, 2)} for k, v in values.items()}})
+    return {'hours': rows, 'meta': {'cost': 1, 'dailyQuota': 10, 'requestCount': 1}}
+
+
+def load_payload(endpoint):
+    try:
+        with open(fixture_path(endpoint)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return synthetic_payload(endpoint)
+
+
+def shifted(payload, start):
+    """The payload with its hours moved so the first one falls on `start`."""
+    hours = payload['hours']
+    if not hours:
+        return payload
+    offset = start - _parse_time(hours[0]['time'])
+    return {
+        **payload,
+        'hours': [{**h, 'time': _format_time(_parse_time(h['time']) + offset)} for h in hours],
+    }
+
+
+class Stub:
+    def __init__(self, latency, jitter, error_rate, error_status):
+        self.payloads = {endpoint: load_payload(endpoint) for endpoint in ENDPOINTS}
+        self.latency = latency / 1000
+        self.jitter = jitter / 1000
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = {endpoint: 0 for endpoint in ENDPOINTS}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def respond(self, endpoint, query):
+        """(status, body) for one upstream call, after the simulated latency."""
+        delay = self.latency + random.uniform(-self.jitter, self.jitter)
+        time.sleep(max(delay, 0))
+        failed = random.random() < self.error_rate
+        with self._lock:
+            self.calls[endpoint] += 1
+            self.errors += failed
+        if failed:
+            return self.error_status, {'errors': {'key': 'Simulated upstream failure'}}
+
+        if 'start' in query:
+            start = _parse_time(query['start'][0])
+        else:
+            start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        return 200, shifted(self.payloads[endpoint], start)
+
+    def stats(self):
+        with self._lock:
+            return {'calls': dict(self.calls), 'total': sum(self.calls.values()), 'errors': self.errors}
+
+
+def handler_for(stub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = [p for p in url.path.split('/') if p]
+            if url.path.rstrip('/') == '/__stub__/stats':
+                self._send(200, stub.stats())
+            elif len(parts) >= 2 and parts[-1] == 'point' and parts[-2] in ENDPOINTS:
+                self._send(*stub.respond(parts[-2], parse_qs(url.query)))
+            else:
+                self._send(404, {'errors': {'path': 'Unknown endpoint'}})
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # one line per call would drown the load test output
+
+    return Handler
+
+
+def serve(args):
+    stub = Stub(args.latency, args.jitter, args.error_rate, args.error_status)
+    server = ThreadingHTTPServer((args.host, args.port), handler_for(stub))
+    server.daemon_threads = True
+    recorded = [e for e in ENDPOINTS if os.path.exists(fixture_path(e))]
+    print(f"Stub Stormglass on http://{args.host}:{args.port}/v2 "
+          f"(recorded: {', '.join(recorded) or 'none, using synthetic payloads'}; "
+          f"latency {args.latency}±{args.jitter} ms, error rate {args.error_rate:.0%})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Served: {stub.stats()}")
+
+
+def record(args):
+    import requests
+
+    key = os.getenv('STORMGLASS_API_KEY')
+    if not key:
+        raise SystemExit("STORMGLASS_API_KEY is not set")
+    now = datetime.now(timezone.utc)
+    queries = {
+        'weather': {'lat': args.lat, 'lng': args.lon, 'params': WEATHER_PARAMS,
+                    'start': now.strftime('%Y-%m-%dT00:00:00Z'),
+                    'end': (now + timedelta(days=7)).strftime('%Y-%m-%dT23:59:59Z')},
+        'agriculture': {'lat': args.lat, 'lng': args.lon, 'params': AGRI_PARAMS},
+    }
+    os.makedirs(FIXTURES, exist_ok=True)
+    for endpoint, params in queries.items():
+        response = requests.get(f'{STORMGLASS}/{endpoint}/point', params=params,
+                                headers={'Authorization': key}, timeout=30)
+        response.raise_for_status()
+        with open(fixture_path(endpoint), 'w') as f:
+            json.dump(response.json(), f)
+        print(f"Recorded {endpoint}: {len(response.json().get('hours', []))} hours -> {fixture_path(endpoint)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    s = commands.add_parser('serve', help='replay payloads')
+    s.add_argument('--host', default='127.0.0.1')
+    s.add_argument('--port', type=int, default=8900)
+    s.add_argument('--latency', type=float, default=100, help='mean response time, ms')
+    s.add_argument('--jitter', type=float, default=0, help='uniform ± jitter, ms')
+    s.add_argument('--error-rate', type=float, default=0, help='share of calls that fail (0-1)')
+    s.add_argument('--error-status', type=int, default=500, help='status of failed calls, e.g. 429 or 503')
+    s.set_defaults(run=serve)
+
+    r = commands.add_parser('record', help='save live Stormglass payloads as fixtures')
+    r.add_argument('--lat', type=float, default=6.5244)
+    r.add_argument('--lon', type=float, default=3.3792)
+    r.set_defaults(run=record)
+
+    args = parser.parse_args()
+    args.run(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,6 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path('nigeria/<str:state_name>/', async_views.get_nigerian_state_weather, name='async_nigerian_state_weather'),
+]
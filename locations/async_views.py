@@ -0,0 +1,51 @@
+# locations/async_views.py
+from rest_framework import status
+
+from weather import deadline
+from weather.async_services import afetch_daily, afetch_weather
+from weather.async_views import json_response
+from weather.quota import UpstreamUnavailable
+from weather.views import parse_hours, render_daily, render_weather, wants_daily
+from .registry import STATE, aget_registry
+
+
+@deadline.bounded
+async def get_nigerian_state_weather(request, state_name):
+    """Async version of views.get_nigerian_state_weather (same response)."""
+    registry = await aget_registry()
+    state = registry.state(state_name)
+    if state is None:
+        return json_response(
+            {"error": f"State '{state_name}' not found in Nigeria.",
+             "suggestions": registry.suggest(state_name, STATE)},
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+    try:
+        lat, lon = state.lat, state.lon
+        weather_data = await afetch_weather(lat, lon, hours_ahead=parse_hours(request))
+        response_data = {
+            "location": {
+                "state": state.name,
+                "capital": state.capital,
+                "abbreviation": state.abbreviation,
+                "latitude": state.latitude,
+                "longitude": state.longitude,
+            },
+            "weather": render_weather(weather_data)
+        }
+        if wants_daily(request):
+            response_data["daily"] = render_daily(await afetch_daily(lat, lon))
+        return json_response(response_data)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except UpstreamUnavailable as e:
+        return json_response(
+            {"error": "Weather data temporarily unavailable", "detail": str(e)},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+    except Exception as e:
+        return json_response(
+            {"error": "Failed to fetch weather data", "detail": str(e)},
+            status=status.HTTP_500_INTERNAL_SERVER_ERROR
+        )
@@ -0,0 +1,181 @@
+# locations/registry.py
+import difflib
+import re
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from weather.countries import SELECTED_COUNTRIES
+from weather.geo import PointIndex
+from .models import State
+
+# Every location name the API accepts, resolved in memory. The registry is
+# built once per process from the State table and the static country dicts,
+# and rebuilt when State rows change: saving or deleting a State drops this
+# process's copy at once and bumps a version key in the shared cache, which
+# other workers check at most every VERSION_CHECK_INTERVAL seconds.
+
+VERSION_KEY = 'locations:registry_version'
+VERSION_CHECK_INTERVAL = 5
+
+COUNTRY = 'country'
+STATE = 'state'
+
+# Extra names for states beyond their name, abbreviation and capital (these
+# also cover the spellings used in weather.nigerian_states)
+STATE_ALIASES = {
+    'FCT': ['FCT', 'Abuja', 'FCT Abuja', 'Federal Capital Territory'],
+}
+
+
+def normalize(name):
+    """Lookup key: case-folded with whitespace and punctuation removed."""
+    return re.sub(r'[\W_]+', '', str(name).casefold())
+
+
+class Location:
+    __slots__ = ('kind', 'name', 'continent', 'latitude', 'longitude', 'capital', 'abbreviation')
+
+    def __init__(self, kind, name, latitude, longitude, continent=None, capital=None, abbreviation=None):
+        self.kind = kind
+        self.name = name
+        self.continent = continent
+        self.latitude = latitude  # as stored (Decimal for State rows)
+        self.longitude = longitude
+        self.capital = capital
+        self.abbreviation = abbreviation
+
+    @property
+    def lat(self):
+        return float(self.latitude)
+
+    @property
+    def lon(self):
+        return float(self.longitude)
+
+    def __repr__(self):
+        return f"<Location {self.kind} {self.name!r}>"
+
+
+class LocationRegistry:
+    """
+    Name -> Location maps, one per kind, keyed by normalize()d names and
+    aliases, plus fuzzy suggestions for names that don't match, and spatial
+    indexes (all locations and per kind) for nearest / bounding-box search.
+    """
+
+    def __init__(self, states, countries):
+        self._index = {COUNTRY: {}, STATE: {}}
+        self.states = []
+        self.countries = []
+
+        for continent, locations in countries.items():
+            for name, c in locations.items():
+                location = Location(COUNTRY, name, c['lat'], c['lon'], continent=continent)
+                self.countries.append(location)
+                self._add(location, [name])
+
+        for state in states:
+            location = Location(STATE, state.name, state.latitude, state.longitude,
+                                capital=state.capital, abbreviation=state.abbreviation)
+            self.states.append(location)
+            self._add(location, [state.name])
+        # Aliases only claim keys that no name already took
+        for location in self.states:
+            aliases = [location.abbreviation, location.capital, *STATE_ALIASES.get(location.abbreviation, [])]
+            self._add(location, [a for a in aliases if a])
+
+        self._points = {
+            None: PointIndex((loc.lat, loc.lon, loc) for loc in self.countries + self.states),
+            COUNTRY: PointIndex((loc.lat, loc.lon, loc) for loc in self.countries),
+            STATE: PointIndex((loc.lat, loc.lon, loc) for loc in self.states),
+        }
+
+    def _add(self, location, names):
+        index = self._index[location.kind]
+        for name in names:
+            key = normalize(name)
+            if key and key not in index:
+                index[key] = location
+
+    def get(self, name, kind=None):
+        """Location for a name or alias (any kind unless given; countries first), or None."""
+        key = normalize(name)
+        for k in ((kind,) if kind else (COUNTRY, STATE)):
+            location = self._index[k].get(key)
+            if location is not None:
+                return location
+        return None
+
+    def state(self, name):
+        return self.get(name, STATE)
+
+    def country(self, continent, name):
+        location = self.get(name, COUNTRY)
+        if location is None or normalize(location.continent) != normalize(continent):
+            return None
+        return location
+
+    def nearest(self, lat, lon, k=5, kind=None, max_km=None):
+        """Up to k (distance_km, Location) pairs closest to a point."""
+        return self._points[kind].nearest(lat, lon, k, max_km)
+
+    def within(self, south, west, north, east, kind=None):
+        """Locations inside a bounding box."""
+        return self._points[kind].within(south, west, north, east)
+
+    def suggest(self, name, kind=None, n=3):
+        """Closest known names to an unmatched one (for 'did you mean' hints)."""
+        keys = [key for k in ((kind,) if kind else (COUNTRY, STATE)) for key in self._index[k]]
+        suggestions = []
+        for key in difflib.get_close_matches(normalize(name), keys, n=n * 2, cutoff=0.6):
+            location = self._index[kind][key] if kind else (self._index[COUNTRY].get(key) or self._index[STATE][key])
+            if location.name not in suggestions:
+                suggestions.append(location.name)
+        return suggestions[:n]
+
+
+_registry = None
+_version = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def get_registry():
+    """This process's registry, (re)built if State rows changed anywhere."""
+    global _registry, _version, _checked_at
+    if _registry is not None and time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL:
+        return _registry
+    with _lock:
+        version = cache.get(VERSION_KEY)
+        if _registry is None or version != _version:
+            _registry = LocationRegistry(list(State.objects.all()), SELECTED_COUNTRIES)
+            _version = version
+        _checked_at = time.monotonic()
+        return _registry
+
+
+async def aget_registry():
+    """get_registry for async views; only leaves the event loop when it has to check or build."""
+    if _registry is not None and time.monotonic() - _checked_at < VERSION_CHECK_INTERVAL:
+        return _registry
+    return await sync_to_async(get_registry)()
+
+
+def invalidate():
+    """Rebuild on next use, here and (via the version key) in every worker."""
+    global _registry
+    with _lock:
+        _registry = None
+    cache.set(VERSION_KEY, uuid.uuid4().hex, timeout=None)
+
+
+@receiver(post_save, sender=State)
+@receiver(post_delete, sender=State)
+def _state_changed(sender, **kwargs):
+    invalidate()
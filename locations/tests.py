@@ -1,3 +1,114 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import TestCase, override_settings
 
-# Create your tests here.
+from weather import codec, services
+from weather.tests import make_series
+
+from . import registry
+from .models import State
+from .registry import COUNTRY, STATE, get_registry, normalize
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCMEM)
+class RegistryTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(registry.invalidate)
+        State.objects.all().delete()  # the migrations load every state; these are enough
+        State.objects.create(name='Lagos', capital='Ikeja', abbreviation='LA', latitude=6.5244, longitude=3.3792)
+        State.objects.create(name='Federal Capital Territory', capital='Abuja', abbreviation='FCT',
+                             latitude=9.0765, longitude=7.3986)
+
+    def test_normalize(self):
+        self.assertEqual(normalize('  Nigeria - Kano '), 'nigeriakano')
+        self.assertEqual(normalize('FCT_Abuja.'), 'fctabuja')
+
+    def test_lookup_ignores_case_spacing_and_aliases(self):
+        reg = get_registry()
+        kano = reg.get('Nigeria - Kano')
+        self.assertEqual(kano.kind, COUNTRY)
+        for name in ('nigeria-kano', 'NIGERIA KANO', ' Nigeria  -  Kano '):
+            self.assertIs(reg.get(name), kano, name)
+        self.assertIs(reg.country('africa', 'nigeria kano'), kano)
+        self.assertIsNone(reg.country('Europe', 'Nigeria - Kano'))
+
+        lagos = reg.state('lagos')
+        self.assertEqual(lagos.kind, STATE)
+        for name in ('LA', 'ikeja'):
+            self.assertIs(reg.state(name), lagos, name)
+        for name in ('FCT', 'Abuja', 'fct abuja', 'Federal Capital Territory'):
+            self.assertEqual(reg.state(name).name, 'Federal Capital Territory', name)
+        self.assertIsNone(reg.get('Atlantis'))
+
+    def test_lookups_stay_off_the_database(self):
+        get_registry()
+        with self.assertNumQueries(0):
+            for _ in range(3):
+                get_registry().state('Lagos')
+
+    def test_suggestions(self):
+        reg = get_registry()
+        self.assertIn('Nigeria - Kano', reg.suggest('Nigeria - Kanoo'))
+        self.assertEqual(reg.suggest('Lagoss', STATE), ['Lagos'])
+        self.assertEqual(reg.suggest('zzzzzz'), [])
+
+    def test_state_changes_rebuild_the_registry(self):
+        self.assertIsNone(get_registry().state('Kano'))
+        kano = State.objects.create(name='Kano', capital='Kano', abbreviation='KN', latitude=12.0, longitude=8.52)
+        self.assertEqual(get_registry().state('KN').name, 'Kano')
+        kano.delete()
+        self.assertIsNone(get_registry().state('Kano'))
+
+    def test_other_workers_changes_are_picked_up(self):
+        reg = get_registry()
+        cache.set(registry.VERSION_KEY, 'from another worker', timeout=None)
+        self.assertIs(get_registry(), reg)  # not checked again within VERSION_CHECK_INTERVAL
+        registry._checked_at = 0.0
+        self.assertIsNot(get_registry(), reg)
+
+
+@override_settings(CACHES=LOCMEM)
+class LocationSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(registry.invalidate)
+        State.objects.all().delete()
+        State.objects.create(name='Lagos', capital='Ikeja', abbreviation='LA', latitude=6.5244, longitude=3.3792)
+        State.objects.create(name='Kano', capital='Kano', abbreviation='KN', latitude=12.0022, longitude=8.5920)
+
+    def test_nearest(self):
+        response = self.client.get('/api/locations/nearest/?lat=6.6&lon=3.4&kind=state')
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        self.assertEqual([r['name'] for r in results], ['Lagos', 'Kano'])
+        self.assertEqual(results[0]['capital'], 'Ikeja')
+        self.assertLess(results[0]['distance_km'], 10)
+        self.assertIsNone(results[0]['weather'])  # nothing cached, and no upstream call
+
+        nearby = self.client.get('/api/locations/nearest/?lat=6.6&lon=3.4&limit=3&max_km=20').json()['results']
+        self.assertEqual({(r['kind'], r['name']) for r in nearby}, {(STATE, 'Lagos'), (COUNTRY, 'Nigeria - Lagos')})
+
+    def test_cached_weather_and_revalidation(self):
+        entry = services.make_entry(make_series())
+        cache.set(services.cache_key_for(6.5244, 3.3792), codec.encode(entry), timeout=None)
+        url = '/api/locations/nearest/?lat=6.6&lon=3.4&kind=state&limit=1'
+        response = self.client.get(url)
+        self.assertEqual(response.json()['results'][0]['weather']['temperature']['air'], 25.0)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_within(self):
+        response = self.client.get('/api/locations/within/?bbox=4,2,14,15&kind=state')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual({r['name'] for r in response.json()['results']}, {'Lagos', 'Kano'})
+        self.assertFalse(response.json()['truncated'])
+        with self.settings(LOCATION_SEARCH_MAX_RESULTS=1):
+            truncated = self.client.get('/api/locations/within/?bbox=4,2,14,15&kind=state').json()
+        self.assertEqual(len(truncated['results']), 1)
+        self.assertTrue(truncated['truncated'])
+
+    def test_bad_queries(self):
+        for url in ('nearest/?lon=3.4', 'nearest/?lat=91&lon=3.4', 'nearest/?lat=6&lon=3&kind=lga',
+                    'nearest/?lat=6&lon=3&limit=0', 'within/?bbox=1,2,3', 'within/?bbox=14,2,4,15'):
+            self.assertEqual(self.client.get(f'/api/locations/{url}').status_code, 400, url)
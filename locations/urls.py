@@ -2,6 +2,8 @@ from django.urls import path, include
 from . import views
 
 urlpatterns = [
+    path('nearest/', views.get_nearest_locations, name='nearest_locations'),
+    path('within/', views.get_locations_in_bbox, name='locations_in_bbox'),
     path('nigeria/<str:state_name>/', views.get_nigerian_state_weather, name='nigerian_state_weather'),
 ]
 
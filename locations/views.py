@@ -2,42 +2,166 @@
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from .models import State
-from weather.services import fetch_weather  # adjust import if your service is in another app
+from .registry import COUNTRY, STATE, get_registry
+from django.conf import settings
+from weather import conditional, deadline, fastjson
+from weather.forecast import daily_aggregates
+from weather.services import (  # adjust import if your service is in another app
+    cached_entries_many, conditions_from_entry, fetch_entry, fresh_for,
+)
 from weather.serializers import WeatherSerializer  # adjust path as needed
+from weather.quota import UpstreamUnavailable
+from weather.views import parse_hours, render_daily, render_weather, wants_daily
 
 
 @api_view(['GET'])
+@deadline.bounded
 def get_nigerian_state_weather(request, state_name):
-    # Normalize input (case-insensitive, handle FCT)
-    try:
-        if state_name.lower() == "fct":
-            state = State.objects.get(abbreviation="FCT")
-        else:
-            # Try exact name first
-            state = State.objects.get(name__iexact=state_name)
-    except State.DoesNotExist:
+    # In-memory lookup: case/space-insensitive, accepts aliases like "FCT"
+    registry = get_registry()
+    state = registry.state(state_name)
+    if state is None:
         return Response(
-            {"error": f"State '{state_name}' not found in Nigeria."},
+            {"error": f"State '{state_name}' not found in Nigeria.",
+             "suggestions": registry.suggest(state_name, STATE)},
             status=status.HTTP_404_NOT_FOUND
         )
 
     try:
-        weather_data = fetch_weather(float(state.latitude), float(state.longitude))
-        serializer = WeatherSerializer(weather_data)
-
-        return Response({
-            "location": {
-                "state": state.name,
-                "capital": state.capital,
-                "abbreviation": state.abbreviation,
-                "latitude": state.latitude,
-                "longitude": state.longitude,
-            },
-            "weather": serializer.data
-        })
+        lat, lon = state.lat, state.lon
+        hours = parse_hours(request)
+        entry, stale = fetch_entry(lat, lon)
+        validators = conditional.for_entries(request, [(entry, stale)], hourly=bool(hours))
+        not_modified = conditional.not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        def build():
+            response_data = {
+                "location": {
+                    "state": state.name,
+                    "capital": state.capital,
+                    "abbreviation": state.abbreviation,
+                    "latitude": state.latitude,
+                    "longitude": state.longitude,
+                },
+                "weather": render_weather(conditions_from_entry(entry, stale, hours))
+            }
+            if wants_daily(request):
+                response_data["daily"] = render_daily(daily_aggregates(entry['series']))
+            return response_data
+
+        body = fastjson.rendered().render(validators.etag, build)
+        return fastjson.response(body, headers=validators.headers())
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except UpstreamUnavailable as e:
+        return Response(
+            {"error": "Weather data temporarily unavailable", "detail": str(e)},
+            status=status.HTTP_503_SERVICE_UNAVAILABLE
+        )
     except Exception as e:
         return Response(
             {"error": "Failed to fetch weather data", "detail": str(e)},
             status=status.HTTP_500_INTERNAL_SERVER_ERROR
-        )
\ No newline at end of file
+        )
+
+
+def _query_float(request, name, low, high, default=None):
+    raw = request.GET.get(name)
+    if raw is None:
+        if default is None:
+            raise ValueError(f"'{name}' is required")
+        return default
+    try:
+        value = float(raw)
+    except ValueError:
+        raise ValueError(f"'{name}' must be a number")
+    if not low <= value <= high:
+        raise ValueError(f"'{name}' must be between {low} and {high}")
+    return value
+
+
+def _query_kind(request):
+    kind = request.GET.get('kind') or None
+    if kind not in (None, STATE, COUNTRY):
+        raise ValueError(f"'kind' must be '{STATE}' or '{COUNTRY}'")
+    return kind
+
+
+def _search_response(request, query, matches, **extra):
+    """
+    Search results with each location's cached weather (None if not cached),
+    or a 304 if the client's copy is current.
+    """
+    entries = cached_entries_many({i: (loc.lat, loc.lon) for i, (_, loc) in enumerate(matches)})
+    stale = {i: entry is not None and fresh_for(entry) <= 0 for i, entry in entries.items()}
+    # Uncached locations don't make the response uncacheable: it only
+    # changes when a location's entry appears or is refetched
+    validators = conditional.for_entries(request, [(e, stale[i]) for i, e in entries.items() if e is not None])
+    not_modified = conditional.not_modified(request, validators)
+    if not_modified is not None:
+        return not_modified
+
+    results = []
+    for i, (distance, loc) in enumerate(matches):
+        result = {"name": loc.name, "kind": loc.kind, "lat": loc.lat, "lon": loc.lon}
+        if loc.kind == STATE:
+            result.update(capital=loc.capital, abbreviation=loc.abbreviation)
+        else:
+            result["continent"] = loc.continent
+        if distance is not None:
+            result["distance_km"] = round(distance, 1)
+        entry = entries[i]
+        result["weather"] = WeatherSerializer(conditions_from_entry(entry, stale[i])).data if entry else None
+        results.append(result)
+    return Response({"query": query, **extra, "results": results}, headers=validators.headers())
+
+
+@api_view(['GET'])
+def get_nearest_locations(request):
+    """
+    Known locations closest to a point, with their cached weather (no
+    upstream calls). Query: lat, lon; optional limit (default 5), max_km,
+    kind (state or country).
+    """
+    try:
+        lat = _query_float(request, 'lat', -90, 90)
+        lon = _query_float(request, 'lon', -180, 180)
+        limit = int(_query_float(request, 'limit', 1, settings.LOCATION_SEARCH_MAX_RESULTS, default=5))
+        max_km = _query_float(request, 'max_km', 0, 20038, default=20038)  # half the equator
+        kind = _query_kind(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    matches = get_registry().nearest(lat, lon, k=limit, kind=kind, max_km=max_km)
+    return _search_response(request, {"lat": lat, "lon": lon}, matches)
+
+
+@api_view(['GET'])
+def get_locations_in_bbox(request):
+    """
+    Known locations inside a bounding box, with their cached weather.
+    Query: bbox=south,west,north,east (west > east crosses the antimeridian);
+    optional kind (state or country). At most LOCATION_SEARCH_MAX_RESULTS
+    locations are returned, with `truncated` set when there were more.
+    """
+    try:
+        south, west, north, east = (float(v) for v in request.GET.get('bbox', '').split(','))
+    except ValueError:
+        return Response({"error": "'bbox' must be south,west,north,east"}, status=status.HTTP_400_BAD_REQUEST)
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        return Response({"error": "'bbox' is out of range or south > north"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        kind = _query_kind(request)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    found = get_registry().within(south, west, north, east, kind=kind)
+    limit = settings.LOCATION_SEARCH_MAX_RESULTS
+    return _search_response(
+        request,
+        {"south": south, "west": west, "north": north, "east": east},
+        [(None, loc) for loc in found[:limit]],
+        truncated=len(found) > limit,
+    )
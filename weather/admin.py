@@ -1,3 +1,9 @@
+# weather/admin.py
 from django.contrib import admin
+from .models import Observation
 
-# Register your models here.
+@admin.register(Observation)
+class ObservationAdmin(admin.ModelAdmin):
+    list_display = ('timestamp', 'latitude', 'longitude', 'air_temperature', 'precipitation', 'fetched_at')
+    list_filter = ('latitude', 'longitude')
+    date_hierarchy = 'timestamp'
@@ -0,0 +1,133 @@
+# weather/async_client.py
+import asyncio
+import time
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import circuit, deadline, metrics, quota, timing
+from .client import hedge_delay, is_healthy, latency
+
+
+class AsyncStormglassClient:
+    """
+    Non-blocking counterpart of client.StormglassClient for the async views:
+    one pooled httpx.AsyncClient with the same timeouts and connection-level
+    retries, so a single process can keep hundreds of upstream calls in flight.
+    """
+
+    def __init__(self, api_key, connect_timeout, read_timeout, max_retries, pool_size):
+        self.call_count = 0
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.http = httpx.AsyncClient(
+            headers={'Authorization': api_key or ''},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+            transport=httpx.AsyncHTTPTransport(retries=max_retries),
+        )
+
+    async def get(self, url, params):
+        deadline.check(f"before calling {url}")
+        breaker = circuit.breaker_for(url)
+        breaker.before()  # in memory, so safe to call on the event loop
+        try:
+            # A database update; off the loop, and not queued behind every other
+            # request on the single thread-sensitive executor
+            await sync_to_async(quota.acquire, thread_sensitive=False)(quota.current_priority())
+        except BaseException:
+            breaker.cancel()
+            raise
+        self.call_count += 1
+
+        read_timeout = deadline.cap(self.read_timeout)
+        started = time.monotonic()
+        try:
+            timeout = httpx.Timeout(read_timeout, connect=self.connect_timeout)
+            response = await self.http.get(url, params=params, timeout=timeout)
+        except asyncio.CancelledError:
+            breaker.cancel()  # caller gave up (deadline), not an upstream failure
+            raise
+        except httpx.ReadTimeout as e:
+            if read_timeout >= self.read_timeout:
+                breaker.record(False, time.monotonic() - started)
+                timing.observe_upstream(breaker.name, time.monotonic() - started)
+                raise
+            breaker.cancel()  # cut short by our deadline, likewise
+            timing.observe_upstream(breaker.name, time.monotonic() - started)
+            raise deadline.DeadlineExceeded(f"Request deadline exceeded waiting for {url}") from e
+        except BaseException:
+            breaker.record(False, time.monotonic() - started)
+            timing.observe_upstream(breaker.name, time.monotonic() - started)
+            raise
+        elapsed = time.monotonic() - started
+        ok = is_healthy(response.status_code)
+        breaker.record(ok, elapsed)
+        timing.observe_upstream(breaker.name, elapsed)
+        if ok:
+            latency(breaker.name).record(elapsed)
+        return response
+
+    async def fetch(self, url, params):
+        """
+        get(), bounded by the request deadline and hedged like
+        StormglassClient.fetch; the losing call is cancelled.
+        """
+        calls = [asyncio.ensure_future(self.get(url, params))]
+        try:
+            delay = hedge_delay(url)
+            if delay is not None:
+                done, _ = await asyncio.wait(calls, timeout=deadline.cap(delay))
+                left = deadline.remaining()
+                if not done and (left is None or left > 0):
+                    with quota.priority(quota.LOW):  # the task copies the context as it is created
+                        calls.append(asyncio.ensure_future(self.get(url, params)))
+                    metrics.incr('upstream_hedged')
+
+            errors = [None] * len(calls)
+            unhealthy = None
+            pending = set(calls)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=deadline.cap(None),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise deadline.DeadlineExceeded(f"Request deadline exceeded waiting for {url}")
+                for task in sorted(done, key=calls.index):
+                    index = calls.index(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        errors[index] = e
+                        continue
+                    if is_healthy(response.status_code):
+                        if index:
+                            metrics.incr('upstream_hedge_won')
+                        return response
+                    unhealthy = unhealthy or response
+            if unhealthy is not None:
+                return unhealthy
+            raise next(e for e in errors if e is not None)
+        finally:
+            for task in calls:
+                task.cancel()  # no-op for finished calls
+
+
+# httpx clients are bound to the event loop that created them; under ASGI
+# there is one loop per process, under WSGI each async request gets its own
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = AsyncStormglassClient(
+            api_key=settings.STORMGLASS_API_KEY,
+            connect_timeout=settings.STORMGLASS_CONNECT_TIMEOUT,
+            read_timeout=settings.STORMGLASS_READ_TIMEOUT,
+            max_retries=settings.STORMGLASS_MAX_RETRIES,
+            pool_size=settings.STORMGLASS_ASYNC_POOL_SIZE,
+        )
+    return client
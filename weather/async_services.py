@@ -0,0 +1,166 @@
+# weather/async_services.py
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError
+
+from . import codec, coordination, forecast, metrics, observations, providers, quota, timing
+from .deadline import lifted, remaining, within
+from .geo import quantize
+from .services import (
+    _decode_entry, _is_fresh, cache_key_for, cached_at, conditions_from_entry, entry_outlook, entry_timeout,
+    make_entry,
+)
+from .singleflight import AsyncSingleFlight
+
+logger = logging.getLogger(__name__)
+
+# Async mirror of services.fetch_weather for the ASGI views. Cache entries,
+# keys and stale-while-revalidate rules are shared with the sync path, so both
+# kinds of worker can serve from (and refresh) the same cache.
+
+_weather_flight = AsyncSingleFlight('weather_fetch')
+
+# Strong references to background refresh tasks until they finish
+_background = set()
+
+
+async def afetch_weather(lat, lon, hours_ahead=0):
+    """Async services.fetch_weather."""
+    entry, stale = await _aget_entry(lat, lon)
+    return conditions_from_entry(entry, stale, hours_ahead)
+
+
+async def afetch_daily(lat, lon):
+    entry, _ = await _aget_entry(lat, lon)
+    return forecast.daily_aggregates(entry['series'])
+
+
+async def afetch_outlook(lat, lon):
+    entry, _ = await _aget_entry(lat, lon)
+    return entry_outlook(entry)
+
+
+async def afetch_weather_many(coords, max_concurrency=None, deadline=None):
+    """Async services.fetch_weather_many: {key: (data, error)} with a deadline."""
+    return {
+        key: (data, error)
+        async for key, data, error in aiter_weather_many(coords, max_concurrency, deadline)
+    }
+
+
+async def aiter_weather_many(coords, max_concurrency=None, deadline=None):
+    """Async services.iter_weather_many: (key, data, error) in completion order."""
+    keys = {key: cache_key_for(lat, lon) for key, (lat, lon) in coords.items()}
+    await quota.attl_multiplier()  # freshness depends on it; it can't be read on the loop
+    started = time.perf_counter()
+    blobs = await cache.aget_many(set(keys.values()))
+    timing.observe('cache', time.perf_counter() - started)
+    served = set()
+    for key, cache_key in keys.items():
+        entry = _decode_entry(blobs.get(cache_key))
+        if entry and _is_fresh(entry):
+            metrics.incr('weather_cache_hit')
+            served.add(key)
+            yield key, conditions_from_entry(entry), None
+    coords = {key: c for key, c in coords.items() if key not in served}
+    if not coords:
+        return
+
+    max_concurrency = max_concurrency or settings.WEATHER_ASYNC_MAX_CONCURRENCY
+    deadline = deadline if deadline is not None else settings.WEATHER_FANOUT_DEADLINE
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def fetch_one(lat, lon):
+        async with semaphore:
+            return await afetch_weather(lat, lon)
+
+    started = time.monotonic()
+    with within(deadline):  # tasks copy the context as they are created
+        tasks = {asyncio.ensure_future(fetch_one(lat, lon)): key for key, (lat, lon) in coords.items()}
+        deadline = remaining()  # the request's deadline, if that's sooner
+    pending = set(tasks)
+    try:
+        while pending:
+            left = deadline - (time.monotonic() - started)
+            if left <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=left, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    yield tasks[task], None, str(task.exception())
+                else:
+                    yield tasks[task], task.result(), None
+        for task in pending:
+            yield tasks[task], None, f"Timed out after {time.monotonic() - started:.1f}s"
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def _aget_entry(lat, lon):
+    lat, lon = quantize(lat, lon)
+    cache_key = f"weather_{lat}_{lon}"
+    await quota.attl_multiplier()  # freshness depends on it; it can't be read on the loop
+    entry = await _aread_entry(cache_key)
+    if entry:
+        if _is_fresh(entry):
+            metrics.incr('weather_cache_hit')
+            return entry, False
+        metrics.incr('weather_cache_stale')
+        await _aschedule_refresh(lat, lon, cache_key)
+        return entry, True
+
+    metrics.incr('weather_cache_miss')
+    return await _arefresh(lat, lon, cache_key), False
+
+
+async def _aread_entry(cache_key):
+    started = time.perf_counter()
+    blob = await cache.aget(cache_key)
+    entry = codec.decode(blob) if blob is not None else None
+    timing.observe('cache', time.perf_counter() - started)
+    return entry if entry and 'series' in entry else None
+
+
+async def _arefresh(lat, lon, cache_key):
+    requested_at = time.time()
+
+    async def fetch_and_cache():
+        fetched = await providers.get_provider().afetch(lat, lon)
+        entry = make_entry(fetched.series, fetched.fetched_at)
+        await cache.aset(cache_key, codec.encode(entry), timeout=entry_timeout())
+        if fetched.source.remote:
+            observations.record(lat, lon, entry['series'], entry['fetched_at'])
+        return entry
+
+    async def lookup():
+        entry = await _aread_entry(cache_key)
+        return entry if entry and cached_at(entry) >= requested_at else None
+
+    return await _weather_flight.do(cache_key, fetch_and_cache, lookup=lookup)
+
+
+async def _aschedule_refresh(lat, lon, cache_key):
+    try:
+        if not await coordination.aacquire_lease(f"refresh:{cache_key}", settings.WEATHER_REFRESH_RETRY_INTERVAL):
+            return
+    except DatabaseError as e:
+        # The stale entry is still served; a later request retries the refresh
+        logger.warning("Skipping refresh of %s, lease unavailable: %s", cache_key, e)
+        return
+
+    async def refresh():
+        try:
+            # Nobody is waiting on this fetch; the task inherited the request's context
+            with quota.priority(quota.LOW), lifted():
+                await _arefresh(lat, lon, cache_key)
+        except Exception as e:
+            logger.warning("Background refresh failed for %s: %s", cache_key, e)
+
+    task = asyncio.get_running_loop().create_task(refresh())
+    _background.add(task)
+    task.add_done_callback(_background.discard)
@@ -0,0 +1,8 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path('weather/<str:continent>/<str:country>/', async_views.get_weather_by_country, name='async_weather_by_country'),
+    path('weather/all/', async_views.get_all_countries_weather, name='async_all_weather'),
+    path('weather/with-crops/<str:continent>/<str:country>/', async_views.get_weather_with_crop_recommendations, name='async_weather_with_crops'),
+]
@@ -0,0 +1,128 @@
+# weather/async_views.py
+from django.http import StreamingHttpResponse
+from rest_framework import status
+
+from locations.registry import COUNTRY, aget_registry
+from .async_services import afetch_daily, afetch_outlook, afetch_weather, afetch_weather_many, aiter_weather_many
+from .crop_engine import score_all
+from .crop_rules import generate_alerts
+from .quota import UpstreamUnavailable
+from . import deadline, fastjson, timing
+from .views import (
+    SELECTED_COUNTRIES, ndjson_location, parse_hours, render_daily, render_weather, render_weather_with_crops,
+    wants_daily, wants_stream,
+)
+
+# Async (ASGI) versions of the upstream-bound endpoints in views.py. They
+# return the same JSON, but wait on Stormglass without holding a worker
+# thread. Served under /api/async/ — run with an ASGI server, e.g.
+#   uvicorn weather_api.asgi:application
+
+
+def json_response(data, status=status.HTTP_200_OK):
+    # Same encoding as the sync views, so Decimals/datetimes render identically
+    return fastjson.response(fastjson.dumps(data), status=status)
+
+
+@deadline.bounded
+async def get_weather_by_country(request, continent, country):
+    registry = await aget_registry()
+    location = registry.country(continent, country)
+    if location is None:
+        return json_response(
+            {"error": "Invalid continent or location. Check spelling and spaces.",
+             "suggestions": registry.suggest(country, COUNTRY)},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    continent, country = location.continent, location.name
+    lat, lon = location.lat, location.lon
+
+    try:
+        data = await afetch_weather(lat, lon, hours_ahead=parse_hours(request))
+        response_data = {
+            "location": {
+                "continent": continent,
+                "country": country.replace(" - ", " "),
+                "lat": lat,
+                "lon": lon
+            },
+            "weather": render_weather(data)
+        }
+        if wants_daily(request):
+            response_data["daily"] = render_daily(await afetch_daily(lat, lon))
+        return json_response(response_data)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except UpstreamUnavailable as e:
+        return json_response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return json_response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+async def get_all_countries_weather(request):
+    coords = {
+        (continent, name): (c['lat'], c['lon'])
+        for continent, locations in SELECTED_COUNTRIES.items()
+        for name, c in locations.items()
+    }
+    if wants_stream(request):
+        async def lines():
+            async for result in aiter_weather_many(coords):
+                yield ndjson_location(*result)
+
+        return StreamingHttpResponse(lines(), content_type='application/x-ndjson')
+
+    fetched = await afetch_weather_many(coords)
+
+    results = {}
+    for continent, locations in SELECTED_COUNTRIES.items():
+        results[continent] = {}
+        for name in locations:
+            data, error = fetched[(continent, name)]
+            if error:
+                results[continent][name.replace(" - ", " ")] = {"error": error}
+            else:
+                results[continent][name.replace(" - ", " ")] = render_weather(data)
+    return json_response(results)
+
+
+@deadline.bounded
+async def get_weather_with_crop_recommendations(request, continent, country):
+    registry = await aget_registry()
+    location = registry.country(continent, country)
+    if location is None:
+        return json_response(
+            {"error": "Location not found. Use a name like 'Nigeria - Kano'.",
+             "suggestions": registry.suggest(country, COUNTRY)},
+            status=status.HTTP_404_NOT_FOUND
+        )
+    continent, country = location.continent, location.name
+    lat, lon = location.lat, location.lon
+
+    try:
+        weather = await afetch_weather(lat, lon, hours_ahead=parse_hours(request))
+        outlook = await afetch_outlook(lat, lon)
+        with timing.stage('crops'):
+            recommendations = score_all(weather, outlook=outlook)
+            recommendations.sort(key=lambda x: x['score'], reverse=True)
+            alerts = generate_alerts(weather)
+
+        response_data = {
+            "location": {
+                "continent": continent,
+                "country": country.replace(" - ", " "),
+                "lat": lat,
+                "lon": lon
+            },
+            "weather": weather,
+            "outlook": outlook,
+            "recommended_crops": recommendations[:5],
+            "alerts": alerts
+        }
+        return json_response(render_weather_with_crops(response_data))
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except UpstreamUnavailable as e:
+        return json_response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return json_response({"error": f"Weather service error: {str(e)}"}, status=500)
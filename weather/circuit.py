@@ -0,0 +1,155 @@
+# weather/circuit.py
+import logging
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from django.conf import settings
+
+from . import metrics
+from .quota import UpstreamUnavailable
+
+logger = logging.getLogger(__name__)
+
+# Circuit breakers in front of the Stormglass endpoints, one per endpoint so an
+# agriculture outage doesn't cut off standard weather. State is per process
+# and in memory: deciding to fail fast costs no I/O.
+# - closed: calls go through; outcomes over the last STORMGLASS_BREAKER_WINDOW
+#   seconds are tracked, and the circuit opens once at least MIN_CALLS were
+#   made and the share of failures or of slow calls reaches its threshold
+# - open: calls are rejected at once with CircuitOpen (an UpstreamUnavailable,
+#   so callers serve cached data or answer 503) for OPEN_SECONDS
+# - half-open: a single probe call is let through; success closes the
+#   circuit, failure opens it again
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(UpstreamUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, name, window, min_calls, error_rate, slow_call, slow_rate, open_seconds):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._outcomes = deque()  # (monotonic time, failed, slow)
+
+    def before(self):
+        """Admit a call, or raise CircuitOpen while the endpoint is failing."""
+        with self._lock:
+            if self._state == OPEN:
+                retry_in = self._opened_at + self.open_seconds - time.monotonic()
+                if retry_in > 0:
+                    self._reject(f"retry in {retry_in:.0f}s")
+                self._state = HALF_OPEN
+                self._probing = False
+            if self._state == HALF_OPEN:
+                if self._probing:
+                    self._reject("probe in flight")
+                self._probing = True
+
+    def cancel(self):
+        """The admitted call was never made (e.g. over quota)."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+
+    def record(self, ok, duration):
+        """Outcome of an admitted call: success flag and seconds taken."""
+        slow = duration >= self.slow_call
+        now = time.monotonic()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probing = False
+                if ok and not slow:
+                    self._state = CLOSED
+                    self._outcomes.clear()
+                    metrics.incr(f"circuit_{self.name}_closed")
+                else:
+                    self._open(now)
+                return
+            if self._state == OPEN:
+                return  # a call admitted before the circuit opened
+
+            self._outcomes.append((now, not ok, slow))
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._outcomes.popleft()
+
+            calls = len(self._outcomes)
+            if calls < self.min_calls:
+                return
+            failures = sum(1 for _, failed, _ in self._outcomes if failed)
+            slow_calls = sum(1 for _, _, s in self._outcomes if s)
+            if failures / calls >= self.error_rate or slow_calls / calls >= self.slow_rate:
+                self._open(now)
+
+    def status(self):
+        with self._lock:
+            calls = len(self._outcomes)
+            return {
+                'state': self._state,
+                'calls': calls,
+                'failures': sum(1 for _, failed, _ in self._outcomes if failed),
+                'slow': sum(1 for _, _, s in self._outcomes if s),
+                'retry_in': (max(round(self._opened_at + self.open_seconds - time.monotonic(), 1), 0)
+                             if self._state == OPEN else None),
+            }
+
+    def _open(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self._outcomes.clear()
+        metrics.incr(f"circuit_{self.name}_opened")
+        logger.warning("Circuit %s opened for %ss", self.name, self.open_seconds)
+
+    def _reject(self, reason):
+        metrics.incr(f"circuit_{self.name}_rejected")
+        raise CircuitOpen(f"Stormglass {self.name} API unavailable (circuit open, {reason})")
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def endpoint_name(url):
+    """'weather' for .../v2/weather/point, 'agriculture' for .../v2/agriculture/point."""
+    parts = [p for p in urlsplit(url).path.split('/') if p]
+    return parts[-2] if len(parts) >= 2 else urlsplit(url).netloc
+
+
+def breaker_for(url):
+    name = endpoint_name(url)
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name,
+                window=settings.STORMGLASS_BREAKER_WINDOW,
+                min_calls=settings.STORMGLASS_BREAKER_MIN_CALLS,
+                error_rate=settings.STORMGLASS_BREAKER_ERROR_RATE,
+                slow_call=settings.STORMGLASS_BREAKER_SLOW_CALL,
+                slow_rate=settings.STORMGLASS_BREAKER_SLOW_RATE,
+                open_seconds=settings.STORMGLASS_BREAKER_OPEN_SECONDS,
+            )
+        return breaker
+
+
+def status():
+    """State of every breaker used so far in this process, by endpoint."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.status() for b in breakers}
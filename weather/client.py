@@ -0,0 +1,230 @@
+# weather/client.py
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from . import circuit, deadline, metrics, quota, timing
+
+RETRY_STATUSES = (500, 502, 503, 504)
+
+
+class StormglassClient:
+    """
+    Reusable upstream client: one keep-alive connection pool shared by every
+    request, explicit connect/read timeouts and retry with exponential backoff
+    on connection errors, timeouts and 5xx responses.
+    """
+
+    def __init__(self, api_key, connect_timeout, read_timeout, max_retries,
+                 backoff_factor, pool_size):
+        self.api_key = api_key
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        # No retries inside urllib3: each attempt is a paid call, so get()
+        # retries itself, through the quota, breaker and request deadline
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+
+        self.session = requests.Session()
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Authorization': api_key or ''})
+
+        self._calls_lock = threading.Lock()
+        self.call_count = 0  # upstream requests issued by this process
+
+        # Side pool for issuing a coordinate's second point request in parallel
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='stormglass')
+
+    def get(self, url, params, priority=None):
+        """A GET, retried up to max_retries times on failure or a 5xx response."""
+        attempt = 0
+        while True:
+            try:
+                response = self._attempt(url, params, priority)
+            except (requests.ConnectionError, requests.Timeout):
+                if not self._backoff(attempt):
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or not self._backoff(attempt):
+                    return response  # the last response, even a 5xx, goes back to the caller
+                response.close()
+            attempt += 1
+
+    def _backoff(self, attempt):
+        """Wait before retrying; False when out of retries or of time before the deadline."""
+        if attempt >= self.max_retries:
+            return False
+        pause = self.backoff_factor * 2 ** attempt
+        left = deadline.remaining()
+        if left is not None and left <= pause:
+            return False
+        time.sleep(pause)
+        return True
+
+    def _attempt(self, url, params, priority):
+        deadline.check(f"before calling {url}")
+        breaker = circuit.breaker_for(url)
+        breaker.before()  # raises CircuitOpen while the endpoint is failing
+        try:
+            quota.acquire(priority)  # raises QuotaExceeded when over budget
+        except quota.QuotaExceeded:
+            breaker.cancel()
+            raise
+        with self._calls_lock:
+            self.call_count += 1
+
+        # Don't wait past the request deadline
+        read_timeout = deadline.cap(self.read_timeout)
+        started = time.monotonic()
+        ok = False
+        cut_short = False
+        try:
+            response = self.session.get(url, params=params, timeout=(self.connect_timeout, read_timeout))
+            ok = is_healthy(response.status_code)
+            return response
+        except requests.ReadTimeout as e:
+            if read_timeout < self.read_timeout:
+                # Our deadline ran out, not Stormglass's time: no verdict on the endpoint
+                cut_short = True
+                raise deadline.DeadlineExceeded(f"Request deadline exceeded waiting for {url}") from e
+            raise
+        finally:
+            elapsed = time.monotonic() - started
+            if cut_short:
+                breaker.cancel()
+            else:
+                breaker.record(ok, elapsed)
+            timing.observe_upstream(breaker.name, elapsed)
+            if ok:
+                latency(breaker.name).record(elapsed)
+
+    def submit(self, url, params):
+        """Start a GET in the background; returns a Future of the response."""
+        # Context variables don't cross into pool threads; run in a copy of the
+        # caller's context so its priority and request timings carry over
+        return self._executor.submit(contextvars.copy_context().run, self.get, url, params)
+
+    def fetch(self, url, params):
+        """
+        get(), bounded by the request deadline and hedged: if the call hasn't
+        answered within the endpoint's recent p90 latency, an identical one
+        is sent and the first good response wins. The hedge is a quota call
+        at LOW priority, so it is skipped rather than eat into the share
+        reserved for users; the slower call finishes in the background.
+        """
+        calls = [self.submit(url, params)]
+        delay = hedge_delay(url)
+        if delay is not None:
+            done, _ = wait(calls, timeout=deadline.cap(delay))
+            left = deadline.remaining()
+            if not done and (left is None or left > 0):
+                with quota.priority(quota.LOW):
+                    calls.append(self.submit(url, params))
+                metrics.incr('upstream_hedged')
+
+        errors = [None] * len(calls)
+        unhealthy = None
+        pending = set(calls)
+        while pending:
+            done, pending = wait(pending, timeout=deadline.cap(None), return_when=FIRST_COMPLETED)
+            if not done:
+                raise deadline.DeadlineExceeded(f"Request deadline exceeded waiting for {url}")
+            for future in sorted(done, key=calls.index):
+                index = calls.index(future)
+                try:
+                    response = future.result()
+                except Exception as e:
+                    errors[index] = e
+                    continue
+                if is_healthy(response.status_code):
+                    if index:
+                        metrics.incr('upstream_hedge_won')
+                    return response
+                unhealthy = unhealthy or response
+        if unhealthy is not None:
+            return unhealthy  # let the caller report the upstream status
+        raise next(e for e in errors if e is not None)
+
+
+def is_healthy(status_code):
+    """Whether a response counts as a success for the circuit breaker."""
+    return status_code < 500 and status_code != 429
+
+
+class LatencyWindow:
+    """Durations of an endpoint's recent successful calls, for hedging and budgeting."""
+
+    def __init__(self, size=200):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p):
+        """Nearest-rank percentile (0-1), or None until there are enough samples."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples or len(samples) < settings.STORMGLASS_HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, max(0, round(p * len(samples)) - 1))]
+
+
+# Per endpoint (breaker name); shared by the sync and async clients
+_latencies = {}
+
+
+def latency(endpoint):
+    window = _latencies.get(endpoint)
+    if window is None:
+        window = _latencies.setdefault(endpoint, LatencyWindow())
+    return window
+
+
+def expected_latency(url):
+    """How long a call to `url` usually takes (its recent p90), or None if unknown."""
+    return latency(circuit.breaker_for(url).name).percentile(settings.STORMGLASS_HEDGE_PERCENTILE)
+
+
+def hedge_delay(url):
+    """Seconds to wait on a call before hedging it, or None not to hedge."""
+    if not settings.STORMGLASS_HEDGE:
+        return None
+    expected = expected_latency(url)
+    return None if expected is None else max(expected, settings.STORMGLASS_HEDGE_MIN_DELAY)
+
+
+def fits_budget(url):
+    """Whether a call to `url` can be expected to finish before the request deadline."""
+    left = deadline.remaining()
+    if left is None:
+        return True
+    expected = expected_latency(url)
+    return left > (expected or 0)
+
+
+_client = None
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = StormglassClient(
+            api_key=settings.STORMGLASS_API_KEY,
+            connect_timeout=settings.STORMGLASS_CONNECT_TIMEOUT,
+            read_timeout=settings.STORMGLASS_READ_TIMEOUT,
+            max_retries=settings.STORMGLASS_MAX_RETRIES,
+            backoff_factor=settings.STORMGLASS_RETRY_BACKOFF,
+            pool_size=settings.STORMGLASS_POOL_SIZE,
+        )
+    return _client
@@ -0,0 +1,19 @@
+# weather/codec.py
+import json
+import zlib
+
+# Cached weather entries are stored as zlib-compressed compact JSON. Compared
+# with the default pickle of a nested dict this is several times smaller on
+# disk/in the DB, and safe to read back across code versions.
+VERSION = b'\x01'
+
+
+def encode(obj):
+    raw = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+    return VERSION + zlib.compress(raw, 6)
+
+
+def decode(blob):
+    if not isinstance(blob, (bytes, bytearray)) or blob[:1] != VERSION:
+        return None  # unknown/legacy format — treat as a miss
+    return json.loads(zlib.decompress(blob[1:]))
@@ -0,0 +1,63 @@
+# weather/conditional.py
+import hashlib
+import time
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .services import fresh_for
+
+# Conditional GET for responses built from weather cache entries. A response
+# only changes when one of its entries is refetched (or goes stale), so the
+# ETag and Last-Modified are derived from the entries' `fetched_at` and the
+# request URL, and can be checked before any of the body is built. Clients
+# and shared caches may reuse a response until its earliest entry goes stale.
+
+
+class Validators:
+    def __init__(self, etag, last_modified, max_age):
+        self.etag = etag                    # quoted, strong
+        self.last_modified = last_modified  # epoch seconds, or None
+        self.max_age = max_age              # seconds
+
+    def headers(self):
+        headers = {'ETag': self.etag, 'Cache-Control': f"public, max-age={self.max_age}"}
+        if self.last_modified is not None:
+            headers['Last-Modified'] = http_date(self.last_modified)
+        return headers
+
+
+def for_entries(request, entries, hourly=False, vary=()):
+    """
+    Validators for a response built from `entries`, a list of (cache entry or
+    None, is_stale) pairs. `hourly` marks bodies that also move with the
+    current hour (forecasts `?hours=` ahead); `vary` lists any other values
+    the body depends on.
+    """
+    generations = [(entry['fetched_at'] if entry else None, stale) for entry, stale in entries]
+    max_age = min((0 if stale or not entry else max(int(fresh_for(entry)), 0) for entry, stale in entries),
+                  default=0)
+    fetched = [g for g, _ in generations if g is not None]
+    last_modified = int(max(fetched)) if fetched else None
+
+    if hourly:
+        now = time.time()
+        hour = int(now // 3600) * 3600
+        vary = (*vary, hour)
+        last_modified = max(last_modified or 0, hour)
+        max_age = min(max_age, int(hour + 3600 - now))
+
+    key = repr((request.get_full_path(), generations, tuple(vary)))
+    etag = f'"{hashlib.sha1(key.encode()).hexdigest()}"'
+    return Validators(etag, last_modified, max_age)
+
+
+def not_modified(request, validators):
+    """A 304 (with the caching headers) if the client's copy is current, else None."""
+    response = get_conditional_response(
+        request, etag=validators.etag, last_modified=validators.last_modified,
+    )
+    if response is not None:
+        for name, value in validators.headers().items():
+            response[name] = value
+    return response
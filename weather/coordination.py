@@ -0,0 +1,94 @@
+# weather/coordination.py
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+from .models import Counter, Lease
+
+# Cross-process primitives: shared counters (metrics, the upstream quota) and
+# leases (single-flight locks, the refresh throttle). They live in the
+# database rather than the cache: an UPDATE with a condition and an INSERT
+# against a primary key are atomic on every database Django supports, while
+# cache.add/incr are a read followed by a write on the file and DB cache
+# backends, so concurrent workers could all "win" or lose increments.
+
+
+def incr(name, delta=1):
+    """Add `delta` to a counter, creating it on first use."""
+    if Counter.objects.filter(name=name).update(value=F('value') + delta):
+        return
+    try:
+        with transaction.atomic():
+            Counter.objects.create(name=name, value=delta)
+    except IntegrityError:  # another worker created it first
+        Counter.objects.filter(name=name).update(value=F('value') + delta)
+
+
+def incr_below(name, limit, delta=1):
+    """Add `delta` unless the counter would go past `limit`; returns whether it did."""
+    if Counter.objects.filter(name=name, value__lte=limit - delta).update(value=F('value') + delta):
+        return True
+    if delta > limit:
+        return False
+    try:
+        with transaction.atomic():
+            Counter.objects.create(name=name, value=delta)
+        return True
+    except IntegrityError:  # it exists and is at the limit, or was just created
+        return bool(Counter.objects.filter(name=name, value__lte=limit - delta).update(value=F('value') + delta))
+
+
+def advance(name, now, step, slack):
+    """
+    Rate limiting on a counter holding a "theoretical arrival time" (GCRA, an
+    atomic token bucket): if the counter is at most now + slack, move it to
+    max(counter, now) + step and return True. Integers in one unit (e.g. us).
+    """
+    fits = Counter.objects.filter(name=name, value__lte=now + slack)
+    if fits.update(value=Greatest(F('value'), Value(now)) + step):
+        return True
+    try:
+        with transaction.atomic():
+            Counter.objects.create(name=name, value=now + step)
+        return True
+    except IntegrityError:  # it exists and is ahead, or was just created
+        return bool(fits.update(value=Greatest(F('value'), Value(now)) + step))
+
+
+def get_many(names):
+    """{name: value} for counters, 0 for those never incremented."""
+    values = dict(Counter.objects.filter(name__in=names).values_list('name', 'value'))
+    return {name: values.get(name, 0) for name in names}
+
+
+def acquire_lease(name, seconds):
+    """
+    Take the named lease for `seconds`: returns a token for release_lease(),
+    or None while someone else holds it.
+    """
+    token = uuid.uuid4().hex
+    now = time.time()
+    # An expired lease is taken over by whoever updates it first...
+    if Lease.objects.filter(name=name, expires_at__lte=now).update(owner=token, expires_at=now + seconds):
+        return token
+    # ...and a missing one created; the primary key lets only one insert through
+    try:
+        with transaction.atomic():
+            Lease.objects.create(name=name, owner=token, expires_at=now + seconds)
+    except IntegrityError:
+        return None
+    return token
+
+
+def release_lease(name, token):
+    Lease.objects.filter(name=name, owner=token).delete()
+
+
+# For the async views; off the event loop and not serialized on the one
+# thread-sensitive executor
+aacquire_lease = sync_to_async(acquire_lease, thread_sensitive=False)
+arelease_lease = sync_to_async(release_lease, thread_sensitive=False)
@@ -0,0 +1,165 @@
+# weather/crop_engine.py
+from datetime import datetime
+
+import numpy as np
+
+from .crop_rules import CROP_DATABASE, RAINFALL_WEEKLY_RANGE, weekly_rainfall
+
+# Vectorized counterpart of crop_rules.score_crop. CROP_DATABASE is compiled
+# once, at import time, into one array per rule parameter (one slot per crop),
+# so scoring every crop — or many weather records against every crop — is a
+# handful of array operations instead of a Python loop per crop. Results are
+# identical to calling score_crop for each crop.
+
+CROP_NAMES = list(CROP_DATABASE.keys())
+
+_TEMP_MIN = np.array([CROP_DATABASE[c]["temp_min"] for c in CROP_NAMES], dtype=float)
+_TEMP_MAX = np.array([CROP_DATABASE[c]["temp_max"] for c in CROP_NAMES], dtype=float)
+_OPT_LOW = np.array([CROP_DATABASE[c]["temp_optimal"][0] for c in CROP_NAMES], dtype=float)
+_OPT_HIGH = np.array([CROP_DATABASE[c]["temp_optimal"][1] for c in CROP_NAMES], dtype=float)
+_SOIL_MIN = np.array([CROP_DATABASE[c]["soil_moisture_min"] for c in CROP_NAMES], dtype=float)
+_FLOODING = np.array([bool(CROP_DATABASE[c].get("prefers_flooding")) for c in CROP_NAMES])
+_HAS_UV_MAX = np.array([bool(CROP_DATABASE[c].get("uv_max")) for c in CROP_NAMES])
+_UV_MAX = np.array([CROP_DATABASE[c].get("uv_max") or 0 for c in CROP_NAMES], dtype=float)
+# _IN_SEASON[month, crop]: True when the crop has no season restriction or month is in it
+_IN_SEASON = np.array([
+    [not CROP_DATABASE[c].get("suitable_months") or m in CROP_DATABASE[c]["suitable_months"]
+     for c in CROP_NAMES]
+    for m in range(13)
+])
+
+_RAIN_RANGES = [RAINFALL_WEEKLY_RANGE.get(CROP_DATABASE[c].get("rainfall_preference")) for c in CROP_NAMES]
+_HAS_RAIN_RANGE = np.array([r is not None for r in _RAIN_RANGES])
+_RAIN_MIN = np.array([r[0] if r else 0 for r in _RAIN_RANGES], dtype=float)
+_RAIN_MAX = np.array([r[1] if r and r[1] is not None else np.inf for r in _RAIN_RANGES], dtype=float)
+
+# Raw values for reason strings, so they format exactly as score_crop's do
+_RAW_TEMP_MIN = [CROP_DATABASE[c]["temp_min"] for c in CROP_NAMES]
+_RAW_TEMP_MAX = [CROP_DATABASE[c]["temp_max"] for c in CROP_NAMES]
+
+
+def _inputs(records):
+    """Column vectors (records x 1) of the weather fields score_crop reads."""
+    temp = np.array([[r['temperature']['air']] for r in records], dtype=float)
+    soil = np.array([[r.get('soil_moisture') or 0.2] for r in records], dtype=float)
+    rain = np.array([[r['rainfall']] for r in records], dtype=float)
+    uv = np.array([[r['uv_index']] for r in records], dtype=float)
+    return temp, soil, rain, uv
+
+
+def _outlook_inputs(outlooks):
+    """Column vectors of the outlook fields score_crop reads (NaN = not given)."""
+    def column(value):
+        return np.array([[np.nan if v is None else v] for v in map(value, outlooks)], dtype=float)
+
+    low = column(lambda o: o.get('temperature_min') if o else None)
+    high = column(lambda o: o.get('temperature_max') if o else None)
+    weekly_rain = column(lambda o: weekly_rainfall(o) if o else None)
+    return low, high, weekly_rain
+
+
+def score_matrix(records, month=None, outlooks=None):
+    """
+    Score many weather records against every crop in one pass.
+    `outlooks` optionally gives each record's forecast outlook (or None).
+    Returns one list per record, each with one score_crop-shaped dict per crop
+    (in CROP_DATABASE order).
+    """
+    if not records:
+        return []
+    month = datetime.utcnow().month if month is None else month
+    outlooks = outlooks or [None] * len(records)
+    temp, soil, rain, uv = _inputs(records)
+    low, high, weekly_rain = _outlook_inputs(outlooks)
+
+    # 1. Temperature suitability
+    cold = temp < _TEMP_MIN
+    hot = ~cold & (temp > _TEMP_MAX)
+    sub_optimal = ~cold & ~hot & ~((_OPT_LOW <= temp) & (temp <= _OPT_HIGH))
+    distance = np.minimum(np.abs(temp - _OPT_LOW), np.abs(temp - _OPT_HIGH))
+    temp_penalty = np.where(cold, np.minimum((_TEMP_MIN - temp) * 5, 60),
+                   np.where(hot, np.minimum((temp - _TEMP_MAX) * 4, 60),
+                   np.where(sub_optimal, distance * 3, 0.0)))
+
+    # 2. Soil moisture
+    dry = soil < _SOIL_MIN
+    soil_penalty = np.where(dry, (_SOIL_MIN - soil) * 200, 0.0)
+
+    # 3. Rainfall / Water preference
+    needs_water = _FLOODING & (rain < 2)
+
+    # 4. UV stress
+    uv_stress = _HAS_UV_MAX & (uv > _UV_MAX)
+    uv_penalty = np.where(uv_stress, (uv - _UV_MAX) * 8, 0.0)
+
+    # 5. Seasonal check
+    off_season = np.broadcast_to(~_IN_SEASON[month], temp_penalty.shape)
+
+    # 6. Outlook over the forecast window (NaN compares False: no outlook, no penalty)
+    cold_ahead = low < _TEMP_MIN
+    cold_ahead_penalty = np.where(cold_ahead, np.minimum((_TEMP_MIN - low) * 2, 20), 0.0)
+    heat_ahead = high > _TEMP_MAX
+    heat_ahead_penalty = np.where(heat_ahead, np.minimum((high - _TEMP_MAX) * 2, 20), 0.0)
+    too_dry = _HAS_RAIN_RANGE & (weekly_rain < _RAIN_MIN)
+    too_wet = _HAS_RAIN_RANGE & ~too_dry & (weekly_rain > _RAIN_MAX)
+    rain_penalty = np.where(too_dry, np.minimum((_RAIN_MIN - weekly_rain) * 0.5, 15),
+                   np.where(too_wet, np.minimum((weekly_rain - _RAIN_MAX) * 0.5, 15), 0.0))
+
+    # Subtract in score_crop's order so floating-point results match exactly
+    scores = 100.0 - temp_penalty
+    scores = scores - soil_penalty
+    scores = scores - np.where(needs_water, 20.0, 0.0)
+    scores = scores - uv_penalty
+    scores = scores - np.where(off_season, 40.0, 0.0)
+    scores = scores - cold_ahead_penalty
+    scores = scores - heat_ahead_penalty
+    scores = scores - rain_penalty
+
+    # Reasons are strings, so they are assembled per crop — from plain lists,
+    # which index far faster than numpy scalars
+    (scores, cold, hot, sub_optimal, dry, needs_water, uv_stress, off_season,
+     cold_ahead, heat_ahead, too_dry, too_wet) = (
+        np.broadcast_to(a, scores.shape).tolist()
+        for a in (scores, cold, hot, sub_optimal, dry, needs_water, uv_stress, off_season,
+                  cold_ahead, heat_ahead, too_dry, too_wet)
+    )
+
+    results = []
+    for r, record in enumerate(records):
+        row = []
+        for c, crop_name in enumerate(CROP_NAMES):
+            reasons = []
+            if cold[r][c]:
+                reasons.append(f"Too cold ({record['temperature']['air']}°C < {_RAW_TEMP_MIN[c]}°C)")
+            elif hot[r][c]:
+                reasons.append(f"Too hot ({record['temperature']['air']}°C > {_RAW_TEMP_MAX[c]}°C)")
+            elif sub_optimal[r][c]:
+                reasons.append("Sub-optimal temperature")
+            if dry[r][c]:
+                reasons.append("Soil too dry")
+            if needs_water[r][c]:
+                reasons.append("Needs standing water (e.g., rice)")
+            if uv_stress[r][c]:
+                reasons.append("High UV stress")
+            if off_season[r][c]:
+                reasons.append("Wrong planting season")
+            if cold_ahead[r][c]:
+                reasons.append(f"Cold spell ahead (min {outlooks[r]['temperature_min']}°C)")
+            if heat_ahead[r][c]:
+                reasons.append(f"Heat stress ahead (max {outlooks[r]['temperature_max']}°C)")
+            if too_dry[r][c]:
+                reasons.append("Too little rain forecast")
+            elif too_wet[r][c]:
+                reasons.append("Too much rain forecast")
+            row.append({
+                "crop": crop_name,
+                "score": round(max(0, scores[r][c]), 1),
+                "reasons": reasons[:3] if reasons else ["Good conditions"]
+            })
+        results.append(row)
+    return results
+
+
+def score_all(weather_data, month=None, outlook=None):
+    """Every crop scored against one weather record (CROP_DATABASE order)."""
+    return score_matrix([weather_data], month=month, outlooks=[outlook])[0]
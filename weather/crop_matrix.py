@@ -0,0 +1,77 @@
+# weather/crop_matrix.py
+import hashlib
+from datetime import datetime
+
+from django.core.cache import cache
+
+from locations.registry import get_registry
+from .crop_engine import CROP_NAMES, score_matrix
+from .services import cached_entries_many, entry_outlook, fresh_for, iter_weather_many
+
+MATRIX_CACHE_KEY = 'crop_matrix_nigeria'
+
+
+def nigeria_crop_matrix():
+    """
+    Suitability of every crop in every Nigerian state, as (body, etag,
+    entries); `entries` are the (weather entry or None, is_stale) pairs it
+    was scored from, for conditional.for_entries.
+
+    Rows are kept in the cache with the `fetched_at` of the weather entry they
+    were scored from; on each call only states whose cached weather changed
+    since are re-scored (in one vectorized pass). The ETag is derived from
+    those generations, so an unchanged matrix is recognised without building
+    the response body.
+    """
+    coords = {s.name: (s.lat, s.lon) for s in get_registry().states}
+
+    # One cache read; states that aren't fresh in it go through the bounded
+    # fan-out, where stale ones are served as they are and schedule a refresh
+    entries = cached_entries_many(coords)
+    stale = {name for name, entry in entries.items() if entry and fresh_for(entry) <= 0}
+    errors = {name: error for name, _, error in iter_weather_many(coords, entries=entries) if error}
+    # Only misses that were fetched have new entries to read back
+    fetched = {name: coords[name] for name, entry in entries.items() if entry is None and name not in errors}
+    if fetched:
+        entries.update(cached_entries_many(fetched))
+    looked_up = {name: (entry, name in stale) if entry else (None, False) for name, entry in entries.items()}
+
+    month = datetime.utcnow().month  # seasonal rules make scores month-dependent
+    generations = [(name, entries[name]['fetched_at'] if entries[name] else None) for name in coords]
+    etag = hashlib.sha1(repr((month, CROP_NAMES, generations)).encode()).hexdigest()
+
+    previous = cache.get(MATRIX_CACHE_KEY)
+    if previous and previous['etag'] == etag:
+        return previous['body'], etag, list(looked_up.values())
+
+    rows = previous['rows'] if previous and previous['month'] == month else {}
+    changed = [
+        name for name, generation in generations
+        if generation is not None and rows.get(name, {}).get('generation') != generation
+    ]
+    scored = score_matrix(
+        [entries[name]['data'] for name in changed],
+        month=month,
+        outlooks=[entry_outlook(entries[name]) for name in changed],
+    )
+    for name, results in zip(changed, scored):
+        rows[name] = {
+            'generation': entries[name]['fetched_at'],
+            'timestamp': entries[name]['data']['timestamp'],
+            'scores': [r['score'] for r in results],
+        }
+
+    locations = []
+    for name, (lat, lon) in coords.items():
+        row = {"state": name, "lat": lat, "lon": lon}
+        if name in rows and entries[name]:
+            row["timestamp"] = rows[name]['timestamp']
+            row["scores"] = rows[name]['scores']
+        else:
+            row["error"] = errors.get(name, "Weather unavailable")
+        locations.append(row)
+
+    body = {"crops": CROP_NAMES, "locations": locations}
+    rows = {name: row for name, row in rows.items() if name in coords}
+    cache.set(MATRIX_CACHE_KEY, {'etag': etag, 'month': month, 'rows': rows, 'body': body}, timeout=None)
+    return body, etag, list(looked_up.values())
@@ -72,10 +72,30 @@ CROP_DATABASE = {
     }
 }
 
+# Rainfall (mm per 7 days) each rainfall_preference is comfortable with;
+# None = no upper limit
+RAINFALL_WEEKLY_RANGE = {
+    "low": (0, 30),
+    "low_to_moderate": (10, 50),
+    "moderate": (20, 80),
+    "high": (50, None),
+}
+
+
+def weekly_rainfall(forecast_7day):
+    """Forecast rainfall scaled to a 7-day total, or None if the window is under a day."""
+    hours = forecast_7day.get('hours') or 0
+    if hours < 24:
+        return None
+    return forecast_7day['rainfall_total'] * 168 / hours
+
+
 def score_crop(crop_name, weather_data, forecast_7day=None):
     """
     Returns suitability score 0–100 for a crop given current weather.
     Higher = better to plant now.
+    `forecast_7day` is an outlook dict (see weather.forecast.outlook); when
+    given, cold/heat spells and rainfall over the window are scored too.
     """
     crop = CROP_DATABASE[crop_name]
     score = 100.0
@@ -126,6 +146,28 @@ def score_crop(crop_name, weather_data, forecast_7day=None):
         score -= 40
         reasons.append("Wrong planting season")
 
+    # 6. Outlook over the forecast window
+    if forecast_7day:
+        low = forecast_7day.get('temperature_min')
+        high = forecast_7day.get('temperature_max')
+        if low is not None and low < crop["temp_min"]:
+            score -= min((crop["temp_min"] - low) * 2, 20)
+            reasons.append(f"Cold spell ahead (min {low}°C)")
+        if high is not None and high > crop["temp_max"]:
+            score -= min((high - crop["temp_max"]) * 2, 20)
+            reasons.append(f"Heat stress ahead (max {high}°C)")
+
+        rain_range = RAINFALL_WEEKLY_RANGE.get(crop.get("rainfall_preference"))
+        weekly_rain = weekly_rainfall(forecast_7day)
+        if rain_range and weekly_rain is not None:
+            rain_min, rain_max = rain_range
+            if weekly_rain < rain_min:
+                score -= min((rain_min - weekly_rain) * 0.5, 15)
+                reasons.append("Too little rain forecast")
+            elif rain_max is not None and weekly_rain > rain_max:
+                score -= min((weekly_rain - rain_max) * 0.5, 15)
+                reasons.append("Too much rain forecast")
+
     score = max(0, score)
     return {
         "crop": crop_name,
@@ -0,0 +1,82 @@
+# weather/deadline.py
+import contextlib
+import contextvars
+import functools
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+
+from .quota import UpstreamUnavailable
+
+# How long the current request may still wait on upstream work. Views set a
+# budget with within(); the Stormglass clients, single-flight waits and the
+# agriculture call read it (remaining()) and give up, or skip optional work,
+# rather than keep a user waiting past it. Like quota.priority, it lives in a
+# context variable, so pool threads running in a copy of the request's
+# context and asyncio tasks inherit it. Background refreshes have none.
+
+_deadline = contextvars.ContextVar('upstream_deadline', default=None)  # time.monotonic() value
+
+
+class DeadlineExceeded(UpstreamUnavailable):
+    pass
+
+
+@contextlib.contextmanager
+def within(seconds):
+    """Run the block with at most `seconds` left (an earlier enclosing deadline wins)."""
+    at = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(at if current is None else min(at, current))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def bounded(view):
+    """Run a (sync or async) view within WEATHER_REQUEST_DEADLINE."""
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            with within(settings.WEATHER_REQUEST_DEADLINE):
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            with within(settings.WEATHER_REQUEST_DEADLINE):
+                return view(*args, **kwargs)
+    return wrapper
+
+
+@contextlib.contextmanager
+def lifted():
+    """Run the block without a deadline, for work that outlives the request."""
+    token = _deadline.set(None)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left (<= 0 once passed), or None when there is no deadline."""
+    at = _deadline.get()
+    return None if at is None else at - time.monotonic()
+
+
+def cap(seconds):
+    """`seconds` (None for no limit) limited to the time left, never below 0."""
+    left = remaining()
+    if left is None:
+        return seconds
+    left = max(left, 0)
+    return left if seconds is None else min(seconds, left)
+
+
+def check(what):
+    """Raise DeadlineExceeded if the deadline has passed."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Request deadline exceeded {what}")
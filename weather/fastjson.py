@@ -0,0 +1,146 @@
+# weather/fastjson.py
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.http import HttpResponse
+from rest_framework import serializers
+from rest_framework.fields import _UnvalidatedField, empty
+from rest_framework.utils.encoders import JSONEncoder
+
+from . import timing
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder is used instead
+    orjson = None
+
+# Fast path for the hot read endpoints. The payloads they return are dicts
+# that fetch_weather and the crop engine already built, so running them
+# through DRF serializers field by field (and DRF's renderer) on every request
+# is wasted work. Instead:
+# - compile() turns a serializer class into a plain function that produces
+#   the same representation, following the same field rules
+# - dumps() renders with orjson when installed (DRF's encoder otherwise)
+# - RenderCache keeps finished response bodies per ETag, i.e. per location
+#   and cache generation (see weather.conditional), so a body is rendered
+#   once per fetch rather than once per request
+
+
+def _converter(field):
+    """Fast equivalent of field.to_representation for non-None values."""
+    if isinstance(field, serializers.ListSerializer):
+        child = _converter(field.child)
+        return lambda data: [child(item) for item in data]
+    if isinstance(field, serializers.Serializer):
+        return compile(field)
+    if isinstance(field, serializers.FloatField):
+        return float
+    if isinstance(field, serializers.IntegerField):
+        return int
+    if isinstance(field, serializers.CharField):
+        return str
+    if isinstance(field, serializers.DictField):
+        child = _converter(field.child)
+        return lambda value: {str(k): child(v) if v is not None else None for k, v in value.items()}
+    if isinstance(field, serializers.ListField):
+        child = _converter(field.child)
+        return lambda data: [child(item) if item is not None else None for item in data]
+    if isinstance(field, (serializers.DateTimeField, serializers.DateField)):
+        # Our payloads carry ISO strings, which DRF passes through as is
+        return lambda value: value if isinstance(value, str) else field.to_representation(value)
+    if isinstance(field, _UnvalidatedField):  # DictField/ListField children without a type
+        return lambda value: value
+    return field.to_representation
+
+
+def compile(serializer):
+    """
+    A function rendering a dict the way `serializer` (a Serializer class or
+    instance, many=True for lists) would, minus per-call field setup.
+    """
+    if isinstance(serializer, type):
+        serializer = serializer()
+    if isinstance(serializer, serializers.ListSerializer):
+        return _converter(serializer)
+    plan = [
+        (field.field_name, field.source, _converter(field), field.default, field.allow_null, field.required)
+        for field in serializer._readable_fields
+    ]
+
+    def render(instance):
+        ret = {}
+        for name, source, convert, default, allow_null, required in plan:
+            try:
+                value = instance[source]
+            except KeyError:
+                # Same fallbacks, in the same order, as Field.get_attribute
+                if default is not empty:
+                    value = default() if callable(default) else default
+                elif allow_null:
+                    value = None
+                elif not required:
+                    continue
+                else:
+                    raise
+            ret[name] = None if value is None else convert(value)
+        return ret
+
+    return render
+
+
+_encoder = JSONEncoder()
+
+
+def dumps(data):
+    """Compact UTF-8 JSON bytes, as DRF's JSONRenderer would produce."""
+    with timing.stage('render'):
+        if orjson is not None:
+            # Let DRF's encoder handle Decimals and datetimes so output matches
+            return orjson.dumps(data, default=_encoder.default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        return _encoder.__class__(ensure_ascii=False, separators=(',', ':')).encode(data).encode()
+
+
+def response(body, status=200, headers=None):
+    return HttpResponse(body, status=status, content_type='application/json', headers=headers)
+
+
+class RenderCache:
+    """Bounded in-process LRU of rendered bodies, keyed by ETag."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def put(self, key, body):
+        with self._lock:
+            self._bodies[key] = body
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.max_entries:
+                self._bodies.popitem(last=False)
+        return body
+
+    def render(self, key, build):
+        """Cached body for `key`, or dumps(build()) stored under it."""
+        body = self.get(key)
+        if body is None:
+            body = self.put(key, dumps(build()))
+        return body
+
+
+_bodies = None
+
+
+def rendered():
+    global _bodies
+    if _bodies is None:
+        _bodies = RenderCache(settings.WEATHER_RENDER_CACHE_SIZE)
+    return _bodies
@@ -0,0 +1,145 @@
+# weather/forecast.py
+import bisect
+import time
+from datetime import datetime, timezone
+
+# The full hourly payload from Stormglass is kept in columnar form: one list
+# per parameter, aligned on a shared list of epoch-second timestamps, e.g.
+#   {'time': [t0, t1, ...], 'airTemperature': [24.1, 23.8, ...], ...}
+# Agriculture columns (soilMoisture, soilTemperature, uvIndex) are only
+# present when the agriculture request succeeded.
+AGRI_PARAMS = ['soilMoisture', 'soilTemperature', 'uvIndex']
+
+
+def to_epoch(iso):
+    """Epoch seconds for an ISO 8601 timestamp as Stormglass sends them."""
+    return int(datetime.fromisoformat(iso.replace('Z', '+00:00')).timestamp())
+
+
+def to_iso(epoch):
+    """ISO 8601 (UTC) for epoch seconds."""
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).isoformat()
+
+
+def build_series(hours, params, agri_hours=None):
+    """Columnar series from Stormglass `hours` lists (weather + optional agriculture)."""
+    series = {'time': [to_epoch(h['time']) for h in hours]}
+    for param in params:
+        series[param] = [h.get(param, {}).get('sg') for h in hours]
+
+    if agri_hours is not None:
+        agri_times = [to_epoch(h['time']) for h in agri_hours]
+        for param in AGRI_PARAMS:
+            values = [h.get(param, {}).get('sg') for h in agri_hours]
+            # Align on weather hours: latest agriculture reading at or before
+            # each hour, or the first reading for hours before it starts
+            column = []
+            for t in series['time']:
+                i = bisect.bisect_right(agri_times, t) - 1
+                column.append(values[max(i, 0)] if values else None)
+            series[param] = column
+    return series
+
+
+def current_index(series, now=None):
+    """Index of the latest hour at or before now (the first hour if all are later)."""
+    now = time.time() if now is None else now
+    return max(bisect.bisect_right(series['time'], now) - 1, 0)
+
+
+def horizon(series, now=None):
+    """How many hours ahead of the current hour the series reaches."""
+    return len(series['time']) - 1 - current_index(series, now)
+
+
+def conditions_at(series, index):
+    """Weather dict (the fetch_weather shape) for one hour of the series."""
+    air = series['airTemperature'][index]
+    if 'uvIndex' in series:
+        soil_moisture = series['soilMoisture'][index]
+        soil_temp = series['soilTemperature'][index]
+        uv_index = series['uvIndex'][index]
+        if uv_index is None:
+            uv_index = 0  # fallback to 0 if missing
+    else:
+        soil_moisture = soil_temp = None
+        uv_index = 3  # safe fallback when the agriculture API failed
+
+    return {
+        'timestamp': to_iso(series['time'][index]),
+        'temperature': {
+            'air': air,
+            'soil': soil_temp or round(air - 3, 1)  # rough estimate
+        },
+        'humidity': series['humidity'][index],
+        'rainfall': series['precipitation'][index],
+        'wind_speed': series['windSpeed'][index],
+        'uv_index': uv_index,
+        'soil_moisture': soil_moisture or 0.25,  # fallback estimate
+    }
+
+
+def daily_aggregates(series):
+    """Per-UTC-day summaries of the hourly series, oldest first."""
+    days = {}
+    for i, t in enumerate(series['time']):
+        day = datetime.fromtimestamp(t, tz=timezone.utc).date().isoformat()
+        days.setdefault(day, []).append(i)
+
+    def values(param, idx):
+        return [series[param][i] for i in idx if series[param][i] is not None]
+
+    daily = []
+    for day, idx in days.items():
+        temps = values('airTemperature', idx)
+        humidity = values('humidity', idx)
+        rain = values('precipitation', idx)
+        wind = values('windSpeed', idx)
+        daily.append({
+            'date': day,
+            'hours': len(idx),
+            'temperature_min': min(temps) if temps else None,
+            'temperature_max': max(temps) if temps else None,
+            'temperature_mean': round(sum(temps) / len(temps), 1) if temps else None,
+            'humidity_mean': round(sum(humidity) / len(humidity), 1) if humidity else None,
+            'rainfall_total': round(sum(rain), 2),  # precipitation is mm/h
+            'wind_speed_max': max(wind) if wind else None,
+        })
+    return daily
+
+
+def outlook(series, start_index=None, hours=168, base_temperature=10.0):
+    """
+    Rolling aggregates over the next `hours` of the series (default 7 days),
+    computed in one pass: cumulative rainfall, min/max/mean air temperature
+    and growing degree-days above `base_temperature`.
+    """
+    start_index = current_index(series) if start_index is None else start_index
+    temps = series['airTemperature']
+    rain = series['precipitation']
+
+    count = temp_count = 0
+    rain_total = degree_hours = temp_sum = 0.0
+    temp_min = temp_max = None
+    for i in range(start_index, min(start_index + hours, len(series['time']))):
+        count += 1
+        if rain[i] is not None:
+            rain_total += rain[i]
+        t = temps[i]
+        if t is None:
+            continue
+        temp_count += 1
+        temp_sum += t
+        temp_min = t if temp_min is None or t < temp_min else temp_min
+        temp_max = t if temp_max is None or t > temp_max else temp_max
+        if t > base_temperature:
+            degree_hours += t - base_temperature
+
+    return {
+        'hours': count,
+        'rainfall_total': round(rain_total, 2),
+        'temperature_min': temp_min,
+        'temperature_max': temp_max,
+        'temperature_mean': round(temp_sum / temp_count, 1) if temp_count else None,
+        'degree_days': round(degree_hours / 24, 1),
+    }
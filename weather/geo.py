@@ -0,0 +1,124 @@
+# weather/geo.py
+import bisect
+import heapq
+import math
+
+from django.conf import settings
+
+
+def quantize(lat, lon, resolution=None):
+    """
+    Snap a coordinate to the centre of its grid cell. Upstream models only
+    resolve weather per grid cell, so points inside one cell share a cache key.
+    The key depends on the coordinate alone, so every worker agrees on it.
+    A resolution of 0 disables snapping.
+    """
+    resolution = settings.WEATHER_GRID_RESOLUTION if resolution is None else resolution
+    lat, lon = float(lat), float(lon)
+    if not resolution:
+        return lat, lon
+    return (
+        round(round(lat / resolution) * resolution, 6),
+        round(round(lon / resolution) * resolution, 6),
+    )
+
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points, in km."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def _unit_vector(lat, lon):
+    lat, lon = math.radians(lat), math.radians(lon)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+class PointIndex:
+    """
+    Static spatial index over (lat, lon, item) points.
+
+    Nearest-neighbour queries use a 3-d tree over points on the unit sphere:
+    straight-line (chord) distance orders points exactly as great-circle
+    distance does, with no special cases at the poles or the antimeridian.
+    Bounding-box queries bisect a latitude-sorted list. Both touch O(log n)
+    points plus the results, so lookups stay in microseconds for thousands
+    of points.
+    """
+
+    def __init__(self, points):
+        self._points = [(float(lat), float(lon), item) for lat, lon, item in points]
+        self._vectors = [_unit_vector(lat, lon) for lat, lon, _ in self._points]
+        self._tree = self._build(list(range(len(self._points))))
+
+        by_lat = sorted(range(len(self._points)), key=lambda i: self._points[i][0])
+        self._lats = [self._points[i][0] for i in by_lat]
+        self._by_lat = by_lat
+
+    def __len__(self):
+        return len(self._points)
+
+    def _build(self, indices):
+        # Node: (point index, split axis, left subtree, right subtree)
+        if not indices:
+            return None
+        # Split on the axis the points spread most along: in a small region
+        # of the sphere one of the three barely varies
+        axis = max(range(3), key=lambda a: (max(self._vectors[i][a] for i in indices)
+                                            - min(self._vectors[i][a] for i in indices)))
+        indices.sort(key=lambda i: self._vectors[i][axis])
+        mid = len(indices) // 2
+        return (indices[mid], axis,
+                self._build(indices[:mid]),
+                self._build(indices[mid + 1:]))
+
+    def nearest(self, lat, lon, k=1, max_km=None):
+        """Up to k (distance_km, item) pairs, closest first, optionally within max_km."""
+        if k <= 0 or self._tree is None:
+            return []
+        target = _unit_vector(lat, lon)
+        # Chord length bound equivalent to max_km along the surface
+        bound = (2 * math.sin(min(max_km / EARTH_RADIUS_KM, math.pi) / 2)) ** 2 if max_km is not None else math.inf
+        best = []  # max-heap of (-squared chord, index)
+
+        def visit(node):
+            if node is None:
+                return
+            i, axis, left, right = node
+            v = self._vectors[i]
+            d = (v[0] - target[0]) ** 2 + (v[1] - target[1]) ** 2 + (v[2] - target[2]) ** 2
+            limit = -best[0][0] if len(best) == k else bound
+            if d <= limit:
+                if len(best) == k:
+                    heapq.heapreplace(best, (-d, i))
+                else:
+                    heapq.heappush(best, (-d, i))
+            diff = target[axis] - v[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+            visit(near)
+            limit = -best[0][0] if len(best) == k else bound
+            if diff * diff <= limit:
+                visit(far)
+
+        visit(self._tree)
+        results = []
+        for _, i in sorted(best, reverse=True):
+            p_lat, p_lon, item = self._points[i]
+            results.append((haversine_km(lat, lon, p_lat, p_lon), item))
+        return results
+
+    def within(self, south, west, north, east):
+        """Items inside a bounding box (west > east means it crosses the antimeridian)."""
+        lo = bisect.bisect_left(self._lats, south)
+        hi = bisect.bisect_right(self._lats, north)
+        results = []
+        for i in self._by_lat[lo:hi]:
+            p_lon = self._points[i][1]
+            inside = west <= p_lon <= east if west <= east else (p_lon >= west or p_lon <= east)
+            if inside:
+                results.append(self._points[i][2])
+        return results
@@ -0,0 +1,86 @@
+# weather/management/commands/cache_stats.py
+import glob
+import os
+
+from django.core.cache import caches
+from django.core.cache.backends.db import DatabaseCache
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+
+from weather import metrics, quota
+from weather.circuit import endpoint_name
+from weather.providers import AGRI_URL, BASE_URL
+
+
+def backend_usage():
+    """(entry count, bytes in use) for the default cache, or (None, None) if unknown."""
+    target = caches['default']
+
+    if isinstance(target, FileBasedCache):
+        files = glob.glob(os.path.join(target._dir, f"*{target.cache_suffix}"))
+        return len(files), sum(os.path.getsize(f) for f in files)
+
+    if isinstance(target, DatabaseCache):
+        db = router.db_for_read(target.cache_model_class)
+        table = connections[db].ops.quote_name(target._table)
+        with connections[db].cursor() as cursor:
+            cursor.execute(f"SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM {table}")
+            count, size = cursor.fetchone()
+        return count, size
+
+    if isinstance(target, LocMemCache):
+        return len(target._cache), sum(len(v) for v in target._cache.values())
+
+    return None, None
+
+
+class Command(BaseCommand):
+    help = "Report weather cache hit rate, entry count and bytes in use."
+
+    def handle(self, *args, **options):
+        counters = metrics.get_many([
+            'weather_cache_hit', 'weather_cache_stale', 'weather_cache_miss',
+            'weather_fetch_executed', 'weather_fetch_coalesced_local', 'weather_fetch_coalesced_remote',
+        ])
+        hits, stale, misses = (counters['weather_cache_hit'], counters['weather_cache_stale'],
+                               counters['weather_cache_miss'])
+        lookups = hits + stale + misses
+
+        self.stdout.write(f"Backend:       {type(caches['default']).__name__}")
+        if lookups:
+            self.stdout.write(f"Hit rate:      {100.0 * (hits + stale) / lookups:.1f}% "
+                              f"({hits} fresh, {stale} stale, {misses} misses)")
+        else:
+            self.stdout.write("Hit rate:      n/a (no lookups recorded)")
+
+        count, size = backend_usage()
+        if count is None:
+            self.stdout.write("Entries:       n/a for this backend")
+        else:
+            self.stdout.write(f"Entries:       {count}")
+            self.stdout.write(f"Bytes in use:  {size} ({size / 1024:.1f} KiB)")
+
+        self.stdout.write(
+            f"Upstream fetches: {counters['weather_fetch_executed']} executed, "
+            f"{counters['weather_fetch_coalesced_local'] + counters['weather_fetch_coalesced_remote']} coalesced"
+        )
+
+        q = quota.status()
+        if q['daily_quota']:
+            self.stdout.write(
+                f"Upstream quota: {q['used_today']}/{q['daily_quota']} used today, "
+                f"{q['remaining_today']} remaining, TTL x{q['ttl_multiplier']}"
+            )
+        self.stdout.write(
+            f"Upstream calls: {q['upstream_calls']} made, "
+            f"{q['rejected_daily']} rejected (daily), {q['rejected_rate']} rejected (rate)"
+        )
+
+        names = [endpoint_name(url) for url in (BASE_URL, AGRI_URL)]
+        breakers = metrics.get_many([f"circuit_{n}_{event}" for n in names for event in ('opened', 'rejected')])
+        self.stdout.write("Circuits: " + ", ".join(
+            f"{n} opened {breakers[f'circuit_{n}_opened']}x, {breakers[f'circuit_{n}_rejected']} rejected"
+            for n in names
+        ))
@@ -0,0 +1,91 @@
+# weather/management/commands/warm_weather_cache.py
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from locations.models import State
+from weather import quota
+from weather.client import get_client
+from weather.countries import SELECTED_COUNTRIES
+from weather.geo import quantize
+from weather.nigerian_states import NIGERIA_STATES
+from weather.services import fresh_for, get_cache_entry, refresh_weather
+
+
+def known_coordinates():
+    """Every grid cell we serve, deduplicated, mapped to a display label."""
+    coords = {}
+    for continent, locations in SELECTED_COUNTRIES.items():
+        for name, c in locations.items():
+            coords.setdefault(quantize(c['lat'], c['lon']), f"{continent} / {name}")
+    for name, c in NIGERIA_STATES.items():
+        coords.setdefault(quantize(c['lat'], c['lon']), f"Nigeria / {name}")
+    for state in State.objects.all():
+        coords.setdefault(quantize(state.latitude, state.longitude), f"State / {state.name}")
+    return coords
+
+
+class Command(BaseCommand):
+    help = "Pre-fetch weather for every known location so user requests hit a warm cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep running, warming once every --interval seconds.")
+        parser.add_argument('--interval', type=int, default=settings.WEATHER_WARM_INTERVAL,
+                            help="Seconds between runs in --loop mode.")
+        parser.add_argument('--rate', type=float, default=settings.WEATHER_WARM_RATE,
+                            help="Max locations fetched per second.")
+        parser.add_argument('--max-calls', type=int, default=settings.WEATHER_WARM_MAX_CALLS,
+                            help="Upstream call budget per run (0 = unlimited).")
+        parser.add_argument('--refresh-margin', type=int, default=settings.WEATHER_WARM_REFRESH_MARGIN,
+                            help="Refresh entries this many seconds before they stop being fresh.")
+
+    def handle(self, *args, **options):
+        while True:
+            self.warm(options)
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+    def warm(self, options):
+        client = get_client()
+        calls_before = client.call_count
+        started = time.monotonic()
+        min_gap = 1.0 / options['rate'] if options['rate'] > 0 else 0
+
+        warmed = skipped = failed = 0
+        last_fetch = 0.0
+        for (lat, lon), label in known_coordinates().items():
+            # Only spend quota on entries that are missing or about to go stale
+            # (fresh_for stretches with quota.ttl_multiplier when quota runs low)
+            entry = get_cache_entry(lat, lon)
+            if entry and fresh_for(entry) > options['refresh_margin']:
+                skipped += 1
+                continue
+
+            if options['max_calls'] and client.call_count - calls_before >= options['max_calls']:
+                self.stderr.write(f"Upstream call budget ({options['max_calls']}) reached, stopping run.")
+                break
+
+            wait = min_gap - (time.monotonic() - last_fetch)
+            if wait > 0:
+                time.sleep(wait)
+            last_fetch = time.monotonic()
+
+            try:
+                with quota.priority(quota.LOW):  # never eat into the user reserve
+                    refresh_weather(lat, lon)
+                warmed += 1
+            except quota.QuotaExceeded as e:
+                self.stderr.write(f"{e}; stopping run.")
+                break
+            except Exception as e:
+                failed += 1
+                self.stderr.write(f"Failed to warm {label}: {e}")
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            f"Warmed {warmed}, skipped {skipped} fresh, {failed} failed "
+            f"in {elapsed:.1f}s using {client.call_count - calls_before} upstream calls."
+        )
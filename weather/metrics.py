@@ -0,0 +1,72 @@
+# weather/metrics.py
+import atexit
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import DatabaseError, close_old_connections
+
+from . import coordination
+
+logger = logging.getLogger(__name__)
+
+# Counters are shared (database) counters, see weather.coordination, so every
+# worker process adds to the same totals. Increments are buffered in memory
+# and flushed at most once per FLUSH_INTERVAL by a background thread, so
+# counting a cache hit doesn't cost a write, nor block the event loop when
+# counted from async code. What's left is flushed when the process exits.
+PREFIX = 'metrics'
+FLUSH_INTERVAL = 1.0
+
+_lock = threading.Lock()
+_pending = {}
+_last_flush = time.monotonic()
+
+
+def incr(name, delta=1):
+    global _last_flush
+    with _lock:
+        _pending[name] = _pending.get(name, 0) + delta
+        if time.monotonic() - _last_flush < FLUSH_INTERVAL:
+            return
+        _last_flush = time.monotonic()
+    try:
+        _flusher.submit(_background_flush)
+    except RuntimeError:
+        pass  # interpreter shutting down; the exit flush picks these up
+
+
+def flush():
+    with _lock:
+        pending = dict(_pending)
+        _pending.clear()
+    for name, delta in pending.items():
+        try:
+            coordination.incr(f"{PREFIX}:{name}", delta)
+        except DatabaseError as e:
+            # Keep the increment for the next flush rather than fail the request
+            with _lock:
+                _pending[name] = _pending.get(name, 0) + delta
+            logger.warning("Flushing metric %s failed: %s", name, e)
+
+
+def _background_flush():
+    try:
+        flush()
+    finally:
+        close_old_connections()
+
+
+_flusher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='metrics-flush')
+atexit.register(flush)
+
+
+def get(name):
+    return get_many([name])[name]
+
+
+def get_many(names):
+    flush()
+    values = coordination.get_many([f"{PREFIX}:{name}" for name in names])
+    return {name: values[f"{PREFIX}:{name}"] for name in names}
@@ -0,0 +1,34 @@
+# weather/migrations/0001_initial.py
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Observation',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('latitude', models.FloatField()),
+                ('longitude', models.FloatField()),
+                ('timestamp', models.DateTimeField()),
+                ('air_temperature', models.FloatField(null=True)),
+                ('humidity', models.FloatField(null=True)),
+                ('precipitation', models.FloatField(null=True)),
+                ('wind_speed', models.FloatField(null=True)),
+                ('soil_moisture', models.FloatField(null=True)),
+                ('soil_temperature', models.FloatField(null=True)),
+                ('uv_index', models.FloatField(null=True)),
+                ('fetched_at', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ['timestamp'],
+                'constraints': [models.UniqueConstraint(fields=('latitude', 'longitude', 'timestamp'), name='unique_observation_per_cell_hour')],
+            },
+        ),
+    ]
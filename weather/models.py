@@ -1,3 +1,52 @@
+# weather/models.py
 from django.db import models
 
-# Create your models here.
+
+class Observation(models.Model):
+    """
+    One hour of weather for one grid cell (see weather.geo), as last fetched
+    from Stormglass. Every fetch upserts its whole hourly window, so past
+    hours hold the latest values received for them.
+    """
+    id = models.BigAutoField(primary_key=True)  # ~170 rows per fetch add up
+    latitude = models.FloatField()
+    longitude = models.FloatField()
+    timestamp = models.DateTimeField()  # start of the hour, UTC
+    air_temperature = models.FloatField(null=True)
+    humidity = models.FloatField(null=True)
+    precipitation = models.FloatField(null=True)  # mm/h
+    wind_speed = models.FloatField(null=True)
+    soil_moisture = models.FloatField(null=True)  # agriculture fields are null when that API failed
+    soil_temperature = models.FloatField(null=True)
+    uv_index = models.FloatField(null=True)
+    fetched_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ['timestamp']
+        constraints = [
+            # Also serves as the (location, timestamp) index for history queries
+            models.UniqueConstraint(fields=['latitude', 'longitude', 'timestamp'],
+                                    name='unique_observation_per_cell_hour'),
+        ]
+
+    def __str__(self):
+        return f"{self.latitude},{self.longitude} @ {self.timestamp:%Y-%m-%d %H:00}"
+
+
+class Counter(models.Model):
+    """A named integer shared by all worker processes (see weather.coordination)."""
+    name = models.CharField(max_length=200, primary_key=True)
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class Lease(models.Model):
+    """A named cross-process lock that expires on its own if the holder dies."""
+    name = models.CharField(max_length=200, primary_key=True)
+    owner = models.CharField(max_length=32)
+    expires_at = models.FloatField()  # time.time()
+
+    def __str__(self):
+        return f"{self.name} (until {self.expires_at:.0f})"
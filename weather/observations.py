@@ -0,0 +1,142 @@
+# weather/observations.py
+import logging
+import math
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncDay
+
+from .geo import quantize
+from .models import Observation
+
+logger = logging.getLogger(__name__)
+
+# Every series fetched from Stormglass is also persisted hour by hour, so
+# history and analytics are answered from our own database instead of the
+# paid API (and survive restarts and cache expiry).
+
+# Model field -> column of the hourly series (see weather.forecast)
+WEATHER_FIELDS = {
+    'air_temperature': 'airTemperature',
+    'humidity': 'humidity',
+    'precipitation': 'precipitation',
+    'wind_speed': 'windSpeed',
+}
+AGRI_FIELDS = {
+    'soil_moisture': 'soilMoisture',
+    'soil_temperature': 'soilTemperature',
+    'uv_index': 'uvIndex',
+}
+
+RESOLUTIONS = ('hourly', 'daily')
+
+# Decimal places kept in daily aggregates (default 1)
+_PRECISION = {'rainfall_total': 2, 'soil_moisture_mean': 3}
+
+# A single writer thread keeps inserts off the request path and in order
+# (and gives SQLite one writer at a time)
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='observation-writer')
+
+
+def record(lat, lon, series, fetched_at):
+    """Queue a freshly fetched series for storage; returns at once."""
+    if settings.WEATHER_STORE_OBSERVATIONS:
+        _writer.submit(_write, lat, lon, series, fetched_at)
+
+
+def _write(lat, lon, series, fetched_at):
+    try:
+        save_series(lat, lon, series, fetched_at)
+    except Exception:
+        logger.exception("Storing observations failed for %s,%s", lat, lon)
+    finally:
+        close_old_connections()
+
+
+def save_series(lat, lon, series, fetched_at):
+    """Upsert one row per hour of the series, in bulk_create batches."""
+    fields = dict(WEATHER_FIELDS)
+    if 'uvIndex' in series:
+        fields.update(AGRI_FIELDS)  # without them, keep what earlier fetches stored
+    fetched = datetime.fromtimestamp(fetched_at, tz=timezone.utc)
+
+    rows = [
+        Observation(
+            latitude=lat,
+            longitude=lon,
+            timestamp=datetime.fromtimestamp(t, tz=timezone.utc),
+            fetched_at=fetched,
+            **{field: series[column][i] for field, column in fields.items()},
+        )
+        for i, t in enumerate(series['time'])
+    ]
+    Observation.objects.bulk_create(
+        rows,
+        batch_size=settings.WEATHER_OBSERVATION_BATCH_SIZE,
+        update_conflicts=True,
+        unique_fields=['latitude', 'longitude', 'timestamp'],
+        update_fields=[*fields, 'fetched_at'],
+    )
+    return len(rows)
+
+
+def stored_cell(lat, lon):
+    """The stored grid cell closest to a point (within tolerance), or its own cell."""
+    cell = quantize(lat, lon)
+    tolerance = settings.WEATHER_CELL_TOLERANCE
+    if not tolerance:
+        return cell
+    lat, lon = float(lat), float(lon)
+    candidates = (
+        Observation.objects
+        .filter(latitude__range=(lat - tolerance, lat + tolerance),
+                longitude__range=(lon - tolerance, lon + tolerance))
+        .order_by()
+        .values_list('latitude', 'longitude')
+        .distinct()
+    )
+    best = min(candidates, key=lambda c: math.hypot(c[0] - lat, c[1] - lon), default=None)
+    if best is None or math.hypot(best[0] - lat, best[1] - lon) > tolerance:
+        return cell
+    return best
+
+
+def history(lat, lon, start, end, resolution='hourly'):
+    """
+    Stored weather for a grid cell (see stored_cell) between two aware
+    datetimes, oldest first: one dict per hour, or per UTC day (aggregated
+    in the database).
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of: {', '.join(RESOLUTIONS)}")
+    rows = Observation.objects.filter(latitude=lat, longitude=lon, timestamp__gte=start, timestamp__lt=end)
+
+    if resolution == 'hourly':
+        return list(rows.values('timestamp', *WEATHER_FIELDS, *AGRI_FIELDS))
+
+    days = (
+        rows.annotate(day=TruncDay('timestamp', tzinfo=timezone.utc))
+        .values('day')
+        .order_by('day')
+        .annotate(
+            hours=Count('id'),
+            temperature_min=Min('air_temperature'),
+            temperature_max=Max('air_temperature'),
+            temperature_mean=Avg('air_temperature'),
+            humidity_mean=Avg('humidity'),
+            rainfall_total=Sum('precipitation'),  # precipitation is mm/h
+            wind_speed_max=Max('wind_speed'),
+            soil_moisture_mean=Avg('soil_moisture'),
+            uv_index_max=Max('uv_index'),
+        )
+    )
+    return [
+        {
+            'date': d.pop('day').date(),
+            **{k: round(v, _PRECISION.get(k, 1)) if isinstance(v, float) else v for k, v in d.items()},
+        }
+        for d in days
+    ]
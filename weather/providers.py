@@ -0,0 +1,411 @@
+# weather/providers.py
+import asyncio
+import contextvars
+import json
+import logging
+import math
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FuturesTimeout, wait
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db.models import Max
+
+from . import deadline, forecast, metrics, quota, timing
+from .async_client import get_async_client
+from .client import fits_budget, get_client
+from .models import Observation
+from .observations import AGRI_FIELDS, WEATHER_FIELDS
+
+logger = logging.getLogger(__name__)
+
+# Where hourly series come from. services.fetch_weather only sees the
+# Provider interface: fetch(lat, lon) returns a Fetched series in the
+# columnar shape of weather.forecast, or raises. Providers register by name
+# and WEATHER_PROVIDERS lists the ones to use, in order of preference; with
+# more than one they are combined by WEATHER_PROVIDER_STRATEGY:
+# - fallback: the next provider is asked only once the previous one failed
+# - hedge: ...or once it has taken WEATHER_PROVIDER_HEDGE_AFTER seconds
+# - race: all at once
+# and the first good answer wins, so a slow source no longer sets the tail
+# latency when a faster one can answer.
+
+STRATEGIES = ('fallback', 'hedge', 'race')
+
+
+class NoData(Exception):
+    """A provider has nothing (recent enough) for a location."""
+
+
+class Fetched:
+    """A provider's answer: an hourly series, when it was fetched, and the provider."""
+    __slots__ = ('series', 'fetched_at', 'source')
+
+    def __init__(self, series, source, fetched_at=None):
+        self.series = series
+        self.source = source
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+
+
+class Provider:
+    name = None
+    # Series from remote sources are also written to the observation store;
+    # local ones were read from it (or from files) in the first place
+    remote = True
+
+    def fetch(self, lat, lon):
+        """Fetched series for a coordinate, or raise."""
+        raise NotImplementedError
+
+    async def afetch(self, lat, lon):
+        """Async fetch; runs fetch in a worker thread unless overridden."""
+        return await sync_to_async(self.fetch)(lat, lon)
+
+    def __repr__(self):
+        return f"<{type(self).__name__} {self.name}>"
+
+
+_registry = {}
+
+
+def register(name):
+    """Class decorator making a provider available to WEATHER_PROVIDERS."""
+    def decorator(cls):
+        cls.name = name
+        _registry[name] = cls
+        return cls
+    return decorator
+
+
+# --- Stormglass --------------------------------------------------------------
+
+BASE_URL = f'{settings.STORMGLASS_BASE_URL}/weather/point'
+
+# These parameters are GUARANTEED to work on free + paid tiers
+VALID_PARAMS = [
+    'airTemperature',      # Air temp
+    'humidity',            # Relative humidity
+    'precipitation',       # Rainfall (mm/h)
+    'windSpeed',           # Wind speed at 10m
+    'gust',                # Wind gust (alternative if needed)
+    'pressure',            # Atmospheric pressure
+    'cloudCover',          # For sunlight estimation
+]
+
+# For soil moisture & UV → use their dedicated Agriculture API (still free tier!)
+AGRI_URL = f'{settings.STORMGLASS_BASE_URL}/agriculture/point'
+
+
+def weather_params(lat, lon):
+    return {
+        'lat': lat,
+        'lng': lon,
+        'params': ','.join(VALID_PARAMS),
+        'start': datetime.utcnow().strftime('%Y-%m-%dT00:00:00Z'),
+        'end': (datetime.utcnow() + timedelta(days=settings.WEATHER_FORECAST_DAYS)).strftime('%Y-%m-%dT23:59:59Z'),
+    }
+
+
+def agri_params(lat, lon):
+    return {
+        'lat': lat,
+        'lng': lon,
+        'params': 'soilMoisture,soilTemperature,uvIndex',
+    }
+
+
+def series_from_responses(response, agri_response):
+    """
+    Hourly series from the weather response and the agriculture response
+    (None if that request failed). Works with requests and httpx responses.
+    """
+    if response.status_code != 200:
+        raise Exception(f"Weather API error: {response.status_code} - {response.text}")
+
+    hours = response.json()['hours']
+
+    agri_hours = None
+    if agri_response is not None and agri_response.status_code == 200:
+        agri_hours = agri_response.json()['hours']
+    elif agri_response is not None:
+        logger.warning("Agriculture API fallback: %s", agri_response.text)
+        metrics.incr('weather_agriculture_fallback')
+
+    # Keep the whole hourly window, not just the current hour
+    return forecast.build_series(hours, VALID_PARAMS, agri_hours)
+
+
+@register('stormglass')
+class StormglassProvider(Provider):
+    """The weather and agriculture point APIs, through the shared (quota- and breaker-guarded) clients."""
+
+    def fetch(self, lat, lon):
+        client = get_client()
+
+        # 1. Agriculture-specific data (soil moisture, soil temp, UV) — in flight
+        #    while we fetch standard weather, so a miss costs one round-trip.
+        #    Optional: skipped when it can't be expected to finish in time
+        agri_future = client.submit(AGRI_URL, agri_params(lat, lon)) if _agri_fits_budget() else None
+
+        # 2. Get standard weather (hedged, see StormglassClient.fetch)
+        try:
+            response = client.fetch(BASE_URL, weather_params(lat, lon))
+        except quota.UpstreamUnavailable:  # over quota, circuit open or out of time: fail fast
+            if agri_future is not None:
+                agri_future.cancel()
+            raise
+        except requests.RequestException as e:
+            if agri_future is not None:
+                agri_future.cancel()
+            raise Exception(f"Weather API error: {e}")
+
+        agri_response = None
+        if agri_future is not None:
+            try:
+                agri_response = agri_future.result(timeout=deadline.cap(None))
+            except FuturesTimeout:
+                _agri_fallback("request deadline reached")
+            except (requests.RequestException, quota.UpstreamUnavailable) as e:
+                _agri_fallback(e)
+
+        return Fetched(series_from_responses(response, agri_response), self)
+
+    async def afetch(self, lat, lon):
+        """Both point requests concurrently on the shared async connection pool."""
+        client = get_async_client()
+        agri = asyncio.ensure_future(client.get(AGRI_URL, agri_params(lat, lon))) if _agri_fits_budget() else None
+        try:
+            response = await client.fetch(BASE_URL, weather_params(lat, lon))
+        except BaseException as e:
+            if agri is not None:
+                agri.cancel()
+            if isinstance(e, Exception) and not isinstance(e, quota.UpstreamUnavailable):
+                raise Exception(f"Weather API error: {e}")
+            raise
+
+        agri_response = None
+        if agri is not None:
+            try:
+                agri_response = await asyncio.wait_for(agri, timeout=deadline.cap(None))
+            except asyncio.TimeoutError:
+                _agri_fallback("request deadline reached")
+            except (httpx.HTTPError, quota.UpstreamUnavailable) as e:
+                _agri_fallback(e)
+        return Fetched(series_from_responses(response, agri_response), self)
+
+
+def _agri_fits_budget():
+    if fits_budget(AGRI_URL):
+        return True
+    _agri_fallback("skipped, not enough time left before the request deadline")
+    metrics.incr('weather_agriculture_skipped')
+    return False
+
+
+def _agri_fallback(reason):
+    """Serve weather without the agriculture data (forecast falls back to estimates)."""
+    logger.warning("Agriculture API fallback: %s", reason)
+    metrics.incr('weather_agriculture_fallback')
+
+
+# --- Local sources -----------------------------------------------------------
+
+@register('local')
+class ObservationProvider(Provider):
+    """
+    The observation store: the last series fetched for a grid cell (every
+    fetch stores its whole forecast window), if it is at most
+    WEATHER_LOCAL_MAX_AGE seconds old and covers the current hour. Entries
+    keep the stored fetch time, so they go stale (and get refreshed) on the
+    usual schedule.
+    """
+    remote = False
+
+    def fetch(self, lat, lon):
+        with timing.stage(self.name):
+            now = datetime.now(timezone.utc)
+            start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            rows = Observation.objects.filter(
+                latitude=lat, longitude=lon,
+                timestamp__gte=start, timestamp__lt=start + timedelta(days=settings.WEATHER_FORECAST_DAYS + 1),
+            )
+            fetched_at = rows.aggregate(latest=Max('fetched_at'))['latest']
+            if fetched_at is None or fetched_at < now - timedelta(seconds=settings.WEATHER_LOCAL_MAX_AGE):
+                raise NoData(f"No recent observations stored for {lat},{lon}")
+            columns = {**WEATHER_FIELDS, **AGRI_FIELDS}
+            values = list(rows.order_by('timestamp').values_list('timestamp', *columns))
+
+            series = {'time': [int(v[0].timestamp()) for v in values]}
+            for i, column in enumerate(columns.values(), start=1):
+                series[column] = [v[i] for v in values]
+            if all(uv is None for uv in series['uvIndex']):
+                for column in AGRI_FIELDS.values():  # stored without agriculture data
+                    del series[column]
+
+            index = forecast.current_index(series)
+            if series['time'][index] > now.timestamp() or series['airTemperature'][index] is None:
+                raise NoData(f"Stored observations for {lat},{lon} don't cover the current hour")
+            return Fetched(series, self, fetched_at.timestamp())
+
+
+@register('recorded')
+class RecordedProvider(Provider):
+    """
+    Stormglass payloads saved as files (see benchmarks/stub_upstream.py
+    record), replayed for any location with their hours moved to today.
+    For offline development and demos; the data is not for the location.
+    """
+    remote = False
+
+    def __init__(self, directory=None):
+        self.directory = directory or settings.WEATHER_RECORDED_DIR
+        if not self.directory:
+            raise ImproperlyConfigured(
+                "WEATHER_PROVIDERS: 'recorded' needs WEATHER_RECORDED_DIR, a directory of payloads "
+                "saved by benchmarks/stub_upstream.py record"
+            )
+
+    def _hours(self, endpoint):
+        try:
+            with open(os.path.join(self.directory, f'stormglass_{endpoint}.json')) as f:
+                hours = json.load(f)['hours']
+        except FileNotFoundError:
+            return None
+        if not hours:
+            return hours
+        start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+        offset = start.timestamp() - forecast.to_epoch(hours[0]['time'])
+        return [{**h, 'time': forecast.to_iso(forecast.to_epoch(h['time']) + offset)} for h in hours]
+
+    def fetch(self, lat, lon):
+        with timing.stage(self.name):
+            hours = self._hours('weather')
+            if not hours:
+                raise NoData(f"No recorded weather payload in {self.directory}")
+            return Fetched(forecast.build_series(hours, VALID_PARAMS, self._hours('agriculture')), self)
+
+
+# --- Combining providers -----------------------------------------------------
+
+# Runs hedged/raced fetches; losers finish in the background and are dropped
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix='weather-hedge')
+
+
+class Hedged(Provider):
+    """
+    Several providers, in order of preference: the next one is started when
+    the previous has failed or taken `after` seconds (0 races them all, inf
+    only falls back), and the first good answer is returned. If every
+    provider fails, the first provider's error is raised.
+    """
+
+    def __init__(self, providers, after):
+        self.providers = providers
+        self.after = after
+        self.name = '+'.join(p.name for p in providers)
+
+    def _timeout(self, launched):
+        return self.after if launched < len(self.providers) and math.isfinite(self.after) else None
+
+    def _won(self, result, index):
+        metrics.incr(f"provider_{result.source.name}_served")
+        if index:
+            metrics.incr('provider_backup_served')
+        return result
+
+    def fetch(self, lat, lon):
+        errors = [None] * len(self.providers)
+        pending = {}
+
+        def launch(index):
+            # In a copy of this context, so priority and request timings carry over
+            future = _hedge_executor.submit(contextvars.copy_context().run, self.providers[index].fetch, lat, lon)
+            pending[future] = index
+
+        launch(0)
+        launched = 1
+        while pending:
+            done, _ = wait(pending, timeout=deadline.cap(self._timeout(launched)), return_when=FIRST_COMPLETED)
+            if not done:
+                deadline.check("waiting for weather providers")
+                metrics.incr('provider_hedged')
+                launch(launched)
+                launched += 1
+                continue
+            for future in done:
+                index = pending.pop(future)
+                try:
+                    return self._won(future.result(), index)
+                except Exception as e:
+                    errors[index] = e
+            if not pending and launched < len(self.providers):
+                launch(launched)
+                launched += 1
+        raise errors[0]
+
+    async def afetch(self, lat, lon):
+        errors = [None] * len(self.providers)
+        pending = {}
+
+        def launch(index):
+            pending[asyncio.ensure_future(self.providers[index].afetch(lat, lon))] = index
+
+        launch(0)
+        launched = 1
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, timeout=deadline.cap(self._timeout(launched)),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    deadline.check("waiting for weather providers")
+                    metrics.incr('provider_hedged')
+                    launch(launched)
+                    launched += 1
+                    continue
+                for task in done:
+                    index = pending.pop(task)
+                    try:
+                        return self._won(task.result(), index)
+                    except Exception as e:
+                        errors[index] = e
+                if not pending and launched < len(self.providers):
+                    launch(launched)
+                    launched += 1
+            raise errors[0]
+        finally:
+            for task in pending:
+                task.cancel()  # unlike threads, losing async fetches can be stopped
+
+
+def build(names, strategy='fallback', hedge_after=None):
+    """A provider for a list of registered names, combined by `strategy`."""
+    unknown = [n for n in names if n not in _registry]
+    if unknown or not names:
+        raise ImproperlyConfigured(
+            f"WEATHER_PROVIDERS: unknown provider(s) {', '.join(unknown) or '(none given)'}; "
+            f"available: {', '.join(sorted(_registry))}"
+        )
+    if strategy not in STRATEGIES:
+        raise ImproperlyConfigured(f"WEATHER_PROVIDER_STRATEGY must be one of: {', '.join(STRATEGIES)}")
+    providers = [_registry[n]() for n in names]
+    if len(providers) == 1:
+        return providers[0]
+    after = {'fallback': math.inf, 'hedge': hedge_after, 'race': 0}[strategy]
+    return Hedged(providers, after)
+
+
+_provider = None
+
+
+def get_provider():
+    """The provider configured by WEATHER_PROVIDERS, built on first use."""
+    global _provider
+    if _provider is None:
+        _provider = build(settings.WEATHER_PROVIDERS, settings.WEATHER_PROVIDER_STRATEGY,
+                          settings.WEATHER_PROVIDER_HEDGE_AFTER)
+    return _provider
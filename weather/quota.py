@@ -0,0 +1,169 @@
+# weather/quota.py
+import asyncio
+import contextlib
+import contextvars
+import threading
+import time
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import DatabaseError
+
+from . import coordination, metrics
+
+# Quota-aware rate limiter in front of every Stormglass call. State is kept in
+# shared counters (weather.coordination) so all workers draw from one budget,
+# and each check-and-spend is a single atomic update:
+# - a daily counter, checked against STORMGLASS_DAILY_QUOTA
+# - a token bucket that spreads the daily quota over the day, allowing bursts
+#   of up to STORMGLASS_BURST calls
+# Background work (the cache warmer) runs at LOW priority and may not dip into
+# the last STORMGLASS_QUOTA_USER_RESERVE share of the day, which is kept for
+# user requests.
+
+LOW = 0   # cache warmer, background refreshes
+USER = 1  # a user is waiting on the response
+
+_priority = contextvars.ContextVar('upstream_priority', default=USER)
+
+RATE_KEY = 'quota:rate'  # the bucket, as a GCRA arrival time in microseconds
+
+
+class UpstreamUnavailable(Exception):
+    """Stormglass can't be called right now; serve cached data or fail fast."""
+
+
+class QuotaExceeded(UpstreamUnavailable):
+    pass
+
+
+def current_priority():
+    return _priority.get()
+
+
+@contextlib.contextmanager
+def priority(level):
+    """Run upstream calls made inside the block at the given priority."""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _day_key():
+    return f"quota:used:{datetime.utcnow():%Y-%m-%d}"
+
+
+def _interval_us():
+    """Microseconds between calls at the daily rate."""
+    return int(86400e6 / settings.STORMGLASS_DAILY_QUOTA)
+
+
+def _take_token(now):
+    interval = _interval_us()
+    slack = (settings.STORMGLASS_BURST - 1) * interval
+    return coordination.advance(RATE_KEY, int(now * 1e6), interval, slack)
+
+
+def _tokens(arrival_us, now):
+    """Tokens left in the bucket for a stored arrival time."""
+    behind = max(arrival_us - now * 1e6, 0)
+    return max(settings.STORMGLASS_BURST - behind / _interval_us(), 0.0)
+
+
+def acquire(level=None):
+    """Spend one upstream call from the budget, or raise QuotaExceeded."""
+    level = current_priority() if level is None else level
+    daily = settings.STORMGLASS_DAILY_QUOTA
+    if not daily:
+        metrics.incr('upstream_calls')
+        return
+
+    day_key = _day_key()
+    reserve = daily * settings.STORMGLASS_QUOTA_USER_RESERVE if level < USER else 0
+    try:
+        if not coordination.incr_below(day_key, daily - reserve):
+            _reject('daily', level)
+        if not _take_token(time.time()):
+            coordination.incr(day_key, -1)  # give the daily slot back
+            _reject('rate', level)
+    except DatabaseError as e:
+        # Without the shared counters we can't tell what's left: don't call blind
+        metrics.incr('upstream_rejected_unavailable')
+        raise QuotaExceeded(f"Stormglass quota check unavailable: {e}")
+    metrics.incr('upstream_calls')
+
+
+def _reject(reason, level):
+    metrics.incr(f"upstream_rejected_{reason}")
+    who = "background" if level < USER else "user"
+    raise QuotaExceeded(f"Stormglass {reason} quota exhausted for {who} requests")
+
+
+def status():
+    """Remaining budget and counters, for the quota endpoint and cache_stats."""
+    daily = settings.STORMGLASS_DAILY_QUOTA
+    day_key = _day_key()
+    shared = coordination.get_many([day_key, RATE_KEY])
+    used = shared[day_key]
+    counters = metrics.get_many(['upstream_calls', 'upstream_rejected_daily', 'upstream_rejected_rate',
+                                 'upstream_rejected_unavailable'])
+    return {
+        'daily_quota': daily or None,
+        'used_today': used,
+        'remaining_today': max(daily - used, 0) if daily else None,
+        'burst_tokens': round(_tokens(shared[RATE_KEY], time.time()), 2) if daily else None,
+        'ttl_multiplier': ttl_multiplier(),
+        'upstream_calls': counters['upstream_calls'],
+        'rejected_daily': counters['upstream_rejected_daily'],
+        'rejected_rate': counters['upstream_rejected_rate'],
+        'rejected_unavailable': counters['upstream_rejected_unavailable'],
+    }
+
+
+_ttl_cache = {'value': 1.0, 'expires': 0.0}
+_ttl_lock = threading.Lock()
+
+
+def ttl_multiplier():
+    """
+    Factor to stretch cache TTLs by when the remaining daily budget is low:
+    1 above STORMGLASS_QUOTA_LOW_WATERMARK, rising linearly to
+    STORMGLASS_QUOTA_MAX_TTL_MULTIPLIER as the budget runs out. Recomputed at
+    most every 30s per process, and never on an event loop: async callers
+    refresh it with attl_multiplier() and otherwise get the last value.
+    """
+    daily = settings.STORMGLASS_DAILY_QUOTA
+    if not daily:
+        return 1.0
+    with _ttl_lock:
+        if time.monotonic() < _ttl_cache['expires'] or _on_event_loop():
+            return _ttl_cache['value']
+        day_key = _day_key()
+        remaining = max(daily - coordination.get_many([day_key])[day_key], 0) / daily
+        watermark = settings.STORMGLASS_QUOTA_LOW_WATERMARK
+        value = 1.0
+        if remaining < watermark:
+            value += (settings.STORMGLASS_QUOTA_MAX_TTL_MULTIPLIER - 1) * (1 - remaining / watermark)
+        _ttl_cache.update(value=round(value, 2), expires=time.monotonic() + 30)
+        return _ttl_cache['value']
+
+
+_ttl_multiplier_in_thread = sync_to_async(ttl_multiplier, thread_sensitive=False)
+
+
+async def attl_multiplier():
+    """ttl_multiplier() for async callers: the counters are read in a worker thread when due."""
+    if not settings.STORMGLASS_DAILY_QUOTA or time.monotonic() < _ttl_cache['expires']:
+        return ttl_multiplier()
+    return await _ttl_multiplier_in_thread()
+
+
+def _on_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
@@ -8,6 +8,44 @@ class WeatherSerializer(serializers.Serializer):
     wind_speed = serializers.FloatField()
     uv_index = serializers.FloatField()
     soil_moisture = serializers.FloatField(allow_null=True)
+    stale = serializers.BooleanField(required=False)  # only present when serving last-known-good data
+
+
+class DailyForecastSerializer(serializers.Serializer):
+    date = serializers.DateField()
+    hours = serializers.IntegerField()
+    temperature_min = serializers.FloatField(allow_null=True)
+    temperature_max = serializers.FloatField(allow_null=True)
+    temperature_mean = serializers.FloatField(allow_null=True)
+    humidity_mean = serializers.FloatField(allow_null=True)
+    rainfall_total = serializers.FloatField()
+    wind_speed_max = serializers.FloatField(allow_null=True)
+
+
+class OutlookSerializer(serializers.Serializer):
+    hours = serializers.IntegerField()
+    rainfall_total = serializers.FloatField()
+    temperature_min = serializers.FloatField(allow_null=True)
+    temperature_max = serializers.FloatField(allow_null=True)
+    temperature_mean = serializers.FloatField(allow_null=True)
+    degree_days = serializers.FloatField()
+
+
+class ObservationSerializer(serializers.Serializer):
+    timestamp = serializers.DateTimeField()
+    air_temperature = serializers.FloatField(allow_null=True)
+    humidity = serializers.FloatField(allow_null=True)
+    precipitation = serializers.FloatField(allow_null=True)
+    wind_speed = serializers.FloatField(allow_null=True)
+    soil_moisture = serializers.FloatField(allow_null=True)
+    soil_temperature = serializers.FloatField(allow_null=True)
+    uv_index = serializers.FloatField(allow_null=True)
+
+
+class DailyHistorySerializer(DailyForecastSerializer):
+    rainfall_total = serializers.FloatField(allow_null=True)
+    soil_moisture_mean = serializers.FloatField(allow_null=True)
+    uv_index_max = serializers.FloatField(allow_null=True)
 
 
 class CropRecommendationSerializer(serializers.Serializer):
@@ -18,5 +56,6 @@ class CropRecommendationSerializer(serializers.Serializer):
 class WeatherWithCropsSerializer(serializers.Serializer):
     location = serializers.DictField()
     weather = WeatherSerializer()
+    outlook = OutlookSerializer(required=False)
     recommended_crops = CropRecommendationSerializer(many=True)
     alerts = serializers.ListField(child=serializers.CharField())
\ No newline at end of file
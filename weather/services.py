@@ -1,82 +1,299 @@
 # weather/services.py
-import requests
-import os
+import contextvars
+import itertools
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.conf import settings
 from django.core.cache import cache
-from datetime import datetime, timedelta
-
-API_KEY = os.getenv('STORMGLASS_API_KEY')
-BASE_URL = 'https://api.stormglass.io/v2/weather/point'
-
-# These parameters are GUARANTEED to work on free + paid tiers
-VALID_PARAMS = [
-    'airTemperature',      # Air temp
-    'humidity',            # Relative humidity
-    'precipitation',       # Rainfall (mm/h)
-    'windSpeed',           # Wind speed at 10m
-    'gust',                # Wind gust (alternative if needed)
-    'pressure',            # Atmospheric pressure
-    'cloudCover',          # For sunlight estimation
-]
-
-# For soil moisture & UV → use their dedicated Agriculture API (still free tier!)
-AGRI_URL = 'https://api.stormglass.io/v2/agriculture/point'
-
-def fetch_weather(lat, lon):
-    cache_key = f"weather_{lat}_{lon}"
-    cached = cache.get(cache_key)
-    if cached:
-        return cached
-
-    headers = {'Authorization': API_KEY}
-
-    # 1. Get standard weather
-    params = {
-        'lat': lat,
-        'lng': lon,
-        'params': ','.join(VALID_PARAMS),
-        'start': datetime.utcnow().strftime('%Y-%m-%dT00:00:00Z'),
-        'end': (datetime.utcnow() + timedelta(hours=6)).strftime('%Y-%m-%dT23:59:59Z'),
-    }
+from django.db import DatabaseError, close_old_connections
+from . import codec, coordination, forecast, metrics, observations, providers, quota, timing
+from .deadline import remaining, within
+from .geo import quantize
+from .singleflight import SingleFlight
 
-    response = requests.get(BASE_URL, headers=headers, params=params)
-    
-    if response.status_code != 200:
-        raise Exception(f"Weather API error: {response.status_code} - {response.text}")
+logger = logging.getLogger(__name__)
 
-    hours = response.json()['hours']
-    current = hours[0]  # Most recent hour
+# Coalesces concurrent cache misses so each coordinate is fetched once
+_weather_flight = SingleFlight('weather_fetch')
 
-    # 2. Get agriculture-specific data (soil moisture, soil temp, UV)
-    agri_params = {
-        'lat': lat,
-        'lng': lon,
-        'params': 'soilMoisture,soilTemperature,uvIndex',
-    }
-    agri_response = requests.get(AGRI_URL, headers=headers, params=agri_params)
-    
-    soil_moisture = soil_temp = uv_index = None
-    if agri_response.status_code == 200:
-        agri_data = agri_response.json()['hours'][0]
-        soil_moisture = agri_data.get('soilMoisture', {}).get('sg')
-        soil_temp = agri_data.get('soilTemperature', {}).get('sg')
-        uv_index = agri_data.get('uvIndex', {}).get('sg', 0)  # fallback to 0 if missing
+# Background revalidation of stale entries (stale-while-revalidate)
+_refresh_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='weather-refresh')
+
+# Concurrent fetches for multi-location requests (see iter_weather_many),
+# shared by every request in the process
+_fanout_executor = ThreadPoolExecutor(max_workers=settings.WEATHER_FANOUT_POOL_SIZE,
+                                      thread_name_prefix='weather-fanout')
+
+
+def cache_key_for(lat, lon):
+    """Cache key for a requested point: keyed by its canonical grid cell."""
+    lat, lon = quantize(lat, lon)
+    return f"weather_{lat}_{lon}"
+
+
+def get_cache_entry(lat, lon):
+    """Raw cache entry {'data': ..., 'series': ..., 'fetched_at': epoch} or None."""
+    return _read_entry(cache_key_for(lat, lon))
+
+
+def cached_entries_many(coords):
+    """
+    Cache entries alone, never calling upstream: {key: entry or None} for
+    `coords` mapping any key to (lat, lon), read in one cache.get_many.
+    """
+    keys = {key: cache_key_for(lat, lon) for key, (lat, lon) in coords.items()}
+    with timing.stage('cache'):
+        blobs = cache.get_many(set(keys.values()))
+        return {key: _decode_entry(blobs.get(cache_key)) for key, cache_key in keys.items()}
+
+
+def refresh_weather(lat, lon):
+    """Fetch from upstream and overwrite the cache entry, fresh or not."""
+    lat, lon = quantize(lat, lon)
+    return _refresh(lat, lon, f"weather_{lat}_{lon}")['data']
+
+
+def fetch_weather(lat, lon, hours_ahead=0):
+    """
+    Weather for a coordinate, now or `hours_ahead` hours from now, served
+    stale-while-revalidate:
+    - fresh entry (younger than WEATHER_CACHE_FRESH_TTL): returned as is
+    - stale entry (within the following WEATHER_CACHE_STALE_TTL): returned at
+      once with `stale: True`, and a background refresh is scheduled. If
+      Stormglass keeps failing, this last good value keeps being served.
+    - no entry: fetched synchronously (coalesced per coordinate)
+    Points are snapped to a grid cell first (see weather.geo), so nearby
+    requests share one cache entry and one upstream fetch.
+    Raises ValueError if `hours_ahead` is past the end of the fetched series.
+    """
+    entry, stale = _get_entry(lat, lon)
+    return conditions_from_entry(entry, stale, hours_ahead)
+
+
+def fetch_entry(lat, lon):
+    """
+    (cache entry, is_stale) for a coordinate, with fetch_weather's caching:
+    stale entries schedule a refresh, misses are fetched.
+    """
+    return _get_entry(lat, lon)
+
+
+def conditions_from_entry(entry, stale=False, hours_ahead=0):
+    """The fetch_weather payload for a cache entry (see fetch_weather)."""
+    if hours_ahead:
+        series = entry['series']
+        if not 0 < hours_ahead <= forecast.horizon(series):
+            raise ValueError(f"hours must be between 0 and {forecast.horizon(series)}")
+        data = forecast.conditions_at(series, forecast.current_index(series) + hours_ahead)
     else:
-        print(f"Agriculture API fallback: {agri_response.text}")
-        uv_index = 3  # safe fallback
-
-    # Build final result
-    result = {
-        'timestamp': current['time'],
-        'temperature': {
-            'air': current['airTemperature']['sg'],
-            'soil': soil_temp or round(current['airTemperature']['sg'] - 3, 1)  # rough estimate
-        },
-        'humidity': current['humidity']['sg'],
-        'rainfall': current['precipitation']['sg'],
-        'wind_speed': current['windSpeed']['sg'],
-        'uv_index': uv_index,
-        'soil_moisture': soil_moisture or 0.25,  # fallback estimate
+        data = entry['data']
+    return {**data, 'stale': True} if stale else data
+
+
+def fetch_daily(lat, lon):
+    """Daily aggregates over the whole cached hourly series for a coordinate."""
+    entry, _ = _get_entry(lat, lon)
+    return forecast.daily_aggregates(entry['series'])
+
+
+def fetch_outlook(lat, lon):
+    """Multi-day rolling aggregates (see forecast.outlook) for a coordinate."""
+    entry, _ = _get_entry(lat, lon)
+    return entry_outlook(entry)
+
+
+def entry_outlook(entry):
+    return entry.get('outlook') or forecast.outlook(
+        entry['series'], hours=settings.WEATHER_FORECAST_DAYS * 24)
+
+
+def _get_entry(lat, lon):
+    """(cache entry, is_stale) for a coordinate, fetching on a miss."""
+    lat, lon = quantize(lat, lon)
+    cache_key = f"weather_{lat}_{lon}"
+    entry = _read_entry(cache_key)
+    if entry:
+        if _is_fresh(entry):
+            metrics.incr('weather_cache_hit')
+            return entry, False
+        metrics.incr('weather_cache_stale')
+        _schedule_refresh(lat, lon, cache_key)
+        return entry, True
+
+    metrics.incr('weather_cache_miss')
+    return _refresh(lat, lon, cache_key), False
+
+
+def _read_entry(cache_key):
+    with timing.stage('cache'):
+        return _decode_entry(cache.get(cache_key))
+
+
+def _decode_entry(blob):
+    entry = codec.decode(blob) if blob is not None else None
+    # Entries written before hourly series were stored count as misses
+    return entry if entry and 'series' in entry else None
+
+
+def _is_fresh(entry):
+    return fresh_for(entry) > 0
+
+
+def fresh_for(entry):
+    """Seconds until a cache entry goes stale (negative once it has)."""
+    # Entries stay fresh longer while the upstream quota is running low
+    fresh_ttl = settings.WEATHER_CACHE_FRESH_TTL * quota.ttl_multiplier()
+    return entry['fetched_at'] + fresh_ttl - time.time()
+
+
+def _refresh(lat, lon, cache_key):
+    requested_at = time.time()
+
+    def fetch_and_cache():
+        fetched = providers.get_provider().fetch(lat, lon)
+        entry = make_entry(fetched.series, fetched.fetched_at)
+        cache.set(cache_key, codec.encode(entry), timeout=entry_timeout())
+        if fetched.source.remote:
+            observations.record(lat, lon, entry['series'], entry['fetched_at'])
+        return entry
+
+    def lookup():
+        # Only a fetch published by another worker after this refresh was
+        # requested counts; an older entry is what we're replacing
+        entry = _read_entry(cache_key)
+        return entry if entry and cached_at(entry) >= requested_at else None
+
+    return _weather_flight.do(cache_key, fetch_and_cache, lookup=lookup)
+
+
+def make_entry(series, fetched_at=None):
+    """
+    Cache entry for an hourly series fetched at `fetched_at` (default now;
+    local providers may hand back older data).
+    """
+    now_index = forecast.current_index(series)
+    now = time.time()
+    return {
+        'data': forecast.conditions_at(series, now_index),
+        'series': series,
+        # Aggregates for forecast-aware crop scoring, computed once per forecast run
+        'outlook': forecast.outlook(series, now_index, hours=settings.WEATHER_FORECAST_DAYS * 24),
+        'fetched_at': now if fetched_at is None else fetched_at,
+        'cached_at': now,
     }
 
-    cache.set(cache_key, result, timeout=1800)  # cache 30 mins
-    return result
\ No newline at end of file
+
+def cached_at(entry):
+    """When an entry was written (entries from before `cached_at` existed: their fetch time)."""
+    return entry.get('cached_at', entry['fetched_at'])
+
+
+def entry_timeout():
+    fresh_ttl = settings.WEATHER_CACHE_FRESH_TTL * quota.ttl_multiplier()
+    return int(fresh_ttl + settings.WEATHER_CACHE_STALE_TTL)
+
+
+def _schedule_refresh(lat, lon, cache_key):
+    # One refresh attempt per key per interval across all workers, so a failing
+    # upstream isn't hammered by every request that gets served stale data
+    try:
+        if not coordination.acquire_lease(f"refresh:{cache_key}", settings.WEATHER_REFRESH_RETRY_INTERVAL):
+            return
+    except DatabaseError as e:
+        # The stale entry is still served; a later request retries the refresh
+        logger.warning("Skipping refresh of %s, lease unavailable: %s", cache_key, e)
+        return
+
+    def refresh():
+        try:
+            with quota.priority(quota.LOW):  # nobody is waiting on this fetch
+                _refresh(lat, lon, cache_key)
+        except Exception as e:
+            logger.warning("Background refresh failed for %s: %s", cache_key, e)
+        finally:
+            close_old_connections()  # pool threads outlive the request that scheduled them
+
+    _refresh_executor.submit(refresh)
+
+
+def fetch_weather_many(coords, max_workers=None, deadline=None, entries=None):
+    """
+    Fetch weather for many locations concurrently.
+    `coords` maps any key to a (lat, lon) tuple. Returns {key: (data, error)},
+    where exactly one of data/error is set. Locations that have not resolved
+    when the deadline (seconds) runs out are reported as timed out instead of
+    failing the whole batch. `entries`, a cached_entries_many(coords) result
+    the caller already has, saves reading the cache again.
+    """
+    return {key: (data, error) for key, data, error in iter_weather_many(coords, max_workers, deadline, entries)}
+
+
+def iter_weather_many(coords, max_workers=None, deadline=None, entries=None):
+    """
+    fetch_weather_many as a generator of (key, data, error), yielded as each
+    location resolves (completion order). Fresh cache entries come first,
+    without waiting for a worker; locations still pending at the deadline
+    come last, as timed out.
+    """
+    if entries is None:
+        entries = cached_entries_many(coords)
+    served = set()
+    for key, entry in entries.items():
+        if entry and _is_fresh(entry):
+            metrics.incr('weather_cache_hit')
+            served.add(key)
+            yield key, conditions_from_entry(entry), None
+    coords = {key: c for key, c in coords.items() if key not in served}
+    if not coords:
+        return
+
+    max_workers = max_workers or settings.WEATHER_FANOUT_MAX_WORKERS
+    deadline = deadline if deadline is not None else settings.WEATHER_FANOUT_DEADLINE
+
+    # Each fetch runs in a copy of this request's context (priority, timings),
+    # with the fan-out deadline so stragglers stop calling upstream; the wait
+    # below ends with it too, or with the request's deadline if that's sooner
+    with within(deadline):
+        context = contextvars.copy_context()
+        deadline = remaining()
+    queued = iter(coords.items())
+    running = {}
+
+    def submit_next():
+        for key, (lat, lon) in itertools.islice(queued, 1):
+            running[_fanout_executor.submit(context.copy().run, _fanout_fetch, lat, lon)] = key
+
+    started = time.monotonic()
+    try:
+        # The pool is shared by all requests; this one keeps at most
+        # max_workers of its threads busy
+        for _ in range(max_workers):
+            submit_next()
+        while running:
+            left = deadline - (time.monotonic() - started)
+            done, _ = wait(running, timeout=max(left, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                key = running.pop(future)
+                submit_next()
+                if future.exception() is not None:
+                    yield key, None, str(future.exception())
+                else:
+                    yield key, future.result(), None
+        elapsed = time.monotonic() - started
+        for key in [*running.values(), *(key for key, _ in queued)]:
+            yield key, None, f"Timed out after {elapsed:.1f}s"
+    finally:
+        # Don't hold the request hostage to stragglers (or a client that went
+        # away mid-stream); its queued work is dropped
+        for future in running:
+            future.cancel()
+
+
+def _fanout_fetch(lat, lon):
+    try:
+        return fetch_weather(lat, lon)
+    finally:
+        close_old_connections()  # pool threads outlive the request that opened them
@@ -0,0 +1,165 @@
+# weather/singleflight.py
+import asyncio
+import threading
+import time
+
+from . import coordination, deadline, metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Request coalescing: at most one in-flight computation per key.
+
+    Within a process, concurrent callers for the same key wait on the leader
+    thread's result. Across worker processes, leaders take a lease in the
+    database (weather.coordination; it expires after lock_timeout if the
+    holder dies); a process that doesn't get it polls `lookup()` until the
+    winner has published its result, and only computes it itself if the
+    winner gives up or takes too long.
+    """
+
+    def __init__(self, name, lock_timeout=30, wait_timeout=15, poll_interval=0.1):
+        self.name = name
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def stats(self):
+        """Counters: leader executions and callers served by another caller's fetch."""
+        return metrics.get_many([
+            f"{self.name}_executed",
+            f"{self.name}_coalesced_local",
+            f"{self.name}_coalesced_remote",
+        ])
+
+    def do(self, key, fn, lookup=None):
+        """
+        Run fn() once per key across concurrent callers and return its result.
+        `lookup` returns the published result (or None) and is used to pick up
+        work done by another process.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.incr(f"{self.name}_coalesced_local")
+            if not call.done.wait(deadline.cap(None)):
+                raise deadline.DeadlineExceeded(f"Request deadline exceeded waiting for {self.name} {key}")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_across_processes(key, fn, lookup)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def _do_across_processes(self, key, fn, lookup):
+        lock_key = f"singleflight:{self.name}:{key}"
+        give_up_at = time.monotonic() + self.wait_timeout
+
+        while not (token := coordination.acquire_lease(lock_key, self.lock_timeout)):
+            if lookup is None or time.monotonic() >= give_up_at:
+                return fn()
+            result = lookup()
+            if result is not None:
+                metrics.incr(f"{self.name}_coalesced_remote")
+                return result
+            deadline.check(f"waiting for another worker's {self.name} {key}")
+            time.sleep(deadline.cap(self.poll_interval))
+
+        try:
+            # Another process may have published between our miss and the lock
+            if lookup is not None:
+                result = lookup()
+                if result is not None:
+                    metrics.incr(f"{self.name}_coalesced_remote")
+                    return result
+            metrics.incr(f"{self.name}_executed")
+            return fn()
+        finally:
+            coordination.release_lease(lock_key, token)
+
+
+class AsyncSingleFlight:
+    """
+    asyncio counterpart of SingleFlight for the async views: coroutines on
+    the same event loop await the leader's task, and the same database lease
+    coalesces across worker processes.
+    """
+
+    def __init__(self, name, lock_timeout=30, wait_timeout=15, poll_interval=0.1):
+        self.name = name
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self._calls = {}
+
+    async def do(self, key, fn, lookup=None):
+        """Await fn() once per key across concurrent callers; `lookup` is async."""
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        task = self._calls.get(call_key)
+        if task is not None:
+            metrics.incr(f"{self.name}_coalesced_local")
+            return await self._wait(task, key)
+
+        # The task copies this context, so it runs under the leader's own deadline
+        task = loop.create_task(self._do_across_processes(key, fn, lookup))
+        self._calls[call_key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._calls.pop(call_key, None)
+
+    async def _wait(self, task, key):
+        """The leader's result, waited on for at most this follower's deadline."""
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), deadline.cap(None))
+        except asyncio.TimeoutError:
+            if task.done():
+                raise  # the computation itself timed out
+            raise deadline.DeadlineExceeded(f"Request deadline exceeded waiting for {self.name} {key}") from None
+
+    async def _do_across_processes(self, key, fn, lookup):
+        lock_key = f"singleflight:{self.name}:{key}"
+        give_up_at = time.monotonic() + self.wait_timeout
+
+        while not (token := await coordination.aacquire_lease(lock_key, self.lock_timeout)):
+            if lookup is None or time.monotonic() >= give_up_at:
+                return await fn()
+            result = await lookup()
+            if result is not None:
+                metrics.incr(f"{self.name}_coalesced_remote")
+                return result
+            deadline.check(f"waiting for another worker's {self.name} {key}")
+            await asyncio.sleep(deadline.cap(self.poll_interval))
+
+        try:
+            if lookup is not None:
+                result = await lookup()
+                if result is not None:
+                    metrics.incr(f"{self.name}_coalesced_remote")
+                    return result
+            metrics.incr(f"{self.name}_executed")
+            return await fn()
+        finally:
+            await coordination.arelease_lease(lock_key, token)
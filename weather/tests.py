@@ -1,3 +1,1263 @@
-from django.test import TestCase
+import asyncio
+import contextvars
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils.http import http_date
+from rest_framework.renderers import JSONRenderer
+
+from locations.models import State
+from locations import registry
+
+from . import (
+    circuit, codec, conditional, coordination, deadline, fastjson, forecast, metrics, observations, providers, quota,
+    services, timing,
+)
+from .client import StormglassClient
+from .crop_engine import CROP_NAMES, score_all
+from .crop_rules import generate_alerts, score_crop
+from .geo import PointIndex, haversine_km, quantize
+from .models import Observation
+from .serializers import DailyForecastSerializer, WeatherSerializer, WeatherWithCropsSerializer
+from .singleflight import AsyncSingleFlight, SingleFlight
+
+LOCMEM = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def make_series(hours=48, temperature=25.0):
+    """Columnar series (see weather.forecast) starting at the current hour."""
+    start = int(time.time() // 3600) * 3600
+    return {
+        'time': [start + 3600 * i for i in range(hours)],
+        'airTemperature': [temperature] * hours,
+        'humidity': [60.0] * hours,
+        'precipitation': [0.5] * hours,
+        'windSpeed': [3.0] * hours,
+        'gust': [5.0] * hours,
+        'pressure': [1010.0] * hours,
+        'cloudCover': [20.0] * hours,
+    }
+
+
+def store_stale_entry(lat, lon, temperature=25.0):
+    """Cache an entry for a coordinate that went stale a minute ago."""
+    fetched_at = time.time() - settings.WEATHER_CACHE_FRESH_TTL - 60
+    entry = services.make_entry(make_series(temperature=temperature), fetched_at=fetched_at)
+    cache.set(services.cache_key_for(lat, lon), codec.encode(entry), timeout=None)
+
+
+class StubProvider(providers.Provider):
+    """
+    Counts fetches and hands back a series at the next temperature each time.
+    Grid cells in `failing` raise; those in `blocked` wait for `release`.
+    """
+    name = 'stub'
+    remote = False
+
+    def __init__(self):
+        self.calls = 0
+        self.failing = set()
+        self.blocked = set()
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def fetch(self, lat, lon):
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        if (lat, lon) in self.blocked:
+            self.release.wait(5)
+        if (lat, lon) in self.failing:
+            raise providers.NoData(f"No data for {lat},{lon}")
+        return providers.Fetched(make_series(temperature=20.0 + calls), self)
+
+
+class StubProviderMixin:
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.provider = StubProvider()
+        previous, providers._provider = providers._provider, self.provider
+        self.addCleanup(setattr, providers, '_provider', previous)
+        # Counters are flushed at the end instead of in the background: the test
+        # database fails writers that overlap (say, with a fetch thread's lease)
+        metrics._flusher.submit(lambda: None).result(5)
+        patcher = mock.patch.object(metrics._flusher, 'submit')
+        patcher.start()
+        self.addCleanup(metrics.flush)  # while the test database is still there
+        self.addCleanup(patcher.stop)
+
+
+@override_settings(CACHES=LOCMEM)
+class RefreshWeatherTests(StubProviderMixin, TestCase):
+    def test_fetch_weather_serves_fresh_entry_from_cache(self):
+        services.fetch_weather(9.06, 7.49)
+        services.fetch_weather(9.06, 7.49)
+        self.assertEqual(self.provider.calls, 1)
+
+    def test_refresh_weather_refetches_a_fresh_entry(self):
+        first = services.fetch_weather(9.06, 7.49)
+        refreshed = services.refresh_weather(9.06, 7.49)
+        self.assertEqual(self.provider.calls, 2)
+        self.assertNotEqual(first['temperature'], refreshed['temperature'])
+        self.assertEqual(services.fetch_weather(9.06, 7.49)['temperature'], refreshed['temperature'])
+
+
+@override_settings(CACHES=LOCMEM)
+class StaleWhileRevalidateTests(StubProviderMixin, TransactionTestCase):
+    """Refreshes run on the refresh pool, so the lease table is written for real."""
+    def setUp(self):
+        super().setUp()
+        store_stale_entry(9.0, 7.5, temperature=25.0)
+        self.refreshes = []
+        self.hold = threading.Event()  # cleared: refreshes wait (the test database takes one writer at a time)
+        self.hold.set()
+        submit = services._refresh_executor.submit
+        patcher = mock.patch.object(services._refresh_executor, 'submit',
+                                    side_effect=lambda fn: self.refreshes.append(submit(self.held, fn)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def held(self, fn):
+        self.hold.wait(5)
+        fn()
+
+    def test_stale_entry_is_served_and_refreshed_once(self):
+        self.hold.clear()  # the refresh stays in flight
+        served = [services.fetch_weather(9.06, 7.49) for _ in range(3)]
+        for weather in served:
+            self.assertIs(weather['stale'], True)
+            self.assertEqual(weather['temperature']['air'], 25.0)
+        self.assertEqual(len(self.refreshes), 1)
+        self.hold.set()
+        self.refreshes[0].result(5)
+        self.assertEqual(self.provider.calls, 1)
+        self.assertNotIn('stale', services.fetch_weather(9.06, 7.49))
+
+    def test_stale_entry_is_served_while_upstream_fails(self):
+        self.provider.failing.add((9.0, 7.5))
+        services.fetch_weather(9.06, 7.49)
+        self.refreshes[0].result(5)
+        weather = services.fetch_weather(9.06, 7.49)
+        self.assertIs(weather['stale'], True)
+        self.assertEqual(weather['temperature']['air'], 25.0)
+        self.assertEqual(self.provider.calls, 1)  # the lease holds off the next attempt
+        self.assertEqual(len(self.refreshes), 1)
+
+    def test_stale_entry_is_served_without_the_lease_table(self):
+        with mock.patch.object(coordination, 'acquire_lease', side_effect=DatabaseError('table is locked')), \
+                self.assertLogs('weather.services', 'WARNING'):
+            weather = services.fetch_weather(9.06, 7.49)
+        self.assertIs(weather['stale'], True)
+        self.assertEqual(self.refreshes, [])
+        self.assertEqual(self.provider.calls, 0)
+
+    def test_async_stale_entry_is_served_without_the_lease_table(self):
+        from .async_services import afetch_weather
+
+        with mock.patch.object(coordination, 'aacquire_lease', side_effect=DatabaseError('table is locked')), \
+                self.assertLogs('weather.async_services', 'WARNING'):
+            weather = asyncio.run(afetch_weather(9.06, 7.49))
+        self.assertIs(weather['stale'], True)
+        self.assertEqual(self.provider.calls, 0)
+
+
+def random_weather(rng):
+    """A weather record (fetch_weather shape) with values across every crop's limits."""
+    return {
+        'temperature': {'air': round(rng.uniform(-5, 45), 1), 'soil': round(rng.uniform(0, 40), 1)},
+        'humidity': round(rng.uniform(10, 100), 1),
+        'rainfall': round(rng.choice([0, rng.uniform(0, 20)]), 2),
+        'wind_speed': round(rng.uniform(0, 15), 1),
+        'uv_index': round(rng.uniform(0, 12), 1),
+        'soil_moisture': rng.choice([None, 0, round(rng.uniform(0, 0.6), 3)]),
+    }
+
+
+def random_outlook(rng):
+    """An outlook (forecast.outlook shape), or None, including windows under a day."""
+    if rng.random() < 0.2:
+        return None
+    low = round(rng.uniform(-5, 30), 1)
+    return {
+        'hours': rng.choice([0, 12, 24, 72, 168]),
+        'rainfall_total': round(rng.uniform(0, 150), 2),
+        'temperature_min': rng.choice([None, low]),
+        'temperature_max': rng.choice([None, round(low + rng.uniform(0, 20), 1)]),
+    }
+
+
+class ScoreAllTests(TestCase):
+    def test_matches_score_crop(self):
+        rng = random.Random(20240611)
+        for month in range(1, 13):
+            with mock.patch('weather.crop_rules.datetime') as clock:
+                clock.utcnow.return_value = datetime(2026, month, 15)
+                for _ in range(50):
+                    weather, outlook = random_weather(rng), random_outlook(rng)
+                    expected = [score_crop(name, weather, outlook) for name in CROP_NAMES]
+                    self.assertEqual(score_all(weather, month=month, outlook=outlook), expected,
+                                     f"month={month} weather={weather} outlook={outlook}")
+
+
+# Leases are taken from other threads' database connections, which can't
+# write while a TestCase holds its transaction open on the test database
+class SingleFlightTests(TransactionTestCase):
+    def setUp(self):
+        self.flight = SingleFlight('test_flight', wait_timeout=0.3, poll_interval=0.01)
+        self.addCleanup(metrics.flush)
+
+    def run_concurrently(self, fn, followers=7):
+        """do() from a leader thread, then from `followers` threads while fn() is running."""
+        started, release = threading.Event(), threading.Event()
+        results = []
+
+        def leader_fn():
+            started.set()
+            release.wait(5)
+            return fn()
+
+        def call(fn):
+            try:
+                results.append(self.flight.do('key', fn))
+            except Exception as e:
+                results.append(e)
+
+        threads = [threading.Thread(target=call, args=(leader_fn,))]
+        threads[0].start()
+        self.assertTrue(started.wait(5))
+        threads += [threading.Thread(target=call, args=(fn,)) for _ in range(followers)]
+        for thread in threads[1:]:
+            thread.start()
+        time.sleep(0.1)  # let the followers reach the in-flight call
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_concurrent_callers_share_one_execution(self):
+        calls = []
+        results = self.run_concurrently(lambda: calls.append(1) or 'value')
+        self.assertEqual(results, ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+    def test_leader_error_is_raised_to_every_caller(self):
+        error = ValueError('upstream failed')
+
+        def fail():
+            raise error
+        results = self.run_concurrently(fail)
+        self.assertEqual(results, [error] * 8)
+
+    def test_lease_is_released(self):
+        self.flight.do('key', lambda: 'value')
+        token = coordination.acquire_lease('singleflight:test_flight:key', 30)
+        self.assertIsNotNone(token)
+
+    def test_waits_for_another_process_result(self):
+        # Another worker holds the lease and publishes its result
+        coordination.acquire_lease('singleflight:test_flight:key', 30)
+        published = iter([None, None, 'theirs'])
+        fn = mock.Mock(return_value='ours')
+        self.assertEqual(self.flight.do('key', fn, lookup=lambda: next(published)), 'theirs')
+        fn.assert_not_called()
+
+    def test_computes_itself_when_another_process_takes_too_long(self):
+        coordination.acquire_lease('singleflight:test_flight:key', 30)
+        fn = mock.Mock(return_value='ours')
+        self.assertEqual(self.flight.do('key', fn, lookup=lambda: None), 'ours')
+        fn.assert_called_once()
+
+    def test_async_callers_share_one_execution(self):
+        flight = AsyncSingleFlight('test_async_flight')
+        calls = []
+
+        async def fn():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return 'value'
+
+        async def main():
+            return await asyncio.gather(*(flight.do('key', fn) for _ in range(8)))
+
+        self.assertEqual(asyncio.run(main()), ['value'] * 8)
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(STORMGLASS_DAILY_QUOTA=10, STORMGLASS_BURST=100, STORMGLASS_QUOTA_USER_RESERVE=0.2)
+class QuotaTests(TestCase):
+    def setUp(self):
+        self.addCleanup(metrics.flush)
+        # ttl_multiplier() is cached per process
+        quota._ttl_cache.update(value=1.0, expires=0.0)
+        self.addCleanup(quota._ttl_cache.update, value=1.0, expires=0.0)
+
+    def acquired(self, n, level=quota.USER):
+        """How many of n acquire() calls got through."""
+        count = 0
+        for _ in range(n):
+            try:
+                quota.acquire(level)
+            except quota.QuotaExceeded:
+                continue
+            count += 1
+        return count
+
+    def test_daily_quota(self):
+        self.assertEqual(self.acquired(15), 10)
+        self.assertEqual(quota.status()['used_today'], 10)
+        self.assertEqual(quota.status()['remaining_today'], 0)
+
+    def test_background_calls_leave_the_user_reserve(self):
+        self.assertEqual(self.acquired(15, quota.LOW), 8)
+        with quota.priority(quota.LOW):
+            self.assertRaises(quota.QuotaExceeded, quota.acquire)
+        self.assertEqual(self.acquired(15, quota.USER), 2)
+
+    @override_settings(STORMGLASS_DAILY_QUOTA=86400, STORMGLASS_BURST=5)
+    def test_burst_then_the_daily_rate(self):
+        now = time.time()
+        with mock.patch('weather.quota.time.time', return_value=now):
+            self.assertEqual(self.acquired(8), 5)
+            # Rate rejections hand their daily slot back
+            self.assertEqual(quota.status()['used_today'], 5)
+        with mock.patch('weather.quota.time.time', return_value=now + 2):
+            self.assertEqual(self.acquired(8), 2)  # one call a second
+
+    @override_settings(STORMGLASS_DAILY_QUOTA=0)
+    def test_disabled(self):
+        self.assertEqual(self.acquired(200), 200)
+        self.assertIsNone(quota.status()['remaining_today'])
+
+    def test_unavailable_counters_reject(self):
+        with mock.patch('weather.coordination.incr_below', side_effect=DatabaseError('down')):
+            self.assertRaises(quota.QuotaExceeded, quota.acquire)
+
+    @override_settings(STORMGLASS_QUOTA_LOW_WATERMARK=0.5, STORMGLASS_QUOTA_MAX_TTL_MULTIPLIER=4)
+    def test_ttl_multiplier_rises_as_the_budget_runs_out(self):
+        self.assertEqual(quota.ttl_multiplier(), 1.0)
+        self.acquired(10)
+        quota._ttl_cache.update(expires=0.0)
+        self.assertEqual(quota.ttl_multiplier(), 4.0)
+
+
+class CircuitBreakerTests(TestCase):
+    def setUp(self):
+        self.addCleanup(metrics.flush)
+        self.now = 1000.0
+        clock = mock.patch('weather.circuit.time.monotonic', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+        self.breaker = circuit.CircuitBreaker('test', window=60, min_calls=4, error_rate=0.5,
+                                              slow_call=2, slow_rate=0.75, open_seconds=30)
+
+    def call(self, ok=True, duration=0.1):
+        self.breaker.before()
+        self.breaker.record(ok, duration)
+
+    def trip(self):
+        with self.assertLogs('weather.circuit', 'WARNING'):
+            for ok in (True, True, False, False):
+                self.call(ok)
+        self.assertEqual(self.breaker.status()['state'], circuit.OPEN)
+
+    def test_stays_closed_below_min_calls(self):
+        for _ in range(3):
+            self.call(ok=False)
+        self.assertEqual(self.breaker.status()['state'], circuit.CLOSED)
+
+    def test_opens_on_error_rate(self):
+        self.trip()
+        self.assertRaises(circuit.CircuitOpen, self.breaker.before)
+
+    def test_opens_on_slow_calls(self):
+        self.call(duration=0.1)
+        with self.assertLogs('weather.circuit', 'WARNING'):
+            for _ in range(3):
+                self.call(duration=5)
+        self.assertEqual(self.breaker.status()['state'], circuit.OPEN)
+
+    def test_outcomes_age_out_of_the_window(self):
+        for _ in range(3):
+            self.call(ok=False)
+        self.now += 61
+        self.call(ok=False)
+        self.assertEqual(self.breaker.status(), {
+            'state': circuit.CLOSED, 'calls': 1, 'failures': 1, 'slow': 0, 'retry_in': None,
+        })
+
+    def test_half_open_probe_success_closes(self):
+        self.trip()
+        self.now += 30
+        self.breaker.before()  # the probe
+        self.assertEqual(self.breaker.status()['state'], circuit.HALF_OPEN)
+        self.assertRaises(circuit.CircuitOpen, self.breaker.before)  # one probe at a time
+        self.breaker.record(True, 0.1)
+        self.assertEqual(self.breaker.status()['state'], circuit.CLOSED)
+        self.breaker.before()
+
+    def test_half_open_probe_failure_reopens(self):
+        self.trip()
+        self.now += 30
+        with self.assertLogs('weather.circuit', 'WARNING'):
+            self.call(ok=False)
+        self.assertEqual(self.breaker.status()['state'], circuit.OPEN)
+        self.assertEqual(self.breaker.status()['retry_in'], 30)
+
+    def test_slow_probe_reopens(self):
+        self.trip()
+        self.now += 30
+        with self.assertLogs('weather.circuit', 'WARNING'):
+            self.call(duration=5)
+        self.assertEqual(self.breaker.status()['state'], circuit.OPEN)
+
+    def test_cancelled_probe_frees_the_slot(self):
+        self.trip()
+        self.now += 30
+        self.breaker.before()
+        self.breaker.cancel()
+        self.breaker.before()
+        self.assertEqual(self.breaker.status()['state'], circuit.HALF_OPEN)
+
+    def test_endpoint_name(self):
+        self.assertEqual(circuit.endpoint_name('https://api.stormglass.io/v2/weather/point'), 'weather')
+        self.assertEqual(circuit.endpoint_name('https://api.stormglass.io/v2/agriculture/point'), 'agriculture')
+
+
+class PointIndexTests(TestCase):
+    def setUp(self):
+        rng = random.Random(7)
+        self.points = [(rng.uniform(-90, 90), rng.uniform(-180, 180), i) for i in range(500)]
+        # Either side of the antimeridian and around a pole
+        self.points += [(0.0, 179.9, 'east'), (0.0, -179.9, 'west'), (89.9, 0.0, 'n0'), (89.9, 180.0, 'n180')]
+        self.index = PointIndex(self.points)
+
+    def brute_nearest(self, lat, lon, k, max_km=None):
+        pairs = sorted((haversine_km(lat, lon, p_lat, p_lon), item) for p_lat, p_lon, item in self.points
+                       if max_km is None or haversine_km(lat, lon, p_lat, p_lon) <= max_km)
+        return [item for _, item in pairs[:k]]
+
+    def test_nearest_matches_brute_force(self):
+        rng = random.Random(11)
+        for _ in range(200):
+            lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+            k = rng.choice([1, 3, 10])
+            max_km = rng.choice([None, 500, 2000])
+            found = self.index.nearest(lat, lon, k=k, max_km=max_km)
+            self.assertEqual([item for _, item in found], self.brute_nearest(lat, lon, k, max_km))
+            self.assertEqual([d for d, _ in found], sorted(d for d, _ in found))
+
+    def test_nearest_across_the_antimeridian_and_poles(self):
+        self.assertEqual({item for _, item in self.index.nearest(0.0, 180.0, k=2)}, {'east', 'west'})
+        self.assertEqual({item for _, item in self.index.nearest(90.0, 90.0, k=2)}, {'n0', 'n180'})
+
+    def test_nearest_edge_cases(self):
+        self.assertEqual(PointIndex([]).nearest(0, 0), [])
+        self.assertEqual(self.index.nearest(0, 0, k=0), [])
+        self.assertEqual(self.index.nearest(0.0, 179.9, max_km=0)[0][1], 'east')
+
+    def test_within_matches_brute_force(self):
+        rng = random.Random(13)
+        for _ in range(100):
+            south = rng.uniform(-90, 80)
+            north = rng.uniform(south, 90)
+            west, east = rng.uniform(-180, 180), rng.uniform(-180, 180)
+            expected = {
+                item for p_lat, p_lon, item in self.points
+                if south <= p_lat <= north and (west <= p_lon <= east if west <= east
+                                                else p_lon >= west or p_lon <= east)
+            }
+            self.assertEqual(set(self.index.within(south, west, north, east)), expected)
+
+    def test_within_across_the_antimeridian(self):
+        self.assertEqual(set(self.index.within(-1, 179, 1, -179)), {'east', 'west'})
+
+
+@override_settings(CACHES=LOCMEM)
+class ConditionalTests(StubProviderMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.entry = services.make_entry(make_series(), fetched_at=time.time() - 60)
+
+    def validators(self, entries=None, path='/api/weather/Africa/Nigeria%20-%20Kano/', **headers):
+        request = RequestFactory().get(path, **headers)
+        return request, conditional.for_entries(request, entries or [(self.entry, False)])
+
+    def test_matching_etag_is_not_modified(self):
+        _, validators = self.validators()
+        for etag in (validators.etag, f"W/{validators.etag}", f'"other", {validators.etag}', '*'):
+            request, _ = self.validators(HTTP_IF_NONE_MATCH=etag)
+            response = conditional.not_modified(request, validators)
+            self.assertEqual(response.status_code, 304, etag)
+            self.assertEqual(response['ETag'], validators.etag)
+            self.assertEqual(response['Cache-Control'], f"public, max-age={validators.max_age}")
+
+    def test_other_etag_is_modified(self):
+        request, validators = self.validators(HTTP_IF_NONE_MATCH='"other"')
+        self.assertIsNone(conditional.not_modified(request, validators))
+        request, validators = self.validators()
+        self.assertIsNone(conditional.not_modified(request, validators))
+
+    def test_if_modified_since(self):
+        _, validators = self.validators()
+        request, _ = self.validators(HTTP_IF_MODIFIED_SINCE=http_date(validators.last_modified))
+        self.assertEqual(conditional.not_modified(request, validators).status_code, 304)
+        request, _ = self.validators(HTTP_IF_MODIFIED_SINCE=http_date(validators.last_modified - 60))
+        self.assertIsNone(conditional.not_modified(request, validators))
+
+    def test_etag_follows_entries_and_url(self):
+        etag = self.validators()[1].etag
+        refetched = {**self.entry, 'fetched_at': self.entry['fetched_at'] + 1}
+        self.assertNotEqual(self.validators([(refetched, False)])[1].etag, etag)
+        self.assertNotEqual(self.validators([(self.entry, True)])[1].etag, etag)
+        self.assertNotEqual(self.validators(path='/api/weather/Africa/Nigeria%20-%20Kano/?hours=3')[1].etag, etag)
+        self.assertEqual(self.validators()[1].etag, etag)
+
+    def test_max_age(self):
+        self.assertAlmostEqual(self.validators()[1].max_age, services.fresh_for(self.entry), delta=1)
+        self.assertEqual(self.validators([(self.entry, True)])[1].max_age, 0)
+        self.assertEqual(self.validators([(self.entry, False), (None, False)])[1].max_age, 0)
+
+    def test_view_revalidation(self):
+        url = '/api/weather/Africa/Nigeria%20-%20Kano/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('max-age=', response['Cache-Control'])
+        revalidated = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(revalidated['ETag'], response['ETag'])
+        self.assertEqual(self.provider.calls, 1)
+
+
+class FastJsonTests(TestCase):
+    def payloads(self):
+        """
+        (serializer, many, data) for the weather, daily and crop payloads the
+        views render, with and without agriculture data.
+        """
+        rng = random.Random(3)
+        for agriculture in (True, False):
+            series = make_series(hours=72)
+            series['airTemperature'] = [round(rng.uniform(-5, 45), 1) for _ in series['time']]
+            series['humidity'] = [int(rng.uniform(10, 100)) for _ in series['time']]  # ints, as JSON can send
+            series['windSpeed'][5] = None
+            if agriculture:
+                series['soilMoisture'] = [round(rng.uniform(0, 0.5), 3) for _ in series['time']]
+                series['soilTemperature'] = [None] * len(series['time'])
+                series['uvIndex'] = [round(rng.uniform(0, 12), 1) for _ in series['time']]
+            entry = services.make_entry(series)
+            for stale in (False, True):
+                weather = services.conditions_from_entry(entry, stale)
+                yield WeatherSerializer, False, weather
+                yield DailyForecastSerializer, True, forecast.daily_aggregates(entry['series'])
+                yield WeatherWithCropsSerializer, False, {
+                    "location": {"continent": "Africa", "country": "Nigeria Kano", "lat": 12.0, "lon": 8.5},
+                    "weather": weather,
+                    "outlook": entry['outlook'],
+                    "recommended_crops": score_all(weather, outlook=entry['outlook'])[:5],
+                    "alerts": generate_alerts(weather),
+                }
+
+    def assert_same_bytes(self):
+        for serializer, many, data in self.payloads():
+            expected = JSONRenderer().render(serializer(data, many=many).data)
+            render = fastjson.compile(serializer(many=many))
+            self.assertEqual(fastjson.dumps(render(data)), expected)
+
+    def test_matches_drf(self):
+        self.assert_same_bytes()
+
+    def test_matches_drf_without_orjson(self):
+        with mock.patch.object(fastjson, 'orjson', None):
+            self.assert_same_bytes()
+
+
+class DeadlineTests(TestCase):
+    def setUp(self):
+        self.now = 1000.0
+        clock = mock.patch('weather.deadline.time.monotonic', side_effect=lambda: self.now)
+        clock.start()
+        self.addCleanup(clock.stop)
+
+    def test_no_deadline(self):
+        self.assertIsNone(deadline.remaining())
+        self.assertEqual(deadline.cap(5), 5)
+        self.assertIsNone(deadline.cap(None))
+        deadline.check("doing nothing")
+
+    def test_within(self):
+        with deadline.within(10):
+            self.now += 4
+            self.assertEqual(deadline.remaining(), 6)
+            with deadline.within(20):  # the earlier, enclosing deadline wins
+                self.assertEqual(deadline.remaining(), 6)
+            with deadline.within(2):
+                self.assertEqual(deadline.remaining(), 2)
+            self.assertEqual(deadline.remaining(), 6)
+        self.assertIsNone(deadline.remaining())
+
+    def test_cap(self):
+        with deadline.within(3):
+            self.assertEqual(deadline.cap(5), 3)
+            self.assertEqual(deadline.cap(1), 1)
+            self.assertEqual(deadline.cap(None), 3)
+            self.now += 10
+            self.assertEqual(deadline.cap(5), 0)
+            self.assertEqual(deadline.cap(None), 0)
+
+    def test_check(self):
+        with deadline.within(1):
+            deadline.check("in time")
+            self.now += 1
+            with self.assertRaises(deadline.DeadlineExceeded) as raised:
+                deadline.check("waiting for upstream")
+            self.assertIsInstance(raised.exception, quota.UpstreamUnavailable)
+
+    def test_lifted(self):
+        with deadline.within(1), deadline.lifted():
+            self.assertIsNone(deadline.remaining())
+
+    def test_context_is_inherited(self):
+        with deadline.within(5):
+            context = contextvars.copy_context()
+        self.assertEqual(context.run(deadline.remaining), 5)
+
+        async def task():
+            return deadline.remaining()
+
+        async def main():
+            with deadline.within(7):
+                return await asyncio.ensure_future(task())
+
+        self.assertEqual(asyncio.run(main()), 7)
+
+    @override_settings(WEATHER_REQUEST_DEADLINE=8)
+    def test_bounded(self):
+        @deadline.bounded
+        def view():
+            return deadline.remaining()
+
+        @deadline.bounded
+        async def async_view():
+            return deadline.remaining()
+
+        self.assertEqual(view(), 8)
+        self.assertEqual(asyncio.run(async_view()), 8)
+
+
+class DeadlineCutShortTests(TestCase):
+    """A read cut short by the request deadline says nothing about the endpoint."""
+    URL = 'http://stormglass.test/v2/deadline-test/point'
+
+    def setUp(self):
+        self.addCleanup(metrics.flush)
+        self.addCleanup(circuit._breakers.pop, circuit.endpoint_name(self.URL), None)
+        self.upstream = StormglassClient(api_key='key', connect_timeout=1, read_timeout=10,
+                                       max_retries=0, backoff_factor=0, pool_size=1)
+        get = mock.patch.object(self.upstream.session, 'get', side_effect=requests.ReadTimeout)
+        self.get = get.start()
+        self.addCleanup(get.stop)
+
+    def test_deadline_timeout_is_not_a_failure(self):
+        with deadline.within(2), self.assertRaises(deadline.DeadlineExceeded):
+            self.upstream.get(self.URL, {})
+        read_timeout = self.get.call_args.kwargs['timeout'][1]
+        self.assertLessEqual(read_timeout, 2)
+        self.assertEqual(circuit.breaker_for(self.URL).status()['calls'], 0)
+
+    def test_upstream_timeout_is_a_failure(self):
+        with self.assertRaises(requests.ReadTimeout):
+            self.upstream.get(self.URL, {})
+        self.assertEqual(self.get.call_args.kwargs['timeout'], (1, 10))
+        self.assertEqual(circuit.breaker_for(self.URL).status()['failures'], 1)
+
+
+# The async paths reach the database from worker threads (leases, quota). One
+# fetch at a time: the in-memory test database fails concurrent writers at once
+# rather than waiting for the lock
+@override_settings(CACHES=LOCMEM, STORMGLASS_DAILY_QUOTA=1000, WEATHER_ASYNC_MAX_CONCURRENCY=1)
+class AsyncQuotaTests(StubProviderMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        # Due for recomputation, so the first lookup has to read the counters
+        quota._ttl_cache.update(value=1.0, expires=0.0)
+        self.addCleanup(quota._ttl_cache.update, value=1.0, expires=0.0)
+
+    def test_async_fetch_with_quota_enabled(self):
+        from .async_services import afetch_weather
+
+        async def main():
+            return [await afetch_weather(9.06, 7.49) for _ in range(2)]
+
+        first, second = asyncio.run(main())
+        self.assertEqual(first, second)
+        self.assertEqual(self.provider.calls, 1)
+        self.assertGreater(quota._ttl_cache['expires'], 0)  # computed, off the loop
+
+    def test_async_views_with_quota_enabled(self):
+        async def main():
+            one = await self.async_client.get('/api/async/weather/Africa/Nigeria%20-%20Kano/')
+            every = await self.async_client.get('/api/async/weather/all/')
+            return one, every
+
+        one, every = asyncio.run(main())
+        self.assertEqual(one.status_code, 200, one.content)
+        self.assertEqual(every.status_code, 200)
+        errors = [name for locations in every.json().values() for name, row in locations.items() if 'error' in row]
+        self.assertEqual(errors, [])
+
+
+@override_settings(CACHES=LOCMEM)
+class FanOutTests(StubProviderMixin, TransactionTestCase):
+    """services.iter_weather_many; one worker, see AsyncQuotaTests."""
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(self.finish_blocked)
+
+    def finish_blocked(self):
+        # Let fetches that outlived their request finish before the next test
+        self.provider.release.set()
+        for _ in range(100):
+            if not services._weather_flight._calls:
+                return
+            time.sleep(0.05)
+
+    def test_cached_first_then_results_and_errors(self):
+        coords = {'cached': (6.5, 3.375), 'fetched': (9.0, 7.5), 'failing': (12.0, 8.5)}
+        services.fetch_weather(*coords['cached'])
+        self.provider.failing.add(coords['failing'])
+
+        results = list(services.iter_weather_many(coords, max_workers=1))
+        self.assertEqual(results[0][0], 'cached')
+        results = {key: (data, error) for key, data, error in results}
+        self.assertEqual(results.keys(), coords.keys())
+        self.assertIsNone(results['cached'][1])
+        self.assertIsNone(results['fetched'][1])
+        self.assertIsNone(results['failing'][0])
+        self.assertIn('No data for 12.0,8.5', results['failing'][1])
+        self.assertEqual(self.provider.calls, 3)
+
+    def test_deadline_reports_the_rest_as_timed_out(self):
+        coords = {'cached': (6.5, 3.375), 'slow': (9.0, 7.5), 'queued': (12.0, 8.5)}
+        services.fetch_weather(*coords['cached'])
+        self.provider.blocked.add(coords['slow'])
+
+        started = time.monotonic()
+        results = services.fetch_weather_many(coords, max_workers=1, deadline=0.2)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertIsNotNone(results['cached'][0])
+        for key in ('slow', 'queued'):
+            self.assertIsNone(results[key][0])
+            self.assertTrue(results[key][1].startswith('Timed out after'), results[key][1])
+        self.assertEqual(self.provider.calls, 2)  # the queued location never started
+
+    def test_uses_the_shared_pool(self):
+        with mock.patch('weather.services.ThreadPoolExecutor') as executor:
+            services.fetch_weather_many({'one': (9.0, 7.5)})
+        executor.assert_not_called()
+        self.assertEqual(self.provider.calls, 1)
+
+    @override_settings(WEATHER_FANOUT_MAX_WORKERS=1)
+    def test_all_view_reads_the_cache_once(self):
+        countries = {'Africa': {'Lagos': {'lat': 6.5, 'lon': 3.375}, 'Kano': {'lat': 12.0, 'lon': 8.5}}}
+        services.fetch_weather(6.5, 3.375)
+        self.provider.failing.add((12.0, 8.5))
+        with mock.patch('weather.views.SELECTED_COUNTRIES', countries), \
+                mock.patch.object(cache, 'get_many', wraps=cache.get_many) as get_many:
+            partial = self.client.get('/api/weather/all/')
+            self.assertEqual(get_many.call_count, 1)
+            self.assertIn('error', partial.json()['Africa']['Kano'])
+            self.assertEqual(partial['Cache-Control'], 'public, max-age=0')
+
+            self.provider.failing.clear()
+            complete = self.client.get('/api/weather/all/')
+            self.assertNotEqual(complete['ETag'], partial['ETag'])
+            self.assertNotIn('error', complete.json()['Africa']['Kano'])
+
+            # All fresh now: validators straight from the read, no fan-out
+            cached = self.client.get('/api/weather/all/')
+            self.assertEqual(cached.content, complete.content)
+            get_many.reset_mock()
+            revalidated = self.client.get('/api/weather/all/', HTTP_IF_NONE_MATCH=cached['ETag'])
+            self.assertEqual(revalidated.status_code, 304)
+            self.assertEqual(get_many.call_count, 1)
+        self.assertEqual(self.provider.calls, 3)
+
+    def set_states(self, **coords):
+        """Replace the State rows (the migrations load all of Nigeria's) with these."""
+        self.addCleanup(registry.invalidate)
+        State.objects.all().delete()
+        for name, (lat, lon) in coords.items():
+            State.objects.create(name=name, latitude=lat, longitude=lon)
+
+    @override_settings(WEATHER_FANOUT_MAX_WORKERS=1)
+    def test_crop_matrix_fetches_misses_and_serves_stale(self):
+        self.set_states(Lagos=(6.5, 3.375), Kano=(12.0, 8.5), Oyo=(8.0, 4.0), Borno=(11.5, 13.0))
+        services.fetch_weather(6.5, 3.375)
+        store_stale_entry(12.0, 8.5)
+        self.provider.failing.add((11.5, 13.0))
+
+        with mock.patch.object(services, '_schedule_refresh') as schedule_refresh:
+            response = self.client.get('/api/crops/matrix/nigeria/')
+        schedule_refresh.assert_called_once()
+        self.assertEqual(schedule_refresh.call_args.args[:2], (12.0, 8.5))
+        self.assertEqual(response.status_code, 200, response.content)
+        rows = {row['state']: row for row in response.json()['locations']}
+        for name in ('Lagos', 'Kano', 'Oyo'):
+            self.assertEqual(len(rows[name]['scores']), len(CROP_NAMES), name)
+        self.assertIn('No data for 11.5,13.0', rows['Borno']['error'])
+        self.assertEqual(response['Cache-Control'], 'public, max-age=0')
+        self.assertEqual(self.provider.calls, 3)  # Lagos up front, Oyo and Borno
+
+    @override_settings(WEATHER_FANOUT_MAX_WORKERS=1, WEATHER_REQUEST_DEADLINE=0.2)
+    def test_crop_matrix_within_the_request_deadline(self):
+        self.set_states(Lagos=(6.5, 3.375), Oyo=(8.0, 4.0))
+        services.fetch_weather(6.5, 3.375)
+        self.provider.blocked.add((8.0, 4.0))
+
+        started = time.monotonic()
+        response = self.client.get('/api/crops/matrix/nigeria/')
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(response.status_code, 200, response.content)
+        rows = {row['state']: row for row in response.json()['locations']}
+        self.assertIn('scores', rows['Lagos'])
+        self.assertTrue(rows['Oyo']['error'].startswith('Timed out after'), rows['Oyo'])
+
+
+@override_settings(CACHES=LOCMEM, WEATHER_FANOUT_MAX_WORKERS=1)
+class BatchTests(StubProviderMixin, TransactionTestCase):
+    """POST /api/weather/batch/; fetches go through the fan-out pool, see FanOutTests."""
+    def post(self, body):
+        return self.client.post('/api/weather/batch/', body, content_type='application/json')
+
+    def test_rejects_bad_bodies(self):
+        for body in ({}, {'locations': []}, {'locations': 'Lagos'}, ['Lagos']):
+            self.assertEqual(self.post(body).status_code, 400, body)
+        self.assertEqual(self.provider.calls, 0)
+
+    @override_settings(WEATHER_BATCH_MAX_SIZE=3)
+    def test_size_cap(self):
+        locations = [{'lat': 9.0, 'lon': 7.5}] * 4
+        response = self.post({'locations': locations})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('At most 3 locations', response.json()['error'])
+        self.assertEqual(self.provider.calls, 0)
+        self.assertEqual(self.post({'locations': locations[:3]}).status_code, 200)
+
+    def test_per_item_results_in_request_order(self):
+        self.provider.failing.add((12.0, 8.5))
+        items = [
+            'Nigeria - Kano',
+            {'lat': 9.0, 'lon': 7.5},
+            'Nigeria - Kanoo',
+            {'lat': 91, 'lon': 0},
+            {'lat': 'north'},
+            {'lat': 12.0, 'lon': 8.5},
+            42,
+        ]
+        response = self.post({'locations': items})
+        self.assertEqual(response.status_code, 200, response.content)
+        results = response.json()['results']
+        self.assertEqual([r['query'] for r in results], items)
+
+        self.assertEqual(results[0]['location']['country'], 'Nigeria Kano')
+        self.assertIn('weather', results[0])
+        self.assertIn('weather', results[1])
+        self.assertIn("Did you mean 'Nigeria - Kano'", results[2]['error'])
+        self.assertEqual(results[3]['error'], 'Coordinates out of range.')
+        self.assertIn("numeric 'lat' and 'lon'", results[4]['error'])
+        self.assertIn('No data for 12.0,8.5', results[5]['error'])
+        self.assertIn('must be a name or an object', results[6]['error'])
+        for result in results[2:]:
+            self.assertNotIn('weather', result)
+
+
+@override_settings(CACHES=LOCMEM)
+class ForecastTests(StubProviderMixin, TestCase):
+    url = '/api/weather/Africa/Nigeria%20-%20Kano/'
+
+    def test_outlook_aggregates(self):
+        series = make_series(hours=6)
+        series['airTemperature'] = [8.0, 12.0, None, 20.0, 30.0, 40.0]
+        series['precipitation'] = [1.0, None, 2.5, 0.0, 0.5, 9.0]
+        outlook = forecast.outlook(series, start_index=1, hours=4)
+        self.assertEqual(outlook, {
+            'hours': 4,
+            'rainfall_total': 3.0,
+            'temperature_min': 12.0,
+            'temperature_max': 30.0,
+            'temperature_mean': 20.7,
+            'degree_days': round((2 + 10 + 20) / 24, 1),
+        })
+        # Cut short at the end of the series
+        self.assertEqual(forecast.outlook(series, start_index=4, hours=168)['hours'], 2)
+
+    def test_outlook_is_computed_once_per_entry(self):
+        entry = services.make_entry(make_series())
+        with mock.patch.object(forecast, 'outlook') as outlook:
+            self.assertEqual(services.entry_outlook(entry), entry['outlook'])
+        outlook.assert_not_called()
+
+    def test_outlook_changes_the_score(self):
+        weather = random_weather(random.Random(7))
+        weather.update(temperature={'air': 28.0, 'soil': 25.0}, soil_moisture=0.4, uv_index=3)
+        calm = score_crop('Maize', weather)
+        cold = score_crop('Maize', weather, forecast_7day={'hours': 168, 'temperature_min': 2.0, 'rainfall_total': 30})
+        self.assertLess(cold['score'], calm['score'])
+        self.assertTrue(any(r.startswith('Cold spell ahead') for r in cold['reasons']), cold['reasons'])
+
+    def test_hours_selects_a_later_hour(self):
+        now = self.client.get(self.url).json()['weather']
+        later = self.client.get(f'{self.url}?hours=3')
+        self.assertEqual(later.status_code, 200, later.content)
+        hour = datetime.fromisoformat(later.json()['weather']['timestamp'])
+        self.assertEqual((hour - datetime.fromisoformat(now['timestamp'])).total_seconds(), 3 * 3600)
+        self.assertEqual(self.provider.calls, 1)  # both hours come from one cached series
+
+    def test_bad_hours(self):
+        for hours in ('-1', 'soon', '48'):
+            response = self.client.get(f'{self.url}?hours={hours}')
+            self.assertEqual(response.status_code, 400, hours)
+            self.assertIn('hours', response.json()['error'])
+
+
+@override_settings(CACHES=LOCMEM, WEATHER_ASYNC_MAX_CONCURRENCY=1)
+class AsyncViewTests(StubProviderMixin, TransactionTestCase):
+    """The /api/async/ endpoints; one fetch at a time, see AsyncQuotaTests."""
+    def get(self, *urls):
+        async def main():
+            return [await self.async_client.get(url) for url in urls]
+        return asyncio.run(main())
+
+    def test_same_json_as_the_sync_views(self):
+        for path in ('weather/Africa/Nigeria%20-%20Kano/?daily=true', 'weather/with-crops/Africa/Nigeria%20-%20Kano/'):
+            sync = self.client.get(f'/api/{path}')
+            (response,) = self.get(f'/api/async/{path}')
+            self.assertEqual(response.status_code, 200, response.content)
+            self.assertEqual(response.json(), sync.json(), path)
+        self.assertEqual(self.provider.calls, 1)
+
+    def test_errors(self):
+        missing, bad_hours = self.get(
+            '/api/async/weather/Africa/Nigeria%20-%20Kanoo/',
+            '/api/async/weather/Africa/Nigeria%20-%20Kano/?hours=-1',
+        )
+        self.assertEqual(missing.status_code, 404)
+        self.assertIn('Nigeria - Kano', missing.json()['suggestions'])
+        self.assertEqual(bad_hours.status_code, 400)
+
+        self.provider.failing.add(quantize(12.0022, 8.5920))  # Nigeria - Kano's grid cell
+        (failing,) = self.get('/api/async/weather/Africa/Nigeria%20-%20Kano/')
+        self.assertEqual(failing.status_code, 500)
+        self.assertIn('No data', failing.json()['error'])
+
+    def test_state_weather(self):
+        self.addCleanup(registry.invalidate)
+        # Loaded by the migrations, unless an earlier TransactionTestCase flushed it
+        State.objects.update_or_create(name='Lagos', defaults=dict(
+            capital='Ikeja', abbreviation='LA', latitude=6.5, longitude=3.375))
+        by_alias, missing = self.get('/api/async/locations/nigeria/ikeja/', '/api/async/locations/nigeria/Lagoss/')
+        self.assertEqual(by_alias.status_code, 200, by_alias.content)
+        self.assertEqual(by_alias.json()['location']['state'], 'Lagos')
+        self.assertIn('temperature', by_alias.json()['weather'])
+        self.assertEqual(missing.status_code, 404)
+        self.assertEqual(missing.json()['suggestions'], ['Lagos'])
+
+    def test_concurrent_misses_share_one_fetch(self):
+        from .async_services import afetch_weather
+
+        async def main():
+            return await asyncio.gather(*(afetch_weather(9.06, 7.49) for _ in range(10)))
+
+        results = asyncio.run(main())
+        self.assertEqual(self.provider.calls, 1)
+        self.assertEqual(len({r['temperature']['air'] for r in results}), 1)
+
+    def test_all_locations(self):
+        everything, streamed = self.get('/api/async/weather/all/', '/api/async/weather/all/?stream=true')
+        rows = [row for locations in everything.json().values() for row in locations.values()]
+        self.assertTrue(rows)
+        self.assertTrue(all('error' not in row for row in rows))
+        self.assertEqual(streamed['Content-Type'], 'application/x-ndjson')
+
+        async def lines():
+            return [line async for line in streamed.streaming_content]
+        self.assertEqual(len(b''.join(asyncio.run(lines())).splitlines()), len(rows))
+
+
+class ObservationTests(TestCase):
+    """The observation store; writes are called directly rather than queued."""
+    start = 1717200000  # 2024-06-01T00:00Z
+
+    def series(self, temperature=25.0, agri=True):
+        series = make_series(hours=48, temperature=temperature)
+        series['time'] = [self.start + 3600 * i for i in range(48)]
+        series['airTemperature'] = [temperature + i % 24 for i in range(48)]
+        if agri:
+            series.update(soilMoisture=[0.3] * 48, soilTemperature=[22.0] * 48, uvIndex=[5.0] * 48)
+        return series
+
+    def test_save_series_upserts_by_cell_and_hour(self):
+        observations.save_series(9.0, 7.5, self.series(), self.start)
+        observations.save_series(9.0, 7.5, self.series(temperature=30.0, agri=False), self.start + 3600)
+        self.assertEqual(Observation.objects.count(), 48)
+        first = Observation.objects.first()
+        self.assertEqual(first.air_temperature, 30.0)
+        self.assertEqual(first.soil_moisture, 0.3)  # kept: the later fetch had no agriculture data
+
+    @override_settings(WEATHER_STORE_OBSERVATIONS=False)
+    def test_record_can_be_turned_off(self):
+        observations.record(9.0, 7.5, self.series(), self.start)
+        observations._writer.submit(lambda: None).result(5)
+        self.assertFalse(Observation.objects.exists())
+
+    def test_history_hourly_and_daily(self):
+        observations.save_series(9.0, 7.5, self.series(), self.start)
+        june_1 = datetime.fromisoformat('2024-06-01T00:00:00+00:00')
+        june_3 = datetime.fromisoformat('2024-06-03T00:00:00+00:00')
+        hourly = observations.history(9.0, 7.5, june_1, june_3)
+        self.assertEqual(len(hourly), 48)
+        self.assertEqual(hourly[0]['timestamp'], june_1)
+
+        daily = observations.history(9.0, 7.5, june_1, june_3, 'daily')
+        self.assertEqual([d['date'].isoformat() for d in daily], ['2024-06-01', '2024-06-02'])
+        for day in daily:
+            self.assertEqual(day['hours'], 24)
+            self.assertEqual((day['temperature_min'], day['temperature_max'], day['temperature_mean']), (25, 48, 36.5))
+            self.assertEqual(day['rainfall_total'], 12.0)
+            self.assertEqual(day['uv_index_max'], 5.0)
+
+        with self.assertRaises(ValueError):
+            observations.history(9.0, 7.5, june_1, june_3, 'weekly')
+
+    def test_stored_cell_within_tolerance(self):
+        observations.save_series(9.0, 7.5, self.series(), self.start)
+        self.assertEqual(observations.stored_cell(9.04, 7.47), (9.0, 7.5))
+        self.assertEqual(observations.stored_cell(12.0, 8.5), quantize(12.0, 8.5))
+
+    def test_history_view(self):
+        observations.save_series(9.0, 7.5, self.series(), self.start)
+        url = '/api/weather/history/?lat=9.02&lon=7.49&start=2024-06-01&end=2024-06-02'
+        hourly = self.client.get(url)
+        self.assertEqual(hourly.status_code, 200, hourly.content)
+        self.assertEqual(hourly.json()['cell'], {'lat': 9.0, 'lon': 7.5})
+        self.assertEqual(len(hourly.json()['data']), 24)
+        daily = self.client.get(f'{url}&resolution=daily')
+        self.assertEqual([d['date'] for d in daily.json()['data']], ['2024-06-01'])
+
+        for query in ('lat=9&lon=7.5&resolution=weekly', 'lat=9&lon=7.5&start=2024-06-02&end=2024-06-01',
+                      'lat=9&lon=7.5&start=yesterday', 'lat=north&lon=7.5'):
+            self.assertEqual(self.client.get(f'/api/weather/history/?{query}').status_code, 400, query)
+
+
+@override_settings(CACHES=LOCMEM)
+class TimingTests(StubProviderMixin, TestCase):
+    def test_histogram_exposition(self):
+        histogram = timing.Histogram('test_seconds', 'Test.', 'stage', buckets=(0.1, 1))
+        for seconds in (0.05, 0.5, 0.5, 5):
+            histogram.observe('a "b"', seconds)
+        self.assertEqual(histogram.exposition(), [
+            '# HELP test_seconds Test.',
+            '# TYPE test_seconds histogram',
+            'test_seconds_bucket{stage="a \\"b\\"",le="0.1"} 1',
+            'test_seconds_bucket{stage="a \\"b\\"",le="1"} 3',
+            'test_seconds_bucket{stage="a \\"b\\"",le="+Inf"} 4',
+            'test_seconds_sum{stage="a \\"b\\""} 6.05',
+            'test_seconds_count{stage="a \\"b\\""} 4',
+        ])
+
+    def test_server_timing_sums_repeated_stages(self):
+        value = timing.server_timing([('cache', 0.001), ('stub', 0.02), ('cache', 0.002)], 0.05)
+        self.assertEqual(value, 'cache;dur=3.0;desc="2x", stub;dur=20.0, total;dur=50.0')
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/weather/with-crops/Africa/Nigeria%20-%20Kano/')
+        stages = [part.split(';')[0] for part in response['Server-Timing'].split(', ')]
+        for stage in ('cache', 'crops', 'render'):
+            self.assertIn(stage, stages)
+        self.assertEqual(stages[-1], 'total')
+        self.assertIn('total;dur=', self.client.get('/api/weather/batch/')['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        self.client.get('/api/weather/Africa/Nigeria%20-%20Kano/')
+        self.client.get('/api/weather/Africa/Nigeria%20-%20Kano/')
+        metrics.flush()
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        self.assertGreaterEqual(samples['weather_stage_duration_seconds_count{stage="cache"}'], 2)
+        self.assertGreaterEqual(samples['weather_cache_lookups_total{result="miss"}'], 1)
+        self.assertGreaterEqual(samples['weather_cache_lookups_total{result="hit"}'], 1)
+        self.assertIn('weather_request_duration_seconds_count{route="api/weather/<str:continent>/<str:country>/"}',
+                      samples)
+
+
+@override_settings(CACHES=LOCMEM, WEATHER_FANOUT_MAX_WORKERS=1)
+class StreamTests(StubProviderMixin, TransactionTestCase):
+    """/api/weather/all/?stream=true; one fetch at a time, see FanOutTests."""
+    countries = {'Africa': {
+        'Nigeria - Abuja': {'lat': 9.0, 'lon': 7.5},
+        'Nigeria - Kano': {'lat': 12.0, 'lon': 8.5},
+        'Nigeria - Lagos': {'lat': 6.5, 'lon': 3.375},
+    }}
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('weather.views.SELECTED_COUNTRIES', self.countries)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.provider.release.set)
+
+    def test_lines_as_locations_resolve(self):
+        services.fetch_weather(6.5, 3.375)
+        self.provider.blocked.add((9.0, 7.5))
+        self.provider.failing.add((12.0, 8.5))
+
+        response = self.client.get('/api/weather/all/?stream=true')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertNotIn('ETag', response)  # not every location was fresh
+        lines = iter(response.streaming_content)
+        # The cached location comes first, while the slow fetch is still blocked
+        cached = json.loads(next(lines))
+        self.assertEqual(cached['location'], 'Nigeria Lagos')
+        self.assertIn('temperature', cached['weather'])
+
+        self.provider.release.set()
+        slow, failing = json.loads(next(lines)), json.loads(next(lines))
+        self.assertEqual((slow['continent'], slow['location']), ('Africa', 'Nigeria Abuja'))
+        self.assertIn('weather', slow)
+        self.assertEqual(failing['location'], 'Nigeria Kano')
+        self.assertIn('No data', failing['error'])
+        self.assertEqual(list(lines), [])
+
+    def test_fresh_stream_matches_the_json_body(self):
+        everything = self.client.get('/api/weather/all/').json()
+        response = self.client.get('/api/weather/all/?stream=true')
+        self.assertIn('ETag', response)
+        streamed = {}
+        for line in b''.join(response.streaming_content).splitlines():
+            row = json.loads(line)
+            streamed.setdefault(row['continent'], {})[row['location']] = row['weather']
+        self.assertEqual(streamed, everything)
+        self.assertEqual(self.provider.calls, 3)
+
+
+class TimedProvider(providers.Provider):
+    """Answers after `delay` seconds (or raises NoData), noting when each fetch started."""
+    remote = False
+
+    def __init__(self, name, delay=0.0, fails=False):
+        self.name = name
+        self.delay = delay
+        self.fails = fails
+        self.started = []
+
+    def _answer(self):
+        if self.fails:
+            raise providers.NoData(f"{self.name} has nothing")
+        return providers.Fetched(make_series(), self)
+
+    def fetch(self, lat, lon):
+        self.started.append(time.monotonic())
+        time.sleep(self.delay)
+        return self._answer()
+
+    async def afetch(self, lat, lon):
+        self.started.append(time.monotonic())
+        await asyncio.sleep(self.delay)
+        return self._answer()
+
+
+class HedgedProviderTests(TestCase):
+    def setUp(self):
+        self.addCleanup(metrics.flush)
+
+    def fetch(self, hedged):
+        started = time.monotonic()
+        result = hedged.fetch(9.0, 7.5)
+        return result.source, time.monotonic() - started
+
+    def test_fallback_asks_the_next_provider_only_after_a_failure(self):
+        primary, backup = TimedProvider('primary', delay=0.1), TimedProvider('backup')
+        source, _ = self.fetch(providers.Hedged([primary, backup], math.inf))
+        self.assertIs(source, primary)
+        self.assertEqual(backup.started, [])
+
+        primary.fails = True
+        source, _ = self.fetch(providers.Hedged([primary, backup], math.inf))
+        self.assertIs(source, backup)
+        self.assertGreaterEqual(backup.started[0] - primary.started[1], 0.1)
+
+    def test_every_provider_failing_raises_the_first_error(self):
+        hedged = providers.Hedged([TimedProvider('a', fails=True), TimedProvider('b', fails=True)], math.inf)
+        with self.assertRaisesRegex(providers.NoData, 'a has nothing'):
+            hedged.fetch(9.0, 7.5)
+
+    def test_hedge_starts_the_backup_after_the_threshold(self):
+        primary, backup = TimedProvider('primary', delay=0.5), TimedProvider('backup', delay=0.01)
+        source, elapsed = self.fetch(providers.Hedged([primary, backup], 0.05))
+        self.assertIs(source, backup)
+        self.assertLess(elapsed, 0.4)
+        self.assertGreaterEqual(backup.started[0] - primary.started[0], 0.05)
+
+        fast = TimedProvider('fast')
+        unused = TimedProvider('unused')
+        source, _ = self.fetch(providers.Hedged([fast, unused], 0.2))
+        self.assertIs(source, fast)
+        self.assertEqual(unused.started, [])
+
+    def test_race_starts_everything_at_once(self):
+        slow, quick = TimedProvider('slow', delay=0.3), TimedProvider('quick', delay=0.01)
+        source, elapsed = self.fetch(providers.Hedged([slow, quick], 0))
+        self.assertIs(source, quick)
+        self.assertLess(elapsed, 0.25)
+        self.assertLess(quick.started[0] - slow.started[0], 0.05)
+
+    def test_async_hedge(self):
+        primary, backup = TimedProvider('primary', delay=0.5), TimedProvider('backup', delay=0.01)
+
+        async def main():
+            started = time.monotonic()
+            result = await providers.Hedged([primary, backup], 0.05).afetch(9.0, 7.5)
+            return result.source, time.monotonic() - started
+
+        source, elapsed = asyncio.run(main())
+        self.assertIs(source, backup)
+        self.assertLess(elapsed, 0.4)
+        self.assertGreaterEqual(backup.started[0] - primary.started[0], 0.05)
+
+    def test_fallback_gives_up_at_the_deadline(self):
+        hedged = providers.Hedged([TimedProvider('stuck', delay=1), TimedProvider('backup')], math.inf)
+        started = time.monotonic()
+        with deadline.within(0.1), self.assertRaises(deadline.DeadlineExceeded):
+            hedged.fetch(9.0, 7.5)
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_build(self):
+        def named(name):
+            return type(name, (TimedProvider,), {'__init__': lambda self: TimedProvider.__init__(self, name)})
+
+        with mock.patch.dict(providers._registry, {'a': named('a'), 'b': named('b')}):
+            self.assertEqual(providers.build(['a']).name, 'a')
+            for strategy, after in (('fallback', math.inf), ('hedge', 1.5), ('race', 0)):
+                hedged = providers.build(['a', 'b'], strategy, hedge_after=1.5)
+                self.assertEqual((hedged.name, hedged.after), ('a+b', after))
+            for names, strategy in ((['a', 'nope'], 'fallback'), ([], 'fallback'), (['a', 'b'], 'fastest')):
+                with self.assertRaises(ImproperlyConfigured):
+                    providers.build(names, strategy)
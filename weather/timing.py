@@ -0,0 +1,159 @@
+# weather/timing.py
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+# Where a request's time goes. Hot-path stages (cache lookup, each upstream
+# endpoint, crop scoring, rendering) are timed with stage() / observe():
+# - each timing is added to the current request's Server-Timing header
+#   (ServerTimingMiddleware), summed per stage when a stage runs more than
+#   once (e.g. the /all/ fan-out)
+# - and to a latency histogram, served in Prometheus text format at /metrics
+# Histograms are per worker process, like the circuit breakers; scrape each
+# worker (or run one per container) to see them all.
+
+# Seconds; fine-grained at the low end, where cache hits and rendering live
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Stage timings of the request being handled: a list of (stage, seconds).
+# Appending is atomic, so pool threads running in a copy of the request's
+# context (see client.submit, services.fetch_weather_many) can add to it.
+_timings = contextvars.ContextVar('weather_timings', default=None)
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram, one series per label value."""
+
+    def __init__(self, name, help, label, buckets=BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = buckets
+        self._series = {}  # label value -> [per-bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            series = self._series.get(value)
+            if series is None:
+                series = self._series[value] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][i] += 1
+            series[1] += seconds
+
+    def exposition(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = {value: (list(counts), total) for value, (counts, total) in self._series.items()}
+        for value, (counts, total) in sorted(series.items()):
+            label = f'{self.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, count in zip((*self.buckets, '+Inf'), counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label}}} {total}')
+            lines.append(f'{self.name}_count{{{label}}} {cumulative}')
+        return lines
+
+
+def exposition_lines(name, help, kind, samples):
+    """Prometheus text lines for a metric: `samples` are ({label: value}, number) pairs."""
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for labels, number in samples:
+        rendered = ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        lines.append(f'{name}{{{rendered}}} {number}' if rendered else f'{name} {number}')
+    return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+STAGES = Histogram('weather_stage_duration_seconds', 'Time spent per hot-path stage.', 'stage')
+UPSTREAM = Histogram('weather_upstream_request_duration_seconds', 'Stormglass call duration per endpoint.',
+                     'endpoint')
+REQUESTS = Histogram('weather_request_duration_seconds', 'Request duration per route.', 'route')
+HISTOGRAMS = (STAGES, UPSTREAM, REQUESTS)
+
+
+def observe(stage, seconds):
+    """Record a timed stage for the current request (if any) and the stage histogram."""
+    STAGES.observe(stage, seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+def observe_upstream(endpoint, seconds):
+    """A Stormglass call: its own histogram, and an `endpoint` stage of the request."""
+    UPSTREAM.observe(endpoint, seconds)
+    observe(endpoint, seconds)
+
+
+@contextmanager
+def stage(name):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - started)
+
+
+def server_timing(timings, total):
+    """Server-Timing header value: per-stage totals in ms, then the whole request."""
+    stages = {}
+    for name, seconds in timings:
+        duration, count = stages.get(name, (0.0, 0))
+        stages[name] = (duration + seconds, count + 1)
+    parts = [
+        f'{name};dur={duration * 1000:.1f}' + (f';desc="{count}x"' if count > 1 else '')
+        for name, (duration, count) in stages.items()
+    ]
+    parts.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(parts)
+
+
+class ServerTimingMiddleware:
+    """Collects the stage timings of each request into a Server-Timing header."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._async = iscoroutinefunction(get_response)
+        if self._async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self._async:
+            return self.__acall__(request)
+        timings = []
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        timings = []
+        token = _timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _timings.reset(token)
+        return self._finish(request, response, timings, time.perf_counter() - started)
+
+    def _finish(self, request, response, timings, total):
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            REQUESTS.observe(match.route or match.view_name, total)
+        response['Server-Timing'] = server_timing(timings, total)
+        return response
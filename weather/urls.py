@@ -3,6 +3,10 @@ from . import views
 
 urlpatterns = [
     path('weather/<str:continent>/<str:country>/', views.get_weather_by_country, name='weather_by_country'),
+    path('weather/quota/', views.get_upstream_quota, name='upstream_quota'),
+    path('weather/history/', views.get_weather_history, name='weather_history'),
+    path('weather/batch/', views.get_weather_batch, name='weather_batch'),
     path('weather/all/', views.get_all_countries_weather, name='all_weather'),
     path('weather/with-crops/<str:continent>/<str:country>/', views.get_weather_with_crop_recommendations, name='weather_with_crops'),
+    path('crops/matrix/nigeria/', views.get_nigeria_crop_matrix, name='nigeria_crop_matrix'),
 ]
\ No newline at end of file
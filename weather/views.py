@@ -1,149 +1,433 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import status
-from .serializers import WeatherSerializer, WeatherWithCropsSerializer
-from .services import fetch_weather
-from .crop_rules import CROP_DATABASE, score_crop, generate_alerts
-
-# Central country/state database — clean and easy to extend
-SELECTED_COUNTRIES = {
-    "North America": {
-        "USA": {"lat": 39.8283, "lon": -98.5795},
-    },
-    "South America": {
-        "Brazil": {"lat": -14.2350, "lon": -51.9253},
-    },
-    "Europe": {
-        "Germany": {"lat": 51.1657, "lon": 10.4515},
-    },
-    "Asia": {
-        "India": {"lat": 20.5937, "lon": 78.9629},
-    },
-    "Africa": {
-        "Nigeria - Abia":           {"lat": 5.4527,  "lon": 7.5247},
-        "Nigeria - Adamawa":        {"lat": 9.3265,  "lon": 12.3984},
-        "Nigeria - Akwa Ibom":      {"lat": 4.9290,  "lon": 7.9278},
-        "Nigeria - Anambra":        {"lat": 6.2209,  "lon": 7.0684},
-        "Nigeria - Bauchi":         {"lat": 10.7761, "lon": 9.9992},
-        "Nigeria - Bayelsa":        {"lat": 4.7719,  "lon": 6.0699},
-        "Nigeria - Benue":          {"lat": 7.3369,  "lon": 8.7404},
-        "Nigeria - Borno":          {"lat": 11.5097, "lon": 13.1239},
-        "Nigeria - Cross River":    {"lat": 4.9600,  "lon": 8.3300},
-        "Nigeria - Delta":          {"lat": 5.7046,  "lon": 5.9350},
-        "Nigeria - Ebonyi":         {"lat": 6.2649,  "lon": 8.0137},
-        "Nigeria - Edo":            {"lat": 6.6342,  "lon": 5.9304},
-        "Nigeria - Ekiti":          {"lat": 7.7188,  "lon": 5.3103},
-        "Nigeria - Enugu":          {"lat": 6.4584,  "lon": 7.5464},
-        "Nigeria - FCT Abuja":      {"lat": 9.0765,  "lon": 7.3986},
-        "Nigeria - Gombe":          {"lat": 10.2791, "lon": 11.1715},
-        "Nigeria - Imo":            {"lat": 5.5720,  "lon": 7.0588},
-        "Nigeria - Jigawa":         {"lat": 12.2280, "lon": 9.5616},
-        "Nigeria - Kaduna":         {"lat": 10.5105, "lon": 7.4165},
-        "Nigeria - Kano":           {"lat": 12.0022, "lon": 8.5920},
-        "Nigeria - Katsina":        {"lat": 12.9194, "lon": 7.6000},
-        "Nigeria - Kebbi":          {"lat": 12.4505, "lon": 4.1996},
-        "Nigeria - Kogi":           {"lat": 7.7337,  "lon": 6.6906},
-        "Nigeria - Kwara":          {"lat": 8.9669,  "lon": 4.3874},
-        "Nigeria - Lagos":          {"lat": 6.5244,  "lon": 3.3792},
-        "Nigeria - Nasarawa":       {"lat": 8.5333,  "lon": 7.7000},
-        "Nigeria - Niger":          {"lat": 9.6000,  "lon": 6.5500},
-        "Nigeria - Ogun":           {"lat": 7.0000,  "lon": 3.5833},
-        "Nigeria - Ondo":           {"lat": 7.1000,  "lon": 4.8333},
-        "Nigeria - Osun":           {"lat": 7.5624,  "lon": 4.5200},
-        "Nigeria - Oyo":            {"lat": 8.1574,  "lon": 3.6147},
-        "Nigeria - Plateau":        {"lat": 9.2182,  "lon": 9.5179},
-        "Nigeria - Rivers":         {"lat": 4.8156,  "lon": 7.0498},
-        "Nigeria - Sokoto":         {"lat": 13.0667, "lon": 5.2333},
-        "Nigeria - Taraba":         {"lat": 8.0000,  "lon": 10.5000},
-        "Nigeria - Yobe":           {"lat": 12.1871, "lon": 11.7068},
-        "Nigeria - Zamfara":        {"lat": 12.1222, "lon": 6.2333},
-    },
-    "Oceania": {
-        "Australia": {"lat": -25.2744, "lon": 133.7751},
-    },
-}
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .serializers import (
+    WeatherSerializer, WeatherWithCropsSerializer, DailyForecastSerializer, ObservationSerializer,
+    DailyHistorySerializer,
+)
+from .services import (
+    cached_entries_many, conditions_from_entry, entry_outlook, fetch_entry, fetch_weather_many, fresh_for,
+    iter_weather_many,
+)
+from locations.registry import COUNTRY, get_registry
+from .crop_rules import generate_alerts
+from .crop_engine import score_all
+from .crop_matrix import nigeria_crop_matrix
+from . import circuit, conditional, deadline, fastjson, forecast, metrics, observations, quota, timing
+from .providers import AGRI_URL, BASE_URL
+from .quota import UpstreamUnavailable
+from .countries import SELECTED_COUNTRIES
+
+# Hot endpoints skip DRF's per-request serializer and renderer work; bodies
+# are rendered once per ETag (see weather.fastjson)
+render_weather = fastjson.compile(WeatherSerializer)
+render_daily = fastjson.compile(DailyForecastSerializer(many=True))
+render_weather_with_crops = fastjson.compile(WeatherWithCropsSerializer)
+
+def parse_hours(request):
+    """`?hours=N` selects conditions N hours from now (default 0 = current)."""
+    raw = request.GET.get('hours', '0')
+    try:
+        hours = int(raw)
+    except ValueError:
+        raise ValueError("hours must be a whole number")
+    if hours < 0:
+        raise ValueError("hours must not be negative")
+    return hours
+
+
+def wants_daily(request):
+    """`?daily=true` adds per-day aggregates of the cached hourly series."""
+    return request.GET.get('daily', '').lower() in ('1', 'true', 'yes')
+
+
+def wants_stream(request):
+    """`?stream=true` streams one NDJSON line per location as each resolves."""
+    return request.GET.get('stream', '').lower() in ('1', 'true', 'yes')
+
+
+def ndjson_location(key, data, error):
+    """One /all/ NDJSON line: a location's weather (or error) with its name."""
+    continent, name = key
+    line = {"continent": continent, "location": name.replace(" - ", " ")}
+    if error:
+        line["error"] = error
+    else:
+        line["weather"] = render_weather(data)
+    return fastjson.dumps(line) + b"\n"
+
 
 @api_view(['GET'])
+@deadline.bounded
 def get_weather_by_country(request, continent, country):
-    if continent not in SELECTED_COUNTRIES or country not in SELECTED_COUNTRIES[continent]:
+    registry = get_registry()
+    location = registry.country(continent, country)
+    if location is None:
         return Response(
-            {"error": "Invalid continent or location. Check spelling and spaces."},
+            {"error": "Invalid continent or location. Check spelling and spaces.",
+             "suggestions": registry.suggest(country, COUNTRY)},
             status=status.HTTP_404_NOT_FOUND
         )
-
-    coords = SELECTED_COUNTRIES[continent][country]
-    lat, lon = coords['lat'], coords['lon']
+    continent, country = location.continent, location.name
+    lat, lon = location.lat, location.lon
 
     try:
-        data = fetch_weather(lat, lon)
-        serializer = WeatherSerializer(data)
-        return Response({
-            "location": {
-                "continent": continent,
-                "country": country.replace(" - ", " "),  # Make display nicer
-                "lat": lat,
-                "lon": lon
-            },
-            "weather": serializer.data
-        })
+        hours = parse_hours(request)
+        entry, stale = fetch_entry(lat, lon)
+        validators = conditional.for_entries(request, [(entry, stale)], hourly=bool(hours))
+        not_modified = conditional.not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        def build():
+            response_data = {
+                "location": {
+                    "continent": continent,
+                    "country": country.replace(" - ", " "),  # Make display nicer
+                    "lat": lat,
+                    "lon": lon
+                },
+                "weather": render_weather(conditions_from_entry(entry, stale, hours))
+            }
+            if wants_daily(request):
+                response_data["daily"] = render_daily(forecast.daily_aggregates(entry['series']))
+            return response_data
+
+        body = fastjson.rendered().render(validators.etag, build)
+        return fastjson.response(body, headers=validators.headers())
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except UpstreamUnavailable as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
         return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
 @api_view(['GET'])
 def get_all_countries_weather(request):
-    results = {}
-    for continent, locations in SELECTED_COUNTRIES.items():
-        results[continent] = {}
-        for name, coords in locations.items():
-            try:
-                data = fetch_weather(coords['lat'], coords['lon'])
-                serializer = WeatherSerializer(data)
-                results[continent][name.replace(" - ", " ")] = serializer.data
-            except Exception as e:
-                results[continent][name.replace(" - ", " ")] = {"error": str(e)}
-    return Response(results)
+    """
+    Weather for every supported location, as one JSON object keyed by
+    continent and location. With `?stream=true`, the response is NDJSON
+    instead: a line per location in the order they resolve, so clients can
+    render the cached ones before the slowest upstream fetch comes back.
+    """
+    coords = {
+        (continent, name): (c['lat'], c['lon'])
+        for continent, locations in SELECTED_COUNTRIES.items()
+        for name, c in locations.items()
+    }
+    # The cache is read once; the validators and the body both come from it
+    entries = cached_entries_many(coords)
+    fresh = {key for key, entry in entries.items() if entry and fresh_for(entry) > 0}
+    validators = None
+    if len(fresh) == len(coords):
+        # Every location fresh in the cache: the client's copy may still be current
+        validators = conditional.for_entries(request, [(entry, False) for entry in entries.values()])
+        not_modified = conditional.not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+    if wants_stream(request):
+        # Validators are only known up front when every entry is fresh
+        return StreamingHttpResponse(
+            (ndjson_location(*result) for result in iter_weather_many(coords, entries=entries)),
+            content_type='application/x-ndjson',
+            headers=validators.headers() if validators else None,
+        )
+
+    fetched = fetch_weather_many(coords, entries=entries)
+    if validators is None:
+        # Locations that weren't fresh were fetched (or served stale) since the
+        # read; their results go into the ETag so it stays true to this body
+        validators = conditional.for_entries(
+            request, [(entries[key], key not in fresh) for key in coords],
+            vary=[repr([fetched[key] for key in coords if key not in fresh])],
+        )
+
+    def build():
+        results = {}
+        for continent, locations in SELECTED_COUNTRIES.items():
+            results[continent] = {}
+            for name in locations:
+                data, error = fetched[(continent, name)]
+                if error:
+                    results[continent][name.replace(" - ", " ")] = {"error": error}
+                else:
+                    results[continent][name.replace(" - ", " ")] = render_weather(data)
+        return results
+
+    body = fastjson.rendered().render(validators.etag, build)
+    return fastjson.response(body, headers=validators.headers())
+
+
+def _resolve_batch_item(item):
+    """Map one batch entry to a location dict with lat/lon, or raise ValueError."""
+    if isinstance(item, dict):
+        try:
+            lat, lon = float(item['lat']), float(item['lon'])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError("Coordinates need numeric 'lat' and 'lon'.")
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("Coordinates out of range.")
+        return {"lat": lat, "lon": lon}
+
+    if isinstance(item, str):
+        registry = get_registry()
+        location = registry.get(item)
+        if location is None:
+            suggestions = registry.suggest(item)
+            hint = f" Did you mean {', '.join(repr(s) for s in suggestions)}?" if suggestions else ""
+            raise ValueError(f"Unknown location '{item}'.{hint}")
+        if location.kind == COUNTRY:
+            return {
+                "continent": location.continent,
+                "country": location.name.replace(" - ", " "),
+                "lat": location.lat,
+                "lon": location.lon,
+            }
+        return {"state": location.name, "lat": location.lat, "lon": location.lon}
+
+    raise ValueError("Each location must be a name or an object with 'lat' and 'lon'.")
+
+
+@api_view(['POST'])
+def get_weather_batch(request):
+    """
+    Weather for many locations in one call. Body:
+        {"locations": ["Nigeria - Kano", "Lagos", {"lat": 9.05, "lon": 7.49}]}
+    Results come back in request order. Fresh cached locations are served
+    directly; the rest are fetched concurrently.
+    """
+    items = request.data.get('locations') if isinstance(request.data, dict) else None
+    if not isinstance(items, list) or not items:
+        return Response(
+            {"error": "Body must be {\"locations\": [...]} with at least one entry."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(items) > settings.WEATHER_BATCH_MAX_SIZE:
+        return Response(
+            {"error": f"At most {settings.WEATHER_BATCH_MAX_SIZE} locations per batch."},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    results = [None] * len(items)
+    coords = {}
+    for i, item in enumerate(items):
+        try:
+            location = _resolve_batch_item(item)
+        except ValueError as e:
+            results[i] = {"query": item, "error": str(e)}
+            continue
+        results[i] = {"query": item, "location": location}
+        coords[i] = (location['lat'], location['lon'])
+
+    # One cache read for the whole batch; stale entries and misses are then
+    # fetched concurrently, as for /all/
+    for i, data, error in iter_weather_many(coords):
+        if error:
+            results[i]["error"] = error
+        else:
+            results[i]["weather"] = WeatherSerializer(data).data
+
+    return Response({"results": results})
 
 
 @api_view(['GET'])
+@deadline.bounded
 def get_weather_with_crop_recommendations(request, continent, country):
-    if continent not in SELECTED_COUNTRIES or country not in SELECTED_COUNTRIES[continent]:
+    registry = get_registry()
+    location = registry.country(continent, country)
+    if location is None:
         return Response(
-            {"error": "Location not found. Use exact name like 'Nigeria - Kano' (with space-dash-space)."},
+            {"error": "Location not found. Use a name like 'Nigeria - Kano'.",
+             "suggestions": registry.suggest(country, COUNTRY)},
             status=status.HTTP_404_NOT_FOUND
         )
+    continent, country = location.continent, location.name
+    lat, lon = location.lat, location.lon
+
+    try:
+        hours = parse_hours(request)
+        entry, stale = fetch_entry(lat, lon)
+        # Seasonal rules make recommendations month-dependent
+        validators = conditional.for_entries(request, [(entry, stale)], hourly=bool(hours),
+                                             vary=[datetime.utcnow().month])
+        not_modified = conditional.not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+
+        def build():
+            weather = conditions_from_entry(entry, stale, hours)
 
-    coords = SELECTED_COUNTRIES[continent][country]
-    lat, lon = coords['lat'], coords['lon']
+            # Generate crop recommendations (all crops in one vectorized pass),
+            # taking the multi-day outlook into account
+            outlook = entry_outlook(entry)
+            with timing.stage('crops'):
+                recommendations = score_all(weather, outlook=outlook)
+                recommendations.sort(key=lambda x: x['score'], reverse=True)
+                top_crops = recommendations[:5]
 
+                alerts = generate_alerts(weather)
+
+            return render_weather_with_crops({
+                "location": {
+                    "continent": continent,
+                    "country": country.replace(" - ", " "),  # Clean display name
+                    "lat": lat,
+                    "lon": lon
+                },
+                "weather": weather,
+                "outlook": outlook,
+                "recommended_crops": top_crops,
+                "alerts": alerts
+            })
+
+        body = fastjson.rendered().render(validators.etag, build)
+        return fastjson.response(body, headers=validators.headers())
+
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except UpstreamUnavailable as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+    except Exception as e:
+        return Response({"error": f"Weather service error: {str(e)}"}, status=500)
+
+
+@api_view(['GET'])
+@deadline.bounded
+def get_nigeria_crop_matrix(request):
+    """
+    All Nigerian states x all crops suitability scores. Poll with
+    If-None-Match: unchanged matrices get an empty 304.
+    """
     try:
-        weather = fetch_weather(lat, lon)
-
-        # Generate crop recommendations
-        recommendations = [
-            score_crop(crop_name, weather)
-            for crop_name in CROP_DATABASE.keys()
-        ]
-        recommendations.sort(key=lambda x: x['score'], reverse=True)
-        top_crops = recommendations[:5]
-
-        alerts = generate_alerts(weather)
-
-        response_data = {
-            "location": {
-                "continent": continent,
-                "country": country.replace(" - ", " "),  # Clean display name
-                "lat": lat,
-                "lon": lon
-            },
-            "weather": weather,
-            "recommended_crops": top_crops,
-            "alerts": alerts
-        }
-
-        serializer = WeatherWithCropsSerializer(response_data)
-        return Response(serializer.data)
+        body, etag, entries = nigeria_crop_matrix()
+        # The matrix ETag also covers the month and the crop list
+        validators = conditional.for_entries(request, entries, vary=[etag])
+        not_modified = conditional.not_modified(request, validators)
+        if not_modified is not None:
+            return not_modified
+        return Response(body, headers=validators.headers())
 
+    except UpstreamUnavailable as e:
+        return Response({"error": str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
     except Exception as e:
-        return Response({"error": f"Weather service error: {str(e)}"}, status=500)
\ No newline at end of file
+        return Response({"error": f"Weather service error: {str(e)}"}, status=500)
+
+
+def prometheus_metrics(request):
+    """
+    Prometheus scrape target: this worker's latency histograms (see
+    weather.timing) plus the shared cache, quota and circuit counters.
+    """
+    endpoints = [circuit.endpoint_name(url) for url in (BASE_URL, AGRI_URL)]
+    events = ('opened', 'rejected', 'closed')
+    counters = metrics.get_many([
+        'weather_cache_hit', 'weather_cache_stale', 'weather_cache_miss', 'weather_fetch_executed',
+        'weather_fetch_coalesced_local', 'weather_fetch_coalesced_remote', 'weather_agriculture_fallback',
+        'weather_agriculture_skipped', 'upstream_hedged', 'upstream_hedge_won',
+        *(f"circuit_{name}_{event}" for name in endpoints for event in events),
+    ])
+    q = quota.status()
+    lines = [line for histogram in timing.HISTOGRAMS for line in histogram.exposition()]
+    lines += timing.exposition_lines('weather_cache_lookups_total', 'Weather cache lookups by result.', 'counter', [
+        ({'result': result}, counters[f'weather_cache_{result}']) for result in ('hit', 'stale', 'miss')
+    ])
+    lines += timing.exposition_lines('weather_fetches_total', 'Cache misses by how they were filled.', 'counter', [
+        ({'kind': kind}, counters[f'weather_fetch_{kind}'])
+        for kind in ('executed', 'coalesced_local', 'coalesced_remote')
+    ])
+    lines += timing.exposition_lines(
+        'weather_agriculture_fallbacks_total', 'Fetches served without agriculture data.', 'counter',
+        [({}, counters['weather_agriculture_fallback'])],
+    )
+    lines += timing.exposition_lines(
+        'weather_agriculture_skipped_total', 'Agriculture calls skipped for lack of time before the deadline.',
+        'counter', [({}, counters['weather_agriculture_skipped'])],
+    )
+    lines += timing.exposition_lines('stormglass_hedged_calls_total', 'Hedged Stormglass calls.', 'counter', [
+        ({'result': 'sent'}, counters['upstream_hedged']),
+        ({'result': 'won'}, counters['upstream_hedge_won']),
+    ])
+    lines += timing.exposition_lines('stormglass_calls_total', 'Stormglass calls made or refused.', 'counter', [
+        ({'result': 'made'}, q['upstream_calls']),
+        ({'result': 'rejected_daily'}, q['rejected_daily']),
+        ({'result': 'rejected_rate'}, q['rejected_rate']),
+        ({'result': 'rejected_unavailable'}, q['rejected_unavailable']),
+    ])
+    if q['daily_quota']:
+        lines += timing.exposition_lines('stormglass_quota_remaining', 'Stormglass calls left today.', 'gauge',
+                                         [({}, q['remaining_today'])])
+    lines += timing.exposition_lines('stormglass_circuit_events_total', 'Circuit breaker events.', 'counter', [
+        ({'endpoint': name, 'event': event}, counters[f"circuit_{name}_{event}"])
+        for name in endpoints for event in events
+    ])
+    lines += timing.exposition_lines('stormglass_circuit_open', 'Whether this worker\'s breaker is open.', 'gauge', [
+        ({'endpoint': name}, int(state['state'] == circuit.OPEN)) for name, state in circuit.status().items()
+    ])
+    return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+def get_upstream_quota(request):
+    """Remaining Stormglass budget, rejected-call counters and this worker's circuit breakers."""
+    return Response({**quota.status(), 'circuits': circuit.status()})
+
+
+def _parse_moment(raw, name):
+    """ISO date or datetime query value as an aware UTC datetime."""
+    moment = parse_datetime(raw)
+    if moment is None:
+        day = parse_date(raw)
+        if day is None:
+            raise ValueError(f"{name} must be an ISO date or datetime")
+        moment = datetime.combine(day, time.min)
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment, dt_timezone.utc)
+
+
+def parse_history_range(request):
+    """`?start=` and `?end=` (ISO dates/datetimes); defaults to the last 7 days."""
+    end = _parse_moment(request.GET['end'], 'end') if 'end' in request.GET else timezone.now()
+    start = _parse_moment(request.GET['start'], 'start') if 'start' in request.GET else end - timedelta(days=7)
+    if start >= end:
+        raise ValueError("start must be before end")
+    if end - start > timedelta(days=settings.WEATHER_HISTORY_MAX_DAYS):
+        raise ValueError(f"At most {settings.WEATHER_HISTORY_MAX_DAYS} days per request")
+    return start, end
+
+
+@api_view(['GET'])
+def get_weather_history(request):
+    """
+    Stored weather for a location from our observation store (no upstream
+    calls). Query: `location` (country/state name) or `lat` and `lon`;
+    optional `start`, `end` and `resolution` (hourly, daily).
+    """
+    try:
+        if 'location' in request.GET:
+            location = _resolve_batch_item(request.GET['location'])
+        else:
+            location = _resolve_batch_item({'lat': request.GET.get('lat'), 'lon': request.GET.get('lon')})
+        start, end = parse_history_range(request)
+        resolution = request.GET.get('resolution', 'hourly')
+        lat, lon = observations.stored_cell(location['lat'], location['lon'])
+        rows = observations.history(lat, lon, start, end, resolution)
+    except ValueError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    serializer = DailyHistorySerializer if resolution == 'daily' else ObservationSerializer
+    return Response({
+        "location": location,
+        "cell": {"lat": lat, "lon": lon},
+        "start": start,
+        "end": end,
+        "resolution": resolution,
+        "data": serializer(rows, many=True).data,
+    })
@@ -15,6 +15,54 @@ from dotenv import load_dotenv
 import os
 load_dotenv()
 STORMGLASS_API_KEY = os.getenv('STORMGLASS_API_KEY')
+# Point at a stub upstream for load tests (see benchmarks/stub_upstream.py)
+STORMGLASS_BASE_URL = os.getenv('STORMGLASS_BASE_URL', 'https://api.stormglass.io/v2').rstrip('/')
+
+# Upstream HTTP client (keep-alive pool, timeouts, retry with backoff)
+STORMGLASS_CONNECT_TIMEOUT = float(os.getenv('STORMGLASS_CONNECT_TIMEOUT', 3.05))
+STORMGLASS_READ_TIMEOUT = float(os.getenv('STORMGLASS_READ_TIMEOUT', 10))
+STORMGLASS_MAX_RETRIES = int(os.getenv('STORMGLASS_MAX_RETRIES', 2))
+STORMGLASS_RETRY_BACKOFF = float(os.getenv('STORMGLASS_RETRY_BACKOFF', 0.5))
+STORMGLASS_POOL_SIZE = int(os.getenv('STORMGLASS_POOL_SIZE', 20))
+STORMGLASS_ASYNC_POOL_SIZE = int(os.getenv('STORMGLASS_ASYNC_POOL_SIZE', 200))  # async views, per process
+
+# Upstream quota (shared across workers, see weather.quota). Opt-in: set
+# DAILY_QUOTA to your plan's daily calls; 0 (the default) disables it. BURST
+# caps calls in quick succession, so keep it above one cold /api/weather/all/
+# fan-out (a weather and an agriculture call per location: 84 today).
+# Background work may not use the last USER_RESERVE share of the day; cache
+# TTLs stretch up to MAX_TTL_MULTIPLIER as the remaining share drops below
+# LOW_WATERMARK.
+STORMGLASS_DAILY_QUOTA = int(os.getenv('STORMGLASS_DAILY_QUOTA', 0))
+STORMGLASS_BURST = int(os.getenv('STORMGLASS_BURST', 100))
+STORMGLASS_QUOTA_USER_RESERVE = float(os.getenv('STORMGLASS_QUOTA_USER_RESERVE', 0.2))
+STORMGLASS_QUOTA_LOW_WATERMARK = float(os.getenv('STORMGLASS_QUOTA_LOW_WATERMARK', 0.25))
+STORMGLASS_QUOTA_MAX_TTL_MULTIPLIER = float(os.getenv('STORMGLASS_QUOTA_MAX_TTL_MULTIPLIER', 4))
+
+# Per-endpoint circuit breakers (weather, agriculture). Over the last WINDOW
+# seconds, once MIN_CALLS were made, the circuit opens when ERROR_RATE of them
+# failed or SLOW_RATE took SLOW_CALL seconds or more; it then fails fast for
+# OPEN_SECONDS before letting a single probe through.
+STORMGLASS_BREAKER_WINDOW = float(os.getenv('STORMGLASS_BREAKER_WINDOW', 60))
+STORMGLASS_BREAKER_MIN_CALLS = int(os.getenv('STORMGLASS_BREAKER_MIN_CALLS', 5))
+STORMGLASS_BREAKER_ERROR_RATE = float(os.getenv('STORMGLASS_BREAKER_ERROR_RATE', 0.5))
+STORMGLASS_BREAKER_SLOW_CALL = float(os.getenv('STORMGLASS_BREAKER_SLOW_CALL', 5))
+STORMGLASS_BREAKER_SLOW_RATE = float(os.getenv('STORMGLASS_BREAKER_SLOW_RATE', 0.8))
+STORMGLASS_BREAKER_OPEN_SECONDS = float(os.getenv('STORMGLASS_BREAKER_OPEN_SECONDS', 30))
+
+# Hedged requests: a weather call that hasn't answered within the endpoint's
+# recent HEDGE_PERCENTILE latency (once MIN_SAMPLES calls were timed, and at
+# least MIN_DELAY seconds) gets an identical second call; the first good
+# response wins. Hedges count against the quota at background priority.
+STORMGLASS_HEDGE = os.getenv('STORMGLASS_HEDGE', 'true').lower() == 'true'
+STORMGLASS_HEDGE_PERCENTILE = float(os.getenv('STORMGLASS_HEDGE_PERCENTILE', 0.9))
+STORMGLASS_HEDGE_MIN_SAMPLES = int(os.getenv('STORMGLASS_HEDGE_MIN_SAMPLES', 20))
+STORMGLASS_HEDGE_MIN_DELAY = float(os.getenv('STORMGLASS_HEDGE_MIN_DELAY', 0.05))
+
+# How long a single-location request may wait on upstream work before it
+# fails with 503 (weather.deadline); the agriculture call is skipped when it
+# can't be expected to finish in the time left.
+WEATHER_REQUEST_DEADLINE = float(os.getenv('WEATHER_REQUEST_DEADLINE', 8))
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -53,13 +101,89 @@ REST_FRAMEWORK = {
     'DEFAULT_PAGINATION_CLASS': None,
 }
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Shared cache so all workers see the same entries and they survive deploys.
+# WEATHER_CACHE_BACKEND: "file" (default, no extra services; workers must
+# share a host), "db" (run `python manage.py createcachetable` once) or
+# "locmem" (per-process). The cache only holds weather entries and rendered
+# data: what workers must agree on (single-flight locks, the upstream quota,
+# the refresh throttle, metrics counters) uses atomic updates in DATABASES
+# (weather.coordination), as cache.add/incr aren't atomic on the file and DB
+# backends. Every backend is therefore safe; run all workers against one
+# database.
+WEATHER_CACHE_BACKEND = os.getenv('WEATHER_CACHE_BACKEND', 'file')
+
+if WEATHER_CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'weather_cache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+elif WEATHER_CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('WEATHER_CACHE_DIR', str(BASE_DIR / '.cache' / 'weather')),
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
     }
-}
+
+# Weather cache: entries are fresh for FRESH_TTL, then served stale (with a
+# background refresh) for another STALE_TTL before they expire
+WEATHER_CACHE_FRESH_TTL = int(os.getenv('WEATHER_CACHE_FRESH_TTL', 1800))  # 30 mins
+WEATHER_CACHE_STALE_TTL = int(os.getenv('WEATHER_CACHE_STALE_TTL', 6 * 3600))
+WEATHER_REFRESH_RETRY_INTERVAL = int(os.getenv('WEATHER_REFRESH_RETRY_INTERVAL', 60))
+# Days of hourly forecast requested per fetch (same upstream cost as one day)
+WEATHER_FORECAST_DAYS = int(os.getenv('WEATHER_FORECAST_DAYS', 7))
+
+# Observation store: every fetched hourly series is also saved to the
+# database (weather.Observation) for /api/weather/history/
+WEATHER_STORE_OBSERVATIONS = os.getenv('WEATHER_STORE_OBSERVATIONS', 'true').lower() == 'true'
+WEATHER_OBSERVATION_BATCH_SIZE = int(os.getenv('WEATHER_OBSERVATION_BATCH_SIZE', 500))
+WEATHER_HISTORY_MAX_DAYS = int(os.getenv('WEATHER_HISTORY_MAX_DAYS', 366))
+
+# Coordinates are snapped to a grid of this many degrees before fetching and
+# caching (0.125° ≈ 14 km, the resolution of the global models Stormglass
+# blends). History lookups use the stored cell within WEATHER_CELL_TOLERANCE
+# degrees of a point. Set either to 0 to disable.
+WEATHER_GRID_RESOLUTION = float(os.getenv('WEATHER_GRID_RESOLUTION', 0.125))
+WEATHER_CELL_TOLERANCE = float(os.getenv('WEATHER_CELL_TOLERANCE', 0.1))
+
+# Cache warmer (python manage.py warm_weather_cache [--loop])
+WEATHER_WARM_INTERVAL = int(os.getenv('WEATHER_WARM_INTERVAL', 900))  # seconds between runs
+WEATHER_WARM_RATE = float(os.getenv('WEATHER_WARM_RATE', 2))  # locations per second
+WEATHER_WARM_MAX_CALLS = int(os.getenv('WEATHER_WARM_MAX_CALLS', 200))  # upstream calls per run
+WEATHER_WARM_REFRESH_MARGIN = int(os.getenv('WEATHER_WARM_REFRESH_MARGIN', 300))
+
+# Weather sources (see weather.providers): registered names in order of
+# preference, e.g. "stormglass,local". With several, STRATEGY is fallback
+# (next on failure), hedge (also after HEDGE_AFTER seconds) or race (all at
+# once); the first good answer wins.
+WEATHER_PROVIDERS = [p.strip() for p in os.getenv('WEATHER_PROVIDERS', 'stormglass').split(',') if p.strip()]
+WEATHER_PROVIDER_STRATEGY = os.getenv('WEATHER_PROVIDER_STRATEGY', 'fallback')
+WEATHER_PROVIDER_HEDGE_AFTER = float(os.getenv('WEATHER_PROVIDER_HEDGE_AFTER', 2))
+WEATHER_LOCAL_MAX_AGE = int(os.getenv('WEATHER_LOCAL_MAX_AGE', 6 * 3600))  # oldest stored series "local" serves
+# Payloads replayed by "recorded" (e.g. benchmarks/fixtures after stub_upstream.py record); required to use it
+WEATHER_RECORDED_DIR = os.getenv('WEATHER_RECORDED_DIR') or None
+
+# Concurrent fan-out for multi-location endpoints (e.g. /api/weather/all/)
+WEATHER_FANOUT_MAX_WORKERS = int(os.getenv('WEATHER_FANOUT_MAX_WORKERS', 8))  # concurrent fetches per request
+WEATHER_FANOUT_POOL_SIZE = int(os.getenv('WEATHER_FANOUT_POOL_SIZE', 32))  # fetch threads per process
+WEATHER_FANOUT_DEADLINE = float(os.getenv('WEATHER_FANOUT_DEADLINE', 20))  # seconds per request
+WEATHER_ASYNC_MAX_CONCURRENCY = int(os.getenv('WEATHER_ASYNC_MAX_CONCURRENCY', 64))  # async /all/ fan-out
+WEATHER_BATCH_MAX_SIZE = int(os.getenv('WEATHER_BATCH_MAX_SIZE', 50))  # locations per /api/weather/batch/ call
+LOCATION_SEARCH_MAX_RESULTS = int(os.getenv('LOCATION_SEARCH_MAX_RESULTS', 200))  # /api/locations/nearest/ and /within/
+WEATHER_RENDER_CACHE_SIZE = int(os.getenv('WEATHER_RENDER_CACHE_SIZE', 512))  # rendered bodies kept per worker (weather.fastjson)
 
 MIDDLEWARE = [
+    "weather.timing.ServerTimingMiddleware",  # first, so its total covers the others
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -135,3 +259,18 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = "static/"
+
+
+# Operational events (circuits opening, failed background refreshes and
+# writes, upstream fallbacks) are logged under "weather.*"; they go to
+# stderr, where gunicorn/uvicorn collect them.
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'weather': {'handlers': ['console'], 'level': os.getenv('WEATHER_LOG_LEVEL', 'INFO')},
+    },
+}
@@ -18,8 +18,14 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 
+from weather.views import prometheus_metrics
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", prometheus_metrics, name="metrics"),  # Prometheus scrape target
     path("api/", include("weather.urls")),
     path('api/locations/', include('locations.urls')),
+    # Async (ASGI) variants of the upstream-bound endpoints
+    path("api/async/", include("weather.async_urls")),
+    path('api/async/locations/', include('locations.async_urls')),
 ]